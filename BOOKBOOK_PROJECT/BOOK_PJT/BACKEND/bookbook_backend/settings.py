@@ -24,6 +24,146 @@ load_dotenv(os.path.join(BASE_DIR, '.env'))
 # GMS_KEY가 설정되지 않은 경우 오류를 방지하기 위해 빈 문자열로 초기화
 GMS_KEY = os.environ.get('GMS_KEY', '')
 
+# GMS 엔드포인트 (끝에 '/' 포함). 로컬 가짜 서버(python manage.py fake_gms)로 부하 테스트할 때는
+# GMS_API_BASE=http://127.0.0.1:9100/gmsapi/ 처럼 바꿔서 실행합니다.
+GMS_API_BASE = os.environ.get('GMS_API_BASE', 'https://gms.ssafy.io/gmsapi/')
+
+# 도서 임베딩 바이너리 저장 형식 ('float32' 기본, 용량을 절반으로 줄이려면 'float16')
+EMBEDDING_STORAGE_DTYPE = os.environ.get('EMBEDDING_STORAGE_DTYPE', 'float32')
+
+# 메모리 인덱스 압축 방식: None(float32 그대로) 또는 'int8'(약 1/4 크기, 상위 후보만 원본 벡터로 재채점)
+# - QUANTIZED_RERANK_FACTOR: int8 모드에서 k개를 찾을 때 원본 벡터로 다시 채점할 후보 수 = k x 이 값
+EMBEDDING_INDEX_QUANTIZATION = os.environ.get('EMBEDDING_INDEX_QUANTIZATION') or None
+QUANTIZED_RERANK_FACTOR = 5
+
+# 근사 최근접 이웃(ANN, IVF) 인덱스 설정
+# - 도서 수가 ANN_MIN_CATALOG_SIZE 이상이고 build_ann_index로 만든 인덱스가 있으면 완전 탐색 대신 사용합니다.
+# - ANN_NPROBE: 검색할 리스트 수 (클수록 recall↑, 지연 시간↑)
+ANN_INDEX_DIR = BASE_DIR / 'ann_index'
+ANN_ENABLED = True
+ANN_MIN_CATALOG_SIZE = 50000
+ANN_NPROBE = 8
+
+# 미리 계산해 두는 유사 도서 목록 (build_similar_books)
+# - SIMILAR_BOOKS_BLOCK_SIZE: 한 번에 계산하는 도서 수 (점수 행렬 메모리 = 블록 크기 x 전체 도서 수)
+SIMILAR_BOOKS_TOP_N = 20
+SIMILAR_BOOKS_BLOCK_SIZE = 256
+
+# 일괄 유사 도서 API(POST books/recommendations/batch/)에서 한 번에 받을 수 있는 최대 기준 도서 수
+BATCH_RECOMMENDATION_MAX_SOURCES = 100
+
+# 임베딩 API 결과 캐시 (EmbeddingCache 테이블) 최대 항목 수. 넘으면 오래 안 쓴 항목부터 삭제합니다.
+EMBEDDING_CACHE_MAX_ENTRIES = 50000
+
+# LLM 응답 캐시 (LLMResponseCache 테이블)
+# - LLM_CACHE_TTL: 호출 위치(call_site)별 유지 시간(초). None이면 만료 없음 (크기 제한에 의한 LRU 삭제만 적용)
+LLM_CACHE_MAX_ENTRIES = 5000
+LLM_CACHE_TTL = {
+    'default': 60 * 60,
+    'bestseller': 6 * 60 * 60,
+    'personalized': 24 * 60 * 60,
+    'recommendation': 10 * 60,
+    'recommendation_reason': 24 * 60 * 60,
+}
+
+# LLM 프롬프트 크기 (books/prompting.py)
+# - LLM_PROMPT_TOKEN_BUDGET: 호출 위치별로 프롬프트의 가변 부분(후보 도서 표, 도서 소개)에 쓸 최대 토큰 수
+# - LLM_PROMPT_TITLE_MAX_CHARS: 후보 표에 넣을 도서 제목의 최대 글자 수 (부제는 뗌)
+LLM_PROMPT_TOKEN_BUDGET = {
+    'default': 2000,
+    'bestseller': 8000,                      # 200권 표가 대부분 그대로 들어가는 크기
+    'recommendation': 1000,
+    'docent': 600,
+}
+LLM_PROMPT_TITLE_MAX_CHARS = 40
+
+# 도슨트 스트리밍(?stream=1)에서 TTS로 보낼 최소 문장 길이. 더 짧은 문장은 다음 문장과 합쳐서 보냅니다.
+DOCENT_STREAM_MIN_SENTENCE_CHARS = 20
+
+# prepare_docents 명령: 베스트셀러와 함께 도슨트를 미리 만들어 둘 인기 도서 수 (댓글 + 서재 담기 수 기준)
+DOCENT_PREPARE_POPULAR_BOOKS = 100
+
+# TTS 음성 디스크 캐시 (books/tts_cache.py, cleanup_tts_cache 명령)
+# - TTS_CACHE_MAX_BYTES: 전체 크기 상한. 넘으면 오래 안 쓴 파일부터 삭제합니다.
+# - TTS_CACHE_PRUNE_INTERVAL: 새 파일을 이만큼 저장할 때마다 크기를 확인합니다. (디렉터리 전체를 훑으므로 매번 하지 않음)
+# - TTS_CACHE_CLIENT_MAX_AGE: 응답의 Cache-Control max-age(초)
+TTS_CACHE_DIR = BASE_DIR / 'tts_cache'
+TTS_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+TTS_CACHE_PRUNE_INTERVAL = 100
+TTS_CACHE_CLIENT_MAX_AGE = 7 * 24 * 60 * 60
+# 캐시 미스로 GMS 음성을 스트리밍할 때 받는 대로 캐시 파일에도 써서, 다시 들을 때 GMS를 호출하지 않게 할지 여부
+TTS_STREAM_WRITE_CACHE = True
+
+# 음성 댓글(STT) 업로드 (books/stt.py)
+# - STT_UPLOAD_MAX_BYTES: 업로드 크기 상한. 넘으면 더 받지 않고 413 (Whisper 자체 제한은 25MB)
+# - STT_MAX_DURATION_SECONDS: 음성 길이 상한(초). ffmpeg로 변환할 때 확인합니다.
+# - STT_TRANSCODE: ffmpeg가 있으면 모노/16kHz/Opus로 다시 인코딩해 보낼지 여부 (없으면 원본 전송)
+STT_UPLOAD_MAX_BYTES = 20 * 1024 * 1024
+STT_MAX_DURATION_SECONDS = 300
+STT_TRANSCODE = True
+STT_FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+STT_TRANSCODE_BITRATE = '24k'
+STT_TRANSCODE_TIMEOUT = 60
+
+# GMS 연결 풀 (books/http.py)
+# - GMS_HTTP_MAX_CONNECTIONS: 동기 뷰/명령어가 공유하는 풀 크기 (프로세스당)
+# - ASYNC_GMS_MAX_CONNECTIONS: 비동기 뷰(books/async_views.py)에서 동시에 열어 둘 최대 연결 수
+# - 타임아웃(초): 연결은 짧게, 읽기는 LLM 응답 시간을 고려해 넉넉하게
+# - GMS_HTTP2: h2 패키지가 설치되어 있을 때만 HTTP/2 사용
+GMS_HTTP_MAX_CONNECTIONS = 20
+ASYNC_GMS_MAX_CONNECTIONS = 200
+GMS_CONNECT_TIMEOUT = 5.0
+GMS_READ_TIMEOUT = 60.0
+GMS_KEEPALIVE_EXPIRY = 30.0
+GMS_HTTP2 = True
+
+# GMS 장애 대응 (books/resilience.py)
+# - GMS_DEADLINES: 재시도를 포함한 호출 한 번의 최대 시간(초). 스트리밍은 전체 스트림에 적용됩니다.
+# - GMS_RETRY_ATTEMPTS / GMS_RETRY_BACKOFF: 타임아웃/연결 오류/429/5xx만 재시도 (지터를 준 지수 백오프, 첫 대기 최대 초)
+# - CIRCUIT_BREAKER_*: 연속 실패가 이만큼 쌓이면 RECOVERY_TIMEOUT초 동안 호출하지 않고 바로 대체 응답으로 넘어갑니다.
+GMS_DEADLINES = {
+    'default': 20,
+    'chat': 30,
+    'embeddings': 10,
+    'tts': 20,
+    'stt': 30,
+}
+GMS_RETRY_ATTEMPTS = 2
+GMS_RETRY_BACKOFF = 0.5
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = 5
+CIRCUIT_BREAKER_RECOVERY_TIMEOUT = 30
+
+# 비싼 계산의 중복 실행 방지 (books/singleflight.py, 초 단위)
+# - SINGLE_FLIGHT_WAIT_TIMEOUT: 다른 요청의 계산 결과를 기다릴 최대 시간. 넘으면 직접 계산합니다.
+# - SINGLE_FLIGHT_LOCK_TTL: DB 잠금 유지 시간. 계산하던 프로세스가 죽어도 이 시간이 지나면 풀립니다.
+# - SINGLE_FLIGHT_POLL_INTERVAL: 다른 프로세스의 결과를 확인하는 간격
+# - SINGLE_FLIGHT_MAX_STALENESS: 이전 결과(스냅샷)를 대신 돌려줄 수 있는 최대 나이. 더 오래되었으면 기다리거나 직접 계산합니다. (None이면 제한 없음)
+SINGLE_FLIGHT_WAIT_TIMEOUT = 30
+SINGLE_FLIGHT_LOCK_TTL = 120
+SINGLE_FLIGHT_POLL_INTERVAL = 0.2
+SINGLE_FLIGHT_MAX_STALENESS = 24 * 60 * 60
+
+# 메인 화면 LLM 추천 프롬프트에 넣을 후보 도서 수 (좋아하는 도서/서재 기준 임베딩 검색 결과)
+RECOMMENDATION_CANDIDATE_COUNT = 20
+
+# 메인 화면 추천 사전 계산 (books/recommendation_queue.py, process_recommendation_jobs 명령)
+# - PRECOMPUTED_RECOMMENDATION_MAX_AGE: 이보다 오래된 결과는 그대로 응답하되 재계산 작업을 추가합니다. (초)
+# - RECOMMENDATION_JOB_MAX_ATTEMPTS: 실패한 작업을 다시 시도하는 최대 횟수
+# - RECOMMENDATION_JOB_RETRY_BACKOFF: 실패한 작업을 다시 꺼내기까지 기다리는 시간(초). 실패할 때마다 두 배로 늘어납니다.
+# - RECOMMENDATION_JOB_TIMEOUT: 이 시간(초)보다 오래 '실행 중'인 작업은 워커가 죽은 것으로 보고 다시 대기열에 넣습니다.
+# - RECOMMENDATION_JOB_RETENTION / RECOMMENDATION_FAILED_JOB_RETENTION: 끝난 작업을 워커가 지우기 전까지 남겨 두는 시간(초)
+#   (실패한 작업은 원인을 확인할 수 있도록 더 오래 남깁니다.)
+PRECOMPUTED_RECOMMENDATION_MAX_AGE = 24 * 60 * 60
+RECOMMENDATION_JOB_MAX_ATTEMPTS = 3
+RECOMMENDATION_JOB_RETRY_BACKOFF = 60
+RECOMMENDATION_JOB_TIMEOUT = 10 * 60
+RECOMMENDATION_JOB_RETENTION = 24 * 60 * 60
+RECOMMENDATION_FAILED_JOB_RETENTION = 7 * 24 * 60 * 60
+
+# 사용자 취향 벡터 가중치: 서재에 담긴 책 1권 = TASTE_LIBRARY_WEIGHT, 댓글 1개 = 평점/5 x TASTE_COMMENT_WEIGHT
+TASTE_LIBRARY_WEIGHT = 1.0
+TASTE_COMMENT_WEIGHT = 1.0
+
 
 
 # Quick-start development settings - unsuitable for production
@@ -0,0 +1,226 @@
+# books/ann.py
+
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+# 현재 버전 디렉터리 이름을 담은 파일 (build_ann_index가 원자적으로 교체)
+_POINTER = 'CURRENT'
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class IVFIndex:
+    """
+    IVF(Inverted File) 방식의 근사 최근접 이웃(ANN) 인덱스입니다.
+
+    - 학습(build): 구면 k-means로 nlist개의 중심(centroid)을 만들고, 각 벡터를 가장 가까운 중심의 리스트에 배정합니다.
+    - 검색(search): 쿼리와 가까운 nprobe개의 리스트만 정확히 채점합니다.
+      nprobe를 키우면 recall이 오르고 지연 시간이 늘어납니다. (nprobe == nlist 이면 완전 탐색과 동일)
+    """
+
+    def __init__(self, centroids, offsets, ids, vectors):
+        self.centroids = centroids  # (nlist, D) float32, 정규화됨
+        self.offsets = offsets      # (nlist + 1,) int64, 리스트 i는 vectors[offsets[i]:offsets[i+1]]
+        self.ids = ids              # (N,) int64, 리스트 순서로 정렬된 Book id
+        self.vectors = vectors      # (N, D) float32, 정규화됨, 리스트 순서로 정렬
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ----------------------- 학습 -----------------------
+    @classmethod
+    def build(cls, vectors, ids, nlist=None, n_iter=10, train_size=None, seed=0, block_size=65536):
+        vectors = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+        ids = np.asarray(ids, dtype=np.int64)
+        n = len(vectors)
+        if n == 0:
+            raise ValueError("인덱스를 만들 벡터가 없습니다.")
+
+        if nlist is None:
+            nlist = max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+
+        rng = np.random.default_rng(seed)
+        train_size = min(n, train_size or max(nlist * 40, 10000))
+        train = vectors[rng.choice(n, train_size, replace=False)]
+
+        # 구면 k-means (내적 = 코사인 유사도)
+        centroids = train[rng.choice(train_size, nlist, replace=False)].copy()
+        for _ in range(n_iter):
+            assign = np.argmax(train @ centroids.T, axis=1)
+            counts = np.bincount(assign, minlength=nlist)
+
+            # 같은 리스트끼리 모아 구간 합을 구합니다. (np.add.at보다 훨씬 빠름)
+            order = np.argsort(assign, kind='stable')
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            sums = np.zeros_like(centroids)
+            nonempty = counts > 0
+            sums[nonempty] = np.add.reduceat(train[order], starts[nonempty], axis=0)
+
+            # 비어 있는 리스트는 임의의 학습 벡터로 다시 시작합니다.
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = train[rng.choice(train_size, int(empty.sum()), replace=False)]
+            centroids = _normalize_rows(sums)
+
+        # 전체 벡터를 블록 단위로 리스트에 배정 (메모리 사용량 제한)
+        assign = np.empty(n, dtype=np.int64)
+        for start in range(0, n, block_size):
+            block = vectors[start:start + block_size]
+            assign[start:start + block_size] = np.argmax(block @ centroids.T, axis=1)
+
+        order = np.argsort(assign, kind='stable')
+        counts = np.bincount(assign, minlength=nlist)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        return cls(centroids.astype(np.float32), offsets, ids[order], vectors[order])
+
+    # ----------------------- 검색 -----------------------
+    def search(self, query, k=10, nprobe=None, exclude_ids=(), id_filter=None):
+        """
+        정규화된 쿼리 벡터와 가장 가까운 k개의 (book_id, score) 목록을 반환합니다.
+        id_filter(후보 id 배열 → bool 배열)를 주면 False인 후보는 제외합니다.
+        """
+        if len(self.ids) == 0 or k <= 0:
+            return []
+        nprobe = min(nprobe or settings.ANN_NPROBE, self.nlist)
+
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        # 리스트는 연속된 구간으로 저장되어 있으므로 구간별로 바로 채점합니다. (복사 없는 슬라이스)
+        ranges = [(self.offsets[i], self.offsets[i + 1]) for i in probe]
+        candidate_ids = np.concatenate([self.ids[s:e] for s, e in ranges])
+        if len(candidate_ids) == 0:
+            return []
+        scores = np.concatenate([self.vectors[s:e] @ query for s, e in ranges])
+        if exclude_ids:
+            scores[np.isin(candidate_ids, list(exclude_ids))] = -np.inf
+        if id_filter is not None:
+            scores[~id_filter(candidate_ids)] = -np.inf
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (int(candidate_ids[i]), float(scores[i]))
+            for i in top
+            if np.isfinite(scores[i])
+        ]
+
+    # ----------------------- 저장 / 로딩 -----------------------
+    def save(self, path, keep=2):
+        """
+        path 아래의 새 버전 디렉터리(v<시각>)에 .npy 파일로 저장한 뒤, 현재 버전을 가리키는 CURRENT 파일을
+        os.replace로 한 번에 바꿉니다. 읽는 쪽은 항상 CURRENT가 가리키는 완성된 한 빌드의 파일만 보며,
+        저장 도중에도 이전 버전 디렉터리는 그대로 남아 있습니다. (최근 keep개 버전만 남기고 정리)
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        version = f'v{time.time_ns()}'
+        tmp_path = path / f'{version}.tmp'
+        tmp_path.mkdir()
+
+        np.save(tmp_path / 'centroids.npy', self.centroids)
+        np.save(tmp_path / 'offsets.npy', self.offsets)
+        np.save(tmp_path / 'ids.npy', self.ids)
+        np.save(tmp_path / 'vectors.npy', self.vectors)
+        with open(tmp_path / 'meta.json', 'w', encoding='utf-8') as f:
+            json.dump({'nlist': self.nlist, 'size': len(self.ids), 'dim': int(self.vectors.shape[1])}, f)
+        os.replace(tmp_path, path / version)  # 새 이름이므로 읽는 쪽에 영향 없음
+
+        pointer_tmp = path / f'{_POINTER}.tmp'
+        pointer_tmp.write_text(version, encoding='utf-8')
+        os.replace(pointer_tmp, path / _POINTER)
+
+        # 방금 이전 버전을 읽기 시작한 프로세스가 있을 수 있으므로 바로 직전 버전까지는 남겨 둡니다.
+        versions = sorted(p.name for p in path.iterdir() if p.is_dir() and p.name.startswith('v'))
+        for name in versions[:-keep]:
+            shutil.rmtree(path / name, ignore_errors=True)
+        return version
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        저장된 인덱스 버전 디렉터리를 읽습니다. mmap=True면 벡터는 필요할 때 디스크에서 페이지 단위로 읽힙니다.
+        파일끼리 크기가 맞지 않으면 ValueError를 올립니다.
+        """
+        path = Path(path)
+        mode = 'r' if mmap else None
+        index = cls(
+            centroids=np.load(path / 'centroids.npy'),
+            offsets=np.load(path / 'offsets.npy'),
+            ids=np.load(path / 'ids.npy'),
+            vectors=np.load(path / 'vectors.npy', mmap_mode=mode),
+        )
+        if (
+            len(index.offsets) != index.nlist + 1
+            or index.offsets[-1] != len(index.ids)
+            or len(index.vectors) != len(index.ids)
+            or index.centroids.shape[1] != index.vectors.shape[1]
+        ):
+            raise ValueError(f"ANN 인덱스 파일이 서로 맞지 않습니다: {path}")
+        return index
+
+
+def current_version(path):
+    """path의 CURRENT 파일이 가리키는 버전 디렉터리 경로. 인덱스가 없으면 None"""
+    path = Path(path)
+    try:
+        version = (path / _POINTER).read_text(encoding='utf-8').strip()
+    except FileNotFoundError:
+        return None
+    return path / version if version else None
+
+
+# ----------------------- 프로세스 단위 인덱스 캐시 -----------------------
+_ann_lock = threading.Lock()
+_ann_index = None
+_ann_key = None
+
+
+def get_ann_index():
+    """
+    디스크에 저장된 ANN 인덱스를 읽어 프로세스 안에서 재사용합니다.
+    build_ann_index 명령으로 다시 만들어지면(CURRENT 교체) 자동으로 새로 읽습니다.
+    인덱스가 없거나 읽지 못하면 None을 반환하고, 호출하는 쪽은 완전 탐색을 사용합니다.
+    (읽기에 실패한 버전은 CURRENT가 다시 바뀔 때까지 다시 시도하지 않습니다.)
+    """
+    global _ann_index, _ann_key
+    pointer_path = Path(settings.ANN_INDEX_DIR) / _POINTER
+    try:
+        stat = pointer_path.stat()
+    except FileNotFoundError:
+        return None
+    # os.replace로 바뀌면 inode가 달라지므로 mtime 해상도와 관계없이 교체를 알아챕니다.
+    key = (stat.st_ino, stat.st_mtime_ns)
+
+    if key == _ann_key:
+        return _ann_index
+
+    with _ann_lock:
+        if key != _ann_key:
+            try:
+                version_path = current_version(settings.ANN_INDEX_DIR)
+                _ann_index = IVFIndex.load(version_path) if version_path else None
+            except (OSError, ValueError) as e:
+                print(f"ANN 인덱스 로딩 실패, 완전 탐색 사용: {str(e)}")
+                _ann_index = None
+            _ann_key = key
+    return _ann_index
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BooksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'books'
+
+    def ready(self):
+        # 임베딩 변경 시 메모리 인덱스 갱신을 위한 시그널 등록
+        from . import signals  # noqa: F401
@@ -0,0 +1,150 @@
+# books/async_clients.py
+
+import asyncio
+import weakref
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from openai import AsyncOpenAI
+
+from . import llm_cache, prompting, resilience
+from .http import GMS_OPENAI_BASE_URL, client_options
+from .utils import DEFAULT_LLM_SYSTEM_MESSAGE, LLM_MODEL, tts_payload
+
+# 이벤트 루프마다 클라이언트를 하나씩 만들어 재사용합니다.
+# (httpx.AsyncClient는 만들어진 루프에서만 사용할 수 있으므로 루프를 키로 사용)
+# WSGI에서 async 뷰를 실행하면 asgiref가 요청마다 asyncio.run()으로 새 루프를 만들므로,
+# 루프가 끝날 때 클라이언트를 닫아 연결이 남지 않도록 합니다. (_close_on_loop_shutdown)
+_http_clients = weakref.WeakKeyDictionary()
+_openai_clients = weakref.WeakKeyDictionary()
+_closers = weakref.WeakKeyDictionary()
+
+
+async def _close_on_loop_shutdown(client):
+    """
+    루프가 종료될 때 클라이언트를 닫는 비동기 제너레이터입니다.
+    루프는 시작된 비동기 제너레이터를 기억해 두었다가 종료 직전(shutdown_asyncgens)에 aclose()하므로 finally가 실행됩니다.
+    (asyncio.run(), uvicorn 모두 루프를 닫기 전에 shutdown_asyncgens를 호출합니다.)
+    """
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+def _register_close(loop, client):
+    closer = _close_on_loop_shutdown(client)
+    try:
+        # 첫 asend()에서 현재 루프에 등록되고 yield까지 바로 실행됩니다. (기다리는 작업이 없어 즉시 끝남)
+        closer.asend(None).send(None)
+    except StopIteration:
+        pass
+    # 루프는 제너레이터를 약한 참조로만 들고 있으므로 루프가 살아 있는 동안 여기서 붙잡아 둡니다.
+    _closers[loop] = closer
+
+
+def get_async_http_client():
+    """GMS 호출용 공유 httpx.AsyncClient (연결 풀 재사용, 설정은 books/http.py와 동일)"""
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(**client_options(settings.ASYNC_GMS_MAX_CONNECTIONS, is_async=True))
+        _http_clients[loop] = client
+        _register_close(loop, client)
+    return client
+
+
+def get_async_openai():
+    """공유 AsyncOpenAI 클라이언트. 내부적으로 get_async_http_client()와 같은 연결 풀을 씁니다."""
+    loop = asyncio.get_running_loop()
+    client = _openai_clients.get(loop)
+    if client is None:
+        client = AsyncOpenAI(
+            api_key=settings.GMS_KEY,
+            base_url=GMS_OPENAI_BASE_URL,
+            http_client=get_async_http_client(),
+            max_retries=0,
+        )
+        _openai_clients[loop] = client
+    return client
+
+
+async def async_get_llm_recommendation(prompt_message, call_site='default', system_message=None,
+                                       response_format='json_object', use_cache=True, raise_unavailable=False):
+    """
+    utils.get_llm_recommendation 의 비동기 버전입니다. 같은 LLM 응답 캐시를 공유합니다. (raise_unavailable도 같음)
+    업스트림 응답을 기다리는 동안 워커 스레드를 점유하지 않습니다.
+    """
+    system_message = system_message or DEFAULT_LLM_SYSTEM_MESSAGE
+    cache_key = llm_cache.make_key(LLM_MODEL, system_message, prompt_message, response_format)
+    if use_cache:
+        cached = await sync_to_async(llm_cache.get)(cache_key, call_site)
+        if cached is not None:
+            return cached
+
+    try:
+        options = {}
+        if response_format:
+            options['response_format'] = {"type": response_format}
+        response = await resilience.acall('chat', lambda timeout: get_async_openai().chat.completions.create(
+            model=LLM_MODEL,
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt_message}
+            ],
+            timeout=timeout,
+            **options
+        ))
+        prompting.record_response_usage(call_site, response, prompt_message)
+        content = response.choices[0].message.content
+        if use_cache and content:
+            await sync_to_async(llm_cache.set)(cache_key, content, LLM_MODEL, call_site)
+        return content
+
+    except resilience.GMSUnavailable as e:
+        if raise_unavailable:
+            raise
+        print(f"Error calling LLM API (async): {e}")
+        return None
+    except Exception as e:
+        print(f"Error calling LLM API (async): {e}")
+        return None
+
+
+async def async_open_text_to_speech(text, voice):
+    """utils.open_text_to_speech의 비동기 버전 (응답 헤더까지만 받은 httpx.Response)"""
+    client = get_async_http_client()
+
+    async def send(timeout):
+        request = client.build_request("POST", "/audio/speech", json=tts_payload(text, voice), timeout=timeout)
+        response = await client.send(request, stream=True)
+        if response.status_code != 200:
+            await response.aread()
+            await response.aclose()
+        return resilience.raise_for_transient_status(response)
+
+    try:
+        return await resilience.acall('tts', send)
+    except resilience.TransientHTTPError as e:
+        return e.response
+
+
+async def aiter_audio(response):
+    """async_open_text_to_speech()의 응답 본문을 받는 대로 내보내고, 끝나거나 중단되면 연결을 돌려놓습니다."""
+    try:
+        async for chunk in response.aiter_bytes():
+            yield chunk
+    finally:
+        await response.aclose()
+
+
+async def async_transcribe(name, audio, content_type):
+    """Whisper-1로 음성을 텍스트로 변환합니다. (audio: 바이트 또는 열린 파일)"""
+    transcription = await resilience.acall('stt', lambda timeout: get_async_openai().audio.transcriptions.create(
+        model="whisper-1",
+        file=(name, audio, content_type),
+        response_format="json",
+        timeout=timeout
+    ))
+    return transcription.text
@@ -0,0 +1,254 @@
+# books/async_views.py
+"""
+GMS(LLM/TTS/STT)를 호출하는 엔드포인트의 비동기 버전입니다.
+ASGI(uvicorn 등)로 실행하면 업스트림 응답을 기다리는 동안 워커를 점유하지 않으므로,
+한 프로세스가 수백 개의 GMS 호출을 동시에 기다리면서도 도서 목록 같은 가벼운 요청을 바로 처리할 수 있습니다.
+
+DRF 3.16의 APIView는 async 핸들러를 지원하지 않으므로 Django async 뷰로 작성하고,
+인증/파싱은 DRF의 Request를 그대로 사용해 기존 뷰와 같은 규칙을 따릅니다.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import exceptions, status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import docent, recommendation_queue, stt, tts_cache
+from .async_clients import aiter_audio, async_get_llm_recommendation, async_open_text_to_speech
+from .models import Book
+from .resilience import GMSUnavailable
+from .taste import build_fast_recommendations
+from .docent import VOICE_MAP
+from .views import RecommendationView
+
+
+def _json(data, status_code=status.HTTP_200_OK):
+    return JsonResponse(data, status=status_code, safe=False, json_dumps_params={'ensure_ascii': False})
+
+
+def _prepare(request, authentication_classes=None):
+    """
+    DRF Request로 감싸 인증 사용자와 본문을 미리 읽어 둡니다. (DB 접근이 있으므로 스레드에서 실행)
+    인증 정보가 잘못되었으면 AuthenticationFailed가 발생합니다.
+    """
+    authentication_classes = authentication_classes or api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    drf_request = Request(
+        request,
+        parsers=[JSONParser(), FormParser(), MultiPartParser()],
+        authenticators=[auth() for auth in authentication_classes],
+    )
+    drf_request.user  # 인증 수행
+    drf_request.data  # 본문 파싱
+    return drf_request
+
+
+async def _prepare_async(request, authentication_classes=None):
+    try:
+        return await sync_to_async(_prepare)(request, authentication_classes), None
+    except exceptions.APIException as e:
+        return None, _json({"detail": str(e.detail)}, e.status_code)
+
+
+@csrf_exempt
+@require_GET
+async def async_main_recommendations(request):
+    """
+    RecommendationView의 비동기 버전
+    URL: GET /api/books/async/main-recommendations/
+    """
+    drf_request, error = await _prepare_async(request, [TokenAuthentication])
+    if error:
+        return error
+    user = drf_request.user
+
+    if not user.is_authenticated:
+        data, status_code = await sync_to_async(RecommendationView.build_anonymous_result)()
+        return _json(data, status_code)
+
+    # ?mode=fast: LLM 호출 없이 취향 벡터로 바로 추천 (?reason=llm 이면 추천 이유만 LLM이 작성)
+    if request.GET.get('mode') == 'fast':
+        if request.GET.get('reason') == 'llm':
+            # 추천 이유 작성은 동기 LLM 호출이므로 공유 스레드를 막지 않도록 별도 스레드에서 실행합니다.
+            fast = await sync_to_async(build_fast_recommendations, thread_sensitive=False)(
+                user, k=2, with_llm_reason=True
+            )
+        else:
+            fast = await sync_to_async(build_fast_recommendations)(user, k=2)
+        if fast:
+            return _json(fast)
+
+    precomputed = await sync_to_async(recommendation_queue.get_precomputed)(user)
+    if precomputed:
+        return _json(precomputed)
+
+    prompt = await sync_to_async(RecommendationView.build_prompt)(user)
+    llm_response_json = await async_get_llm_recommendation(prompt, call_site='recommendation')
+    data, status_code = await sync_to_async(RecommendationView.build_llm_result)(llm_response_json)
+    if status_code == status.HTTP_200_OK:
+        await sync_to_async(recommendation_queue.save_result)(user, data)
+    else:
+        data, status_code = await sync_to_async(RecommendationView.build_fallback_result)(user)
+    return _json(data, status_code)
+
+
+async def _speech_response(text, voice):
+    """
+    views.speech_response의 비동기 버전. 캐시 미스면 GMS 음성을 받는 대로 흘려보내면서 캐시 파일에도 씁니다.
+    (ASGI에서 Django는 동기 이터레이터를 끝까지 모은 뒤 보내므로, 비동기 이터레이터를 넘겨야 실제로 스트리밍됩니다.)
+    """
+    cache_key = tts_cache.make_key(text, voice)
+    cached = await tts_cache.acached_response(cache_key)
+    if cached is not None:
+        return cached
+
+    upstream = await async_open_text_to_speech(text, voice)
+    if upstream.status_code != 200:
+        print(f"GMS ERROR: {upstream.status_code} - {upstream.text}")
+        return HttpResponse(upstream.content, status=upstream.status_code, content_type=upstream.headers.get('content-type'))
+
+    chunks = aiter_audio(upstream)
+    if settings.TTS_STREAM_WRITE_CACHE:
+        chunks = tts_cache.atee(cache_key, chunks)
+    response = StreamingHttpResponse(chunks, content_type="audio/mpeg")
+    if 'content-length' in upstream.headers:
+        response['Content-Length'] = upstream.headers['content-length']
+    tts_cache.set_headers(response, cache_key, 'miss')
+    return response
+
+
+@csrf_exempt
+@require_POST
+async def async_text_to_speech_view(request):
+    """
+    TextToSpeechView의 비동기 버전
+    URL: POST /api/books/async/tts/
+    """
+    drf_request, error = await _prepare_async(request)
+    if error:
+        return error
+    text = drf_request.data.get('text')
+    selected_voice = VOICE_MAP.get(drf_request.data.get('voice', 'voice1'), 'alloy')
+
+    if not text:
+        return _json({"detail": "텍스트가 없습니다."}, status.HTTP_400_BAD_REQUEST)
+
+    try:
+        return await _speech_response(text, selected_voice)
+    except GMSUnavailable as e:
+        print(f"GMS UNAVAILABLE: {str(e)}")
+        return _json({"detail": "음성 서비스가 일시적으로 원활하지 않습니다. 잠시 후 다시 시도해 주세요."},
+                     status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        print(f"SERVER ERROR: {str(e)}")
+        return _json({"detail": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@csrf_exempt
+@require_POST
+async def async_speech_to_text_view(request):
+    """
+    SpeechToTextView의 비동기 버전
+    URL: POST /api/books/async/transcribe/
+    """
+    stt.install_upload_handler(request)
+    drf_request, error = await _prepare_async(request)
+    if error:
+        return error
+    audio_file = drf_request.FILES.get('audio')
+    if stt.upload_too_large(request):
+        return _json({"error": f"오디오 파일은 {settings.STT_UPLOAD_MAX_BYTES // (1024 * 1024)}MB까지 올릴 수 있습니다."},
+                     status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    if audio_file is None:
+        return _json({"error": "오디오 파일이 필요합니다."}, status.HTTP_400_BAD_REQUEST)
+    try:
+        text = await stt.atranscribe_upload(audio_file)
+        return _json({"text": text})
+    except stt.AudioRejected as e:
+        return _json({"error": str(e)}, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    except GMSUnavailable as e:
+        print(f"STT UNAVAILABLE: {str(e)}")
+        return _json({"error": "음성 인식 서비스가 일시적으로 원활하지 않습니다. 잠시 후 다시 시도해 주세요."},
+                     status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        print(f"STT ERROR: {str(e)}")
+        return _json({"error": f"음성 변환 중 오류 발생: {str(e)}"}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+async def _docent_stream(book, voice):
+    """
+    BookDocentView.stream의 비동기 버전. 스크립트를 문장 단위로 TTS에 보내고 mp3를 받는 대로 흘려보냅니다.
+    첫 문장까지는 기다려서, 스크립트 생성이 실패하면 기존과 같은 오류 응답을 보냅니다. (GMS 장애면 GMSUnavailable)
+    """
+    sentences = docent.aprefetch(docent.asplit_sentences(docent.astream_script(book)))
+    first_sentence = await anext(sentences, None)
+    if not first_sentence:
+        await sentences.aclose()
+        return _json({"error": "요약 생성 실패"}, status.HTTP_400_BAD_REQUEST)
+
+    async def chained():
+        yield first_sentence
+        try:
+            async for sentence in sentences:
+                yield sentence
+        finally:
+            await sentences.aclose()
+
+    response = StreamingHttpResponse(docent.aspeak(chained(), voice), content_type="audio/mpeg")
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+@csrf_exempt
+@require_POST
+async def async_book_docent_view(request, pk):
+    """
+    BookDocentView의 비동기 버전 (로그인 필요)
+    URL: POST /api/books/async/<int:pk>/docent/
+    ?stream=1: 문장 단위로 합성한 mp3를 받는 대로 스트리밍합니다. (ASGI에서도 버퍼링 없이 전송)
+    """
+    drf_request, error = await _prepare_async(request)
+    if error:
+        return error
+    if not drf_request.user.is_authenticated:
+        return _json({"detail": str(exceptions.NotAuthenticated.default_detail)}, status.HTTP_401_UNAUTHORIZED)
+
+    book = await Book.objects.filter(pk=pk).afirst()
+    if book is None:
+        return _json({"detail": "No Book matches the given query."}, status.HTTP_404_NOT_FOUND)
+
+    voice_id = drf_request.data.get('voice', 'alloy')
+    selected_voice = VOICE_MAP.get(voice_id, voice_id)
+
+    try:
+        # prepare_docents 명령으로 미리 만들어 둔 음성이 있으면 LLM/TTS 없이 바로 보냅니다. (BookDocentView와 같은 순서)
+        summary_text = await sync_to_async(docent.cached_script)(book)
+        if summary_text:
+            prepared = await tts_cache.acached_response(tts_cache.make_key(summary_text, selected_voice))
+            if prepared is not None:
+                return prepared
+
+        if request.GET.get('stream') == '1':
+            return await _docent_stream(book, selected_voice)
+
+        # 저장된 스크립트가 없으면 동기 뷰와 같은 singleflight 경로로 만듭니다.
+        # (다른 요청이 만드는 동안 폴링하며 기다리므로 공유 스레드를 막지 않도록 별도 스레드에서 실행)
+        if not summary_text:
+            summary_text = await sync_to_async(docent.get_or_create_script, thread_sensitive=False)(book)
+        if not summary_text:
+            return _json({"error": "요약 생성 실패"}, status.HTTP_400_BAD_REQUEST)
+
+        return await _speech_response(summary_text, selected_voice)
+
+    except GMSUnavailable as e:
+        print(f"DOCENT UNAVAILABLE: {str(e)}")
+        return _json({"error": "도슨트 서비스가 일시적으로 원활하지 않습니다. 잠시 후 다시 시도해 주세요."},
+                     status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        print(f"DOCENT ERROR: {str(e)}")
+        return _json({"error": str(e)}, status.HTTP_400_BAD_REQUEST)
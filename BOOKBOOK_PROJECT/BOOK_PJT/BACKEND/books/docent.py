@@ -0,0 +1,388 @@
+# books/docent.py
+"""
+도슨트 스크립트/오디오 스트리밍 파이프라인입니다.
+
+LLM 스크립트 전체와 TTS mp3 전체를 기다린 뒤 응답하는 대신,
+    LLM 스트리밍 → 문장 단위로 자르기 → 문장마다 TTS 호출 → mp3 바이트를 바로 클라이언트로
+순서로 흘려보내므로, 첫 문장의 음성이 준비되는 즉시 재생이 시작됩니다.
+LLM 스크립트 생성은 백그라운드 스레드(prefetch)에서 계속 진행되어 TTS와 겹쳐서 실행됩니다.
+비동기 뷰(ASGI)는 같은 파이프라인의 비동기 버전(astream_script → asplit_sentences → aprefetch → aspeak)을 씁니다.
+(ASGI에서 Django는 동기 이터레이터를 끝까지 모은 뒤 보내므로 비동기 이터레이터여야 실제로 스트리밍됩니다.)
+
+인기 도서는 prepare_docents 명령으로 스크립트와 목소리별 전체 음성을 미리 만들어 두며(prepare),
+준비된 도서는 두 경로 모두 LLM/TTS를 기다리지 않고 디스크의 mp3를 바로 보냅니다. (prepared_response)
+"""
+
+import asyncio
+import hashlib
+import queue
+import re
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from . import prompting, resilience, singleflight, tts_cache
+from .async_clients import aiter_audio, async_open_text_to_speech, get_async_openai
+from .models import DocentScript
+from .utils import (DEFAULT_LLM_SYSTEM_MESSAGE, LLM_MODEL, get_client, get_llm_recommendation, iter_audio,
+                    open_text_to_speech, stream_text_to_speech)
+
+# 문장 끝: 마침표/물음표/느낌표/말줄임표(+닫는 따옴표/괄호) 뒤의 공백, 또는 줄바꿈
+_SENTENCE_BOUNDARY = re.compile(r'[.!?…]+["\'”’)]*\s+|\n+')
+
+_END = object()
+
+# build_docent_prompt()의 내용을 바꾸면 올립니다. 저장된 스크립트는 버전이 다르면 다시 만들어집니다.
+PROMPT_VERSION = 1
+
+
+# 프론트엔드 voice ID → OpenAI 실제 목소리 이름
+VOICE_MAP = {
+    'voice1': 'alloy',
+    'voice2': 'echo',
+    'voice3': 'shimmer',
+    'voice4': 'onyx'
+}
+
+
+def build_docent_prompt(book):
+    """도슨트 오디오 스크립트 생성 프롬프트"""
+    return f"""
+        당신은 '북북(BOOKBOOK)' 서비스의 전문 AI 도슨트입니다. 
+        아래 도서 정보를 바탕으로, 마치 갤러리에서 책을 소개하듯 다정하고 몰입감 있는 오디오 스크립트를 작성해 주세요.
+
+        [도서 정보]
+        - 제목: {book.title}
+        - 저자: {book.author}
+        - 내용: {prompting.truncate_to_tokens(book.description, prompting.budget_for('docent'))}
+
+        [작성 가이드라인]
+        1. 인사와 도입: "안녕하세요, 오늘 여러분께 소개해 드릴 책은..."으로 시작하여 책의 첫인상을 묘사해 주세요.
+        2. 핵심 요약: 책의 전체 내용을 요약하되, 딱딱한 나열이 아닌 이 책이 던지는 핵심 질문이나 감동 포인트를 중심으로 설명해 주세요. (3~4문장)
+        3. 마무리: "이 책의 마지막 페이지를 덮을 때쯤 여러분은 어떤 생각을 하게 될까요?"와 같이 독자의 호기심을 자극하며 마쳐주세요.
+        4. 어조: 반드시 '해요체'를 사용하여 부드럽고 따뜻하게 작성해 주세요. 전문 용어보다는 쉬운 단어를 사용하세요.
+        5. 주의사항: 오디오로 읽힐 글이므로 문장이 너무 길지 않아야 하며, 한글 위주로 작성해 주세요.
+
+        스크립트만 응답해 주세요.
+        """
+
+
+def description_hash(book):
+    """프롬프트에 들어가는 도서 정보(제목/저자/소개)의 sha256 (바뀌면 스크립트를 다시 만듭니다.)"""
+    raw = "\n".join([book.title or '', book.author or '', book.description or ''])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def cached_script(book):
+    """
+    저장된 도슨트 스크립트. 없거나 도서 정보/프롬프트 버전이 바뀌었으면 None (LLM을 호출하지 않음)
+    스트리밍/일반 경로, 동기/비동기 뷰, prepare_docents 명령이 모두 같은 스크립트를 사용합니다.
+    """
+    saved = DocentScript.objects.filter(book_id=book.pk).only('text', 'prompt_version', 'description_hash').first()
+    if saved is None or saved.prompt_version != PROMPT_VERSION or saved.description_hash != description_hash(book):
+        return None
+    return saved.text
+
+
+def save_script(book, text):
+    """새로 만든 도슨트 스크립트를 현재 프롬프트 버전/도서 소개 해시와 함께 저장합니다."""
+    DocentScript.objects.update_or_create(
+        book_id=book.pk,
+        defaults={'text': text, 'prompt_version': PROMPT_VERSION, 'description_hash': description_hash(book)},
+    )
+
+
+def generate_script(book):
+    """
+    저장된 도슨트 스크립트를 반환하고, 없거나 오래되었으면 LLM으로 만들어 저장합니다.
+    (실패하면 None, GMS 장애 중이면 GMSUnavailable - 뷰에서 503으로 응답)
+    """
+    script = cached_script(book)
+    if script:
+        return script
+    script = get_llm_recommendation(build_docent_prompt(book), call_site='docent', response_format=None,
+                                    use_cache=False, raise_unavailable=True)
+    if script:
+        script = script.strip()
+        save_script(book, script)
+    return script or None
+
+
+def get_or_create_script(book):
+    """
+    저장된 스크립트를 반환하고, 없으면 여러 요청이 동시에 LLM을 호출하지 않도록 한 요청만 만들게 합니다. (singleflight)
+    스크립트는 DocentScript에만 저장하고 singleflight는 잠금으로만 씁니다. 기다린 요청은 generate_script()가 저장된 스크립트를 읽습니다.
+    동기/비동기 도슨트 뷰가 함께 사용합니다. (실패하면 None, GMS 장애 중이면 GMSUnavailable)
+    """
+    return cached_script(book) or singleflight.run(f"docent:{book.pk}", lambda: generate_script(book), store=False)
+
+
+def prepared_response(book, voice):
+    """스크립트와 그 전체 음성이 모두 준비되어 있으면 디스크의 mp3를 그대로 보내는 응답. 아니면 None"""
+    script = cached_script(book)
+    if not script:
+        return None
+    return tts_cache.cached_response(tts_cache.make_key(script, voice))
+
+
+def prepare(book, voices, llm_limiter=None, tts_limiter=None):
+    """
+    도서 하나의 도슨트 스크립트(DocentScript)와 voices 목소리별 전체 음성을 미리 만들어 저장합니다. (prepare_docents 명령)
+    이미 있는 것은 건너뛰므로 중단된 뒤 다시 실행하면 남은 것만 만듭니다.
+    (스크립트 생성 여부, 새로 만든 음성 수)를 반환하며, 실패하면 예외를 올립니다.
+    """
+    script = cached_script(book)
+    generated = script is None
+    if generated:
+        if llm_limiter:
+            llm_limiter.acquire()
+        script = generate_script(book)
+        if not script:
+            raise RuntimeError("스크립트 생성 실패")
+
+    synthesized = 0
+    for voice in voices:
+        cache_key = tts_cache.make_key(script, voice)
+        if tts_cache.get(cache_key):  # 적중하면 LRU 순서도 갱신되어, 주기적으로 실행하면 크기 정리에서 밀려나지 않습니다.
+            continue
+        if tts_limiter:
+            tts_limiter.acquire()
+        upstream = open_text_to_speech(script, voice)
+        if upstream.status_code != 200:
+            raise RuntimeError(f"GMS TTS 오류 ({voice}): {upstream.status_code} - {upstream.text[:200]}")
+        # 메모리에 모으지 않고 받는 대로 캐시 파일에 씁니다.
+        for _ in tts_cache.tee(cache_key, iter_audio(upstream)):
+            pass
+        synthesized += 1
+    return generated, synthesized
+
+
+def stream_script(book, call_site='docent'):
+    """
+    도슨트 스크립트를 LLM에서 받는 대로 문자열 조각으로 내보냅니다.
+    저장된 스크립트(DocentScript)가 있으면 LLM을 호출하지 않고 그대로 내보내며, 새로 받은 스크립트는 끝까지 받은 뒤 저장합니다.
+    (오디오로 읽을 글이므로 JSON 응답 형식을 쓰지 않습니다.)
+    """
+    saved = cached_script(book)
+    if saved is not None:
+        yield saved
+        return
+
+    client = get_client()
+    if not client:
+        return
+
+    parts = []
+    # 스트리밍 도중에는 다시 시도할 수 없으므로 서킷 브레이커와 데드라인만 적용합니다.
+    with resilience.guard('chat') as timeout:
+        stream = client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=_script_messages(book),
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=timeout,
+        )
+        for chunk in stream:
+            if chunk.usage is not None:
+                prompting.record_usage(call_site, chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield parts[-1]
+
+    script = ''.join(parts).strip()
+    if script:
+        save_script(book, script)
+
+
+async def astream_script(book, call_site='docent'):
+    """stream_script()의 비동기 버전. AsyncOpenAI로 받으므로 기다리는 동안 이벤트 루프를 막지 않습니다."""
+    saved = await sync_to_async(cached_script)(book)
+    if saved is not None:
+        yield saved
+        return
+
+    parts = []
+    with resilience.guard('chat') as timeout:
+        stream = await get_async_openai().chat.completions.create(
+            model=LLM_MODEL,
+            messages=_script_messages(book),
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=timeout,
+        )
+        async with stream:  # 중간에 취소되어도 GMS 연결을 돌려놓습니다.
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    prompting.record_usage(call_site, chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield parts[-1]
+
+    script = ''.join(parts).strip()
+    if script:
+        await sync_to_async(save_script)(book, script)
+
+
+def _script_messages(book):
+    return [
+        {"role": "system", "content": DEFAULT_LLM_SYSTEM_MESSAGE},
+        {"role": "user", "content": build_docent_prompt(book)}
+    ]
+
+
+class _SentenceSplitter:
+    """split_sentences()/asplit_sentences()가 함께 쓰는 문장 경계 처리"""
+
+    def __init__(self, min_chars=None):
+        self.min_chars = min_chars if min_chars is not None else settings.DOCENT_STREAM_MIN_SENTENCE_CHARS
+        self.buffer = ''
+        self.pending = ''
+
+    def feed(self, piece):
+        """조각을 더하고 완성된 문장 목록을 반환합니다."""
+        self.buffer += piece
+        sentences = []
+        while True:
+            match = _SENTENCE_BOUNDARY.search(self.buffer)
+            if match is None:
+                break
+            sentence = self.buffer[:match.end()].strip()
+            self.buffer = self.buffer[match.end():]
+            if not sentence:
+                continue
+            self.pending = f"{self.pending} {sentence}" if self.pending else sentence
+            if len(self.pending) >= self.min_chars:
+                sentences.append(self.pending)
+                self.pending = ''
+        return sentences
+
+    def finish(self):
+        rest = f"{self.pending} {self.buffer.strip()}".strip()
+        return [rest] if rest else []
+
+
+def split_sentences(pieces, min_chars=None):
+    """
+    문자열 조각들을 받아 완성된 문장을 하나씩 내보냅니다.
+    min_chars보다 짧은 문장은 다음 문장과 합쳐서 TTS 호출 수를 줄입니다.
+    """
+    splitter = _SentenceSplitter(min_chars)
+    for piece in pieces:
+        yield from splitter.feed(piece)
+    yield from splitter.finish()
+
+
+async def asplit_sentences(pieces, min_chars=None):
+    """split_sentences()의 비동기 버전"""
+    splitter = _SentenceSplitter(min_chars)
+    async for piece in pieces:
+        for sentence in splitter.feed(piece):
+            yield sentence
+    for sentence in splitter.finish():
+        yield sentence
+
+
+def prefetch(iterable, maxsize=0):
+    """
+    iterable을 백그라운드 스레드에서 미리 실행하고 결과를 순서대로 내보냅니다.
+    (LLM 스크립트를 받는 동안 앞 문장의 TTS를 동시에 진행하기 위해 사용)
+    스레드에서 발생한 예외는 꺼내는 쪽에서 다시 발생합니다.
+    """
+    items = queue.Queue(maxsize)
+
+    def worker():
+        try:
+            for item in iterable:
+                items.put(item)
+            items.put(_END)
+        except Exception as e:
+            items.put(e)
+        finally:
+            connection.close()  # 이 스레드에서 연 DB 연결 정리
+
+    threading.Thread(target=worker, daemon=True).start()
+
+    def consume():
+        while True:
+            item = items.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    return consume()
+
+
+def aprefetch(aiterable, maxsize=0):
+    """
+    prefetch()의 비동기 버전. aiterable을 별도 태스크에서 미리 실행하고 결과를 순서대로 내보냅니다.
+    꺼내는 쪽이 멈추면(클라이언트 연결 끊김 등) 태스크도 취소합니다.
+    """
+    items = asyncio.Queue(maxsize)
+
+    async def worker():
+        try:
+            async for item in aiterable:
+                await items.put(item)
+            await items.put(_END)
+        except Exception as e:
+            await items.put(e)
+
+    async def consume():
+        task = asyncio.ensure_future(worker())
+        try:
+            while True:
+                item = await items.get()
+                if item is _END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            task.cancel()
+
+    return consume()
+
+
+def speak(sentences, voice):
+    """
+    문장마다 TTS를 호출해 mp3 바이트를 받는 대로 내보냅니다. 중간에 실패하면 거기서 멈춥니다.
+    문장별 음성은 TTS 디스크 캐시(tts_cache)를 사용하므로, 같은 스크립트를 다시 들으면 GMS를 호출하지 않습니다.
+    """
+    try:
+        for sentence in sentences:
+            cache_key = tts_cache.make_key(sentence, voice)
+            cached = tts_cache.cached_bytes(cache_key)
+            if cached is not None:
+                yield cached
+                continue
+            # 받는 대로 내보내면서 캐시 파일에도 씁니다. (문장 음성 전체를 메모리에 모으지 않음)
+            yield from tts_cache.tee(cache_key, stream_text_to_speech(sentence, voice))
+    except Exception as e:
+        # 이미 응답을 보내기 시작했으므로 상태 코드를 바꿀 수 없습니다. 받은 데까지만 재생됩니다.
+        print(f"DOCENT STREAM ERROR: {str(e)}")
+
+
+async def aspeak(sentences, voice):
+    """speak()의 비동기 버전. 문장별 음성을 받는 대로 내보내면서 TTS 디스크 캐시에도 씁니다."""
+    try:
+        async for sentence in sentences:
+            cache_key = tts_cache.make_key(sentence, voice)
+            cached = await sync_to_async(tts_cache.cached_bytes)(cache_key)
+            if cached is not None:
+                yield cached
+                continue
+            upstream = await async_open_text_to_speech(sentence, voice)
+            if upstream.status_code != 200:
+                raise RuntimeError(f"GMS TTS 오류: {upstream.status_code} - {upstream.text[:200]}")
+            async for chunk in tts_cache.atee(cache_key, aiter_audio(upstream)):
+                yield chunk
+    except Exception as e:
+        print(f"DOCENT STREAM ERROR: {str(e)}")
+    finally:
+        aclose = getattr(sentences, 'aclose', None)
+        if aclose is not None:
+            await aclose()  # 스크립트 생성 태스크 정리
@@ -0,0 +1,79 @@
+# books/embedding_cache.py
+
+import hashlib
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .models import EmbeddingCache
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evicted': 0}
+
+
+def make_key(text, model):
+    """모델 이름과 입력 텍스트(그대로)를 합쳐 sha256 키를 만듭니다."""
+    return hashlib.sha256(f"{model}\n{text}".encode('utf-8')).hexdigest()
+
+
+def _count(name, amount):
+    if amount:
+        with _stats_lock:
+            _stats[name] += amount
+
+
+def stats():
+    """프로세스가 시작된 이후의 캐시 적중/미스 횟수와 적중률을 반환합니다."""
+    with _stats_lock:
+        data = dict(_stats)
+    total = data['hits'] + data['misses']
+    data['hit_rate'] = round(data['hits'] / total, 4) if total else 0.0
+    return data
+
+
+def get_many(texts, model):
+    """
+    캐시에 있는 텍스트의 임베딩을 {text: np.ndarray(float32)} 형태로 반환합니다.
+    적중한 항목은 last_used_at을 갱신하여 LRU 삭제 대상에서 뒤로 밀어둡니다.
+    """
+    keys = {make_key(text, model): text for text in texts}
+    found = {}
+    for key, blob in EmbeddingCache.objects.filter(key__in=list(keys)).values_list('key', 'vector'):
+        found[keys[key]] = np.frombuffer(blob, dtype=np.float32)
+
+    if found:
+        hit_keys = [make_key(text, model) for text in found]
+        EmbeddingCache.objects.filter(key__in=hit_keys).update(last_used_at=timezone.now())
+
+    _count('hits', len(found))
+    _count('misses', len(set(texts)) - len(found))
+    return found
+
+
+def set_many(texts, vectors, model):
+    """새로 받은 임베딩을 캐시에 저장하고, 최대 크기를 넘으면 오래 안 쓴 항목부터 삭제합니다."""
+    objs = [
+        EmbeddingCache(
+            key=make_key(text, model),
+            model=model,
+            vector=np.asarray(vector, dtype=np.float32).tobytes(),
+        )
+        for text, vector in zip(texts, vectors)
+    ]
+    EmbeddingCache.objects.bulk_create(objs, batch_size=500, ignore_conflicts=True)
+    evict()
+
+
+def evict(max_entries=None):
+    """캐시 항목 수를 max_entries 이하로 유지합니다. (LRU)"""
+    max_entries = max_entries if max_entries is not None else settings.EMBEDDING_CACHE_MAX_ENTRIES
+    overflow = EmbeddingCache.objects.count() - max_entries
+    if overflow <= 0:
+        return 0
+
+    oldest = EmbeddingCache.objects.order_by('last_used_at').values_list('id', flat=True)[:overflow]
+    deleted, _ = EmbeddingCache.objects.filter(id__in=list(oldest)).delete()
+    _count('evicted', deleted)
+    return deleted
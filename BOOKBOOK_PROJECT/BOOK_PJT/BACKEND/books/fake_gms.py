@@ -0,0 +1,273 @@
+# books/fake_gms.py
+"""
+부하 테스트/오프라인 개발용 가짜 GMS 서버(ASGI 앱)입니다. 실행: python manage.py fake_gms
+
+백엔드가 사용하는 OpenAI 경로만 흉내 냅니다. (경로 앞부분은 보지 않으므로 GMS_API_BASE를 그대로 바꿔 쓰면 됩니다.)
+- POST .../chat/completions: JSON 모드면 프롬프트의 후보 ID 중에서 고른 추천 목록, 아니면 도슨트 스크립트 (stream 지원)
+- POST .../embeddings: 입력 텍스트의 해시로 만든 정규화 벡터 (float 리스트 또는 base64)
+- POST .../audio/speech: 텍스트 길이에 비례하는 가짜 mp3 바이트 (조각 단위로 스트리밍)
+- POST .../audio/transcriptions: 업로드 크기와 해시로 만든 전사 결과
+- GET /_fake/stats: 경로별 요청/오류 수
+
+응답 내용은 요청 내용만으로 정해지고(같은 요청 → 같은 응답), 지연 시간과 오류 주입만 seed를 준 난수를 씁니다.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import re
+
+import numpy as np
+
+ROUTES = ('chat', 'embeddings', 'tts', 'stt')
+
+# 실제 GMS에서 관찰한 값에 가깝게 잡은 기본 지연 시간 분포 (첫 바이트까지, 초)
+DEFAULT_LATENCY = {
+    'chat': 'lognormal:0.8:0.4',
+    'embeddings': 'lognormal:0.15:0.3',
+    'tts': 'lognormal:0.5:0.3',
+    'stt': 'lognormal:0.9:0.3',
+}
+
+EMBEDDING_DIMENSIONS = 1536
+
+_SUFFIXES = (
+    ('/chat/completions', 'chat'),
+    ('/embeddings', 'embeddings'),
+    ('/audio/speech', 'tts'),
+    ('/audio/transcriptions', 'stt'),
+)
+
+_CANDIDATE_ID = re.compile(r'^\s*(?:ID:)?(\d+)[|,]', re.MULTILINE)
+_PICK_COUNT = (re.compile(r'(\d+)권을 선정'), re.compile(r'(\d+)권의 도서'))
+
+_SCRIPT_SENTENCES = (
+    "안녕하세요, 오늘 소개해 드릴 책은 많은 독자들에게 사랑받고 있는 작품이에요.",
+    "이 책은 일상의 작은 순간들을 새로운 시선으로 바라보게 해 줘요.",
+    "작가는 쉽고 따뜻한 문장으로 어려운 이야기도 편안하게 풀어내요.",
+    "읽는 내내 나라면 어떻게 했을까 하고 스스로에게 묻게 된답니다.",
+    "바쁜 하루 끝에 천천히 한 장씩 넘겨 보시면 좋겠어요.",
+    "마지막 장을 덮고 나면 마음속에 오래 남는 여운을 느끼실 거예요.",
+    "가까운 사람에게 선물하기에도 좋은 책이에요.",
+    "오늘 소개해 드린 책과 함께 즐거운 독서 시간 보내세요.",
+)
+
+
+class Latency:
+    """
+    지연 시간 분포 (초). 형식:
+    'fixed:0.2' (또는 '0.2'), 'uniform:0.1:0.5', 'lognormal:중앙값:시그마'
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        kind, *params = str(spec).split(':') if ':' in str(spec) else ('fixed', spec)
+        try:
+            params = [float(value) for value in params]
+        except ValueError:
+            raise ValueError(f"지연 시간 분포 형식이 잘못되었습니다: {spec}")
+        expected = {'fixed': 1, 'uniform': 2, 'lognormal': 2}.get(kind)
+        if expected is None or len(params) != expected:
+            raise ValueError(f"지연 시간 분포 형식이 잘못되었습니다: {spec}")
+        self.kind, self.params = kind, params
+
+    def sample(self, rng):
+        if self.kind == 'fixed':
+            return max(self.params[0], 0.0)
+        if self.kind == 'uniform':
+            return rng.uniform(*self.params)
+        median, sigma = self.params
+        return rng.lognormvariate(np.log(median), sigma) if median > 0 else 0.0
+
+    def __str__(self):
+        return self.spec
+
+
+class FakeGMSConfig:
+    """
+    latency: {경로: Latency}
+    error_rates: {경로: 0~1} 해당 비율만큼 error_statuses 중 하나로 실패합니다.
+    token_interval: 채팅 스트리밍 토큰 사이 간격(초). 스트리밍이 아니면 전체 응답 시간에 더해집니다.
+    tts_bytes_per_char / tts_chunk_size / tts_chunk_interval: 가짜 mp3 크기와 스트리밍 속도
+    """
+
+    def __init__(self, latency=None, error_rates=None, error_statuses=(500, 503, 429), seed=None,
+                 token_interval=0.02, tts_bytes_per_char=400, tts_chunk_size=4096, tts_chunk_interval=0.01):
+        self.latency = {route: Latency(DEFAULT_LATENCY[route]) for route in ROUTES}
+        self.latency.update(latency or {})
+        self.error_rates = {route: 0.0 for route in ROUTES}
+        self.error_rates.update(error_rates or {})
+        self.error_statuses = tuple(error_statuses)
+        self.rng = random.Random(seed)
+        self.token_interval = token_interval
+        self.tts_bytes_per_char = tts_bytes_per_char
+        self.tts_chunk_size = tts_chunk_size
+        self.tts_chunk_interval = tts_chunk_interval
+
+
+def _seed(*parts):
+    digest = hashlib.sha256('\x1f'.join(str(part) for part in parts).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def fake_embedding(text, dimensions=EMBEDDING_DIMENSIONS):
+    """text마다 항상 같은 정규화 float32 벡터"""
+    vector = np.random.default_rng(_seed('embedding', text)).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def fake_chat_json(prompt):
+    """프롬프트의 후보 표에서 ID를 골라 추천/베스트셀러 응답 형식을 모두 담은 JSON을 만듭니다."""
+    rng = random.Random(_seed('chat', prompt))
+    ids = list(dict.fromkeys(int(value) for value in _CANDIDATE_ID.findall(prompt)))
+    count = next((int(m.group(1)) for pattern in _PICK_COUNT if (m := pattern.search(prompt))), None)
+    if not ids:
+        ids = [rng.randint(1, 1000) for _ in range(count or 2)]
+    picked = rng.sample(ids, min(count or len(ids), len(ids)))
+    return json.dumps({
+        "recommendations": [
+            {"book_id": book_id, "reason": f"취향에 잘 맞는 책이에요. (가짜 추천 {book_id})"} for book_id in picked
+        ],
+        "bestsellers": [{"id": book_id} for book_id in picked],
+    }, ensure_ascii=False)
+
+
+def fake_script(prompt):
+    rng = random.Random(_seed('script', prompt))
+    first, *rest = _SCRIPT_SENTENCES
+    return ' '.join([first] + rng.sample(rest[:-1], 4) + [rest[-1]])
+
+
+def fake_speech(text, voice, bytes_per_char):
+    """ID3 헤더로 시작하는, 텍스트 길이에 비례하는 가짜 mp3 바이트"""
+    size = max(len(text) * bytes_per_char, 256)
+    body = np.random.default_rng(_seed('tts', voice, text)).integers(0, 256, size, dtype=np.uint8).tobytes()
+    return b'ID3\x04\x00\x00\x00\x00\x00\x00' + body
+
+
+def _tokens(text, size=3):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class FakeGMS:
+    """ASGI 앱"""
+
+    def __init__(self, config=None):
+        self.config = config or FakeGMSConfig()
+        self.stats = {route: {'requests': 0, 'errors': 0} for route in ROUTES}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        path = scope['path']
+        if path.endswith('/_fake/stats'):
+            return await self._send(send, 200, json.dumps(self.stats).encode())
+
+        route = next((name for suffix, name in _SUFFIXES if path.endswith(suffix)), None)
+        if route is None or scope['method'] != 'POST':
+            return await self._send_error(send, 404, f"가짜 GMS에 없는 경로입니다: {scope['method']} {path}")
+
+        config = self.config
+        self.stats[route]['requests'] += 1
+        await asyncio.sleep(config.latency[route].sample(config.rng))
+        if config.rng.random() < config.error_rates[route]:
+            self.stats[route]['errors'] += 1
+            return await self._send_error(send, config.rng.choice(config.error_statuses), "가짜 GMS 오류 주입")
+
+        if route == 'stt':
+            return await self._transcription(send, body)
+        try:
+            payload = json.loads(body or b'{}')
+        except json.JSONDecodeError:
+            return await self._send_error(send, 400, "요청 본문이 JSON이 아닙니다.")
+        if route == 'chat':
+            return await self._chat(send, payload)
+        if route == 'embeddings':
+            return await self._embeddings(send, payload)
+        return await self._speech(send, payload)
+
+    async def _send(self, send, status, body, content_type=b'application/json', headers=()):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode()), *headers],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _send_error(self, send, status, message):
+        body = json.dumps({"error": {"message": message, "type": "fake_gms_error", "code": status}}, ensure_ascii=False)
+        return await self._send(send, status, body.encode())
+
+    async def _chat(self, send, payload):
+        prompt = '\n'.join(message.get('content') or '' for message in payload.get('messages', []))
+        json_mode = (payload.get('response_format') or {}).get('type') == 'json_object'
+        content = fake_chat_json(prompt) if json_mode else fake_script(prompt)
+        tokens = _tokens(content)
+        usage = {"prompt_tokens": len(prompt) // 2, "completion_tokens": len(tokens), "total_tokens": len(prompt) // 2 + len(tokens)}
+        base = {"id": "chatcmpl-fake", "created": 0, "model": payload.get('model', 'gpt-4o-mini')}
+
+        if not payload.get('stream'):
+            await asyncio.sleep(self.config.token_interval * len(tokens))
+            body = {
+                **base, "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            }
+            return await self._send(send, 200, json.dumps(body, ensure_ascii=False).encode())
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'text/event-stream')]})
+        for token in tokens:
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            await send({'type': 'http.response.body', 'body': f"data: {json.dumps(chunk)}\n\n".encode(), 'more_body': True})
+            await asyncio.sleep(self.config.token_interval)
+        if (payload.get('stream_options') or {}).get('include_usage'):
+            chunk = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+            await send({'type': 'http.response.body', 'body': f"data: {json.dumps(chunk)}\n\n".encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b"data: [DONE]\n\n"})
+
+    async def _embeddings(self, send, payload):
+        texts = payload.get('input', [])
+        texts = [texts] if isinstance(texts, str) else texts
+        as_base64 = payload.get('encoding_format') == 'base64'
+        data = []
+        for index, text in enumerate(texts):
+            vector = fake_embedding(text, payload.get('dimensions') or EMBEDDING_DIMENSIONS)
+            embedding = base64.b64encode(vector.tobytes()).decode() if as_base64 else vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens = sum(len(text) for text in texts) // 2
+        body = {"object": "list", "data": data, "model": payload.get('model'),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+        return await self._send(send, 200, json.dumps(body).encode())
+
+    async def _speech(self, send, payload):
+        config = self.config
+        audio = fake_speech(payload.get('input', ''), payload.get('voice', ''), config.tts_bytes_per_char)
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'audio/mpeg')]})
+        for start in range(0, len(audio), config.tts_chunk_size):
+            await send({'type': 'http.response.body', 'body': audio[start:start + config.tts_chunk_size], 'more_body': True})
+            await asyncio.sleep(config.tts_chunk_interval)
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def _transcription(self, send, body):
+        digest = hashlib.sha256(body).hexdigest()[:8]
+        text = f"가짜 전사 결과입니다. ({len(body)}바이트, {digest})"
+        return await self._send(send, 200, json.dumps({"text": text}, ensure_ascii=False).encode())
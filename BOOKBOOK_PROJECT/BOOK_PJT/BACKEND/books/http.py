@@ -0,0 +1,137 @@
+# books/http.py
+"""
+GMS(OpenAI 프록시)로 나가는 모든 HTTP 호출이 공유하는 연결 풀입니다.
+요청마다 새 클라이언트를 만들면 매번 TCP/TLS 연결을 새로 맺어야 하므로,
+프로세스당 클라이언트 하나를 만들어 keep-alive 연결을 재사용합니다.
+
+- get_http_client(): 동기 httpx.Client (TTS 등 직접 호출)
+- get_openai_client(): 위 연결 풀을 쓰는 OpenAI 클라이언트 (LLM, 임베딩, STT, 자체 재시도 없음)
+- client_options(): 비동기 클라이언트(async_clients.py)도 같은 타임아웃/HTTP2 설정을 쓰도록 옵션을 제공
+- stats(): 연결 재사용 지표 (MetricsView에서 노출)
+"""
+
+import importlib.util
+import os
+import threading
+
+import httpx
+from django.conf import settings
+from openai import OpenAI
+
+# ⭐️ GMS 엔드포인트 정의 (settings.GMS_API_BASE) ⭐️
+GMS_API_BASE = settings.GMS_API_BASE.rstrip('/') + '/'
+GMS_OPENAI_BASE_URL = GMS_API_BASE + "api.openai.com/v1"
+
+# h2 패키지가 설치되어 있을 때만 HTTP/2를 사용합니다. (pip install httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+_lock = threading.Lock()
+_clients = {}  # {pid: (httpx.Client, OpenAI)} - fork된 워커가 부모의 소켓을 공유하지 않도록 프로세스별로 만듭니다.
+
+_stats_lock = threading.Lock()
+_stats = {
+    'requests': 0,
+    'new_connections': 0,
+    'tls_handshakes': 0,
+    'http2_responses': 0,
+}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _on_trace(event_name, info):
+    # httpcore가 새 연결을 맺을 때만 connect_tcp/start_tls 이벤트가 발생합니다. (재사용 시에는 없음)
+    if event_name == 'connection.connect_tcp.complete':
+        _count('new_connections')
+    elif event_name == 'connection.start_tls.complete':
+        _count('tls_handshakes')
+
+
+async def _on_trace_async(event_name, info):
+    _on_trace(event_name, info)
+
+
+def _on_request(request):
+    _count('requests')
+    request.extensions['trace'] = _on_trace
+
+
+async def _on_request_async(request):
+    _count('requests')
+    request.extensions['trace'] = _on_trace_async
+
+
+def _on_response(response):
+    if response.extensions.get('http_version') == b'HTTP/2':
+        _count('http2_responses')
+
+
+async def _on_response_async(response):
+    _on_response(response)
+
+
+def client_options(max_connections, is_async=False):
+    """
+    GMS용 httpx 클라이언트 생성 옵션을 반환합니다.
+    max_connections: 풀 크기 (keep-alive로 유지하는 연결 수도 같은 값)
+    """
+    return {
+        'base_url': GMS_OPENAI_BASE_URL,
+        'headers': {"Authorization": f"Bearer {settings.GMS_KEY}"},
+        'timeout': httpx.Timeout(settings.GMS_READ_TIMEOUT, connect=settings.GMS_CONNECT_TIMEOUT),
+        'limits': httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=settings.GMS_KEEPALIVE_EXPIRY,
+        ),
+        'http2': settings.GMS_HTTP2 and HTTP2_AVAILABLE,
+        'event_hooks': {
+            'request': [_on_request_async if is_async else _on_request],
+            'response': [_on_response_async if is_async else _on_response],
+        },
+    }
+
+
+def _get_clients():
+    pid = os.getpid()
+    clients = _clients.get(pid)
+    if clients is None:
+        with _lock:
+            clients = _clients.get(pid)
+            if clients is None:
+                http_client = httpx.Client(**client_options(settings.GMS_HTTP_MAX_CONNECTIONS))
+                openai_client = OpenAI(
+                    api_key=settings.GMS_KEY,         # GMS Key 사용
+                    base_url=GMS_OPENAI_BASE_URL,     # GMS 엔드포인트 사용
+                    http_client=http_client,
+                    max_retries=0,                    # 재시도는 books/resilience.py에서 데드라인 안에서만 합니다.
+                )
+                clients = _clients[pid] = (http_client, openai_client)
+    return clients
+
+
+def get_http_client():
+    """GMS 호출용 공유 httpx.Client (base_url은 .../api.openai.com/v1)"""
+    return _get_clients()[0]
+
+
+def get_openai_client():
+    """공유 연결 풀을 사용하는 OpenAI 클라이언트"""
+    return _get_clients()[1]
+
+
+def stats():
+    """
+    프로세스가 시작된 이후 GMS 요청 수와 새로 맺은 연결 수, 연결 재사용률을 반환합니다.
+    (동기/비동기 클라이언트 합계)
+    """
+    with _stats_lock:
+        result = dict(_stats)
+    reused = max(result['requests'] - result['new_connections'], 0)
+    result['reused_connections'] = reused
+    result['reuse_rate'] = round(reused / result['requests'], 4) if result['requests'] else 0.0
+    result['http2_enabled'] = settings.GMS_HTTP2 and HTTP2_AVAILABLE
+    return result
@@ -0,0 +1,134 @@
+# books/llm_cache.py
+
+import hashlib
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .models import LLMResponseCache
+
+_stats_lock = threading.Lock()
+_stats = {}  # {call_site: {'hits': n, 'misses': n}}
+_evicted = 0
+
+
+def make_key(model, system_message, prompt, response_format=None):
+    """모델, 시스템 메시지, 프롬프트, 응답 형식을 합쳐 sha256 키를 만듭니다."""
+    raw = "\n".join([model, system_message or "", response_format or "", prompt])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def ttl_for(call_site):
+    """
+    호출 위치별 캐시 유지 시간(초)을 반환합니다.
+    settings.LLM_CACHE_TTL에 없으면 'default' 값을 쓰며, None이면 만료되지 않습니다.
+    """
+    ttls = settings.LLM_CACHE_TTL
+    return ttls.get(call_site, ttls.get('default'))
+
+
+def _count(call_site, name):
+    with _stats_lock:
+        site = _stats.setdefault(call_site, {'hits': 0, 'misses': 0})
+        site[name] += 1
+
+
+def get(key, call_site='default'):
+    """
+    만료되지 않은 캐시 응답을 반환합니다. 없으면 None.
+    캐시 조회에 실패해도(예: DB 잠금) 요청이 500이 되지 않도록 미스로 처리합니다.
+    """
+    now = timezone.now()
+    try:
+        row = (
+            LLMResponseCache.objects.filter(key=key)
+            .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now))
+            .values_list('id', 'response')
+            .first()
+        )
+    except DatabaseError as e:
+        print(f"LLM 응답 캐시 조회 실패: {e}")
+        row = None
+    if row is None:
+        _count(call_site, 'misses')
+        return None
+
+    try:
+        LLMResponseCache.objects.filter(id=row[0]).update(last_used_at=now, hit_count=F('hit_count') + 1)
+    except DatabaseError as e:
+        # 적중 기록을 못 남겨도 응답은 그대로 씁니다.
+        print(f"LLM 응답 캐시 적중 기록 실패: {e}")
+    _count(call_site, 'hits')
+    return row[1]
+
+
+def set(key, response, model, call_site='default'):
+    """
+    응답을 저장(같은 키가 있으면 덮어씀)하고, 최대 크기를 넘으면 오래 안 쓴 항목부터 삭제합니다.
+    캐시 저장에 실패해도(예: DB 잠금) LLM 응답은 그대로 쓸 수 있도록 예외를 올리지 않습니다.
+    """
+    ttl = ttl_for(call_site)
+    now = timezone.now()
+    try:
+        LLMResponseCache.objects.update_or_create(
+            key=key,
+            defaults={
+                'model': model,
+                'call_site': call_site,
+                'response': response,
+                'hit_count': 0,
+                'expires_at': now + timedelta(seconds=ttl) if ttl is not None else None,
+                'last_used_at': now,
+            },
+        )
+        evict()
+    except DatabaseError as e:
+        print(f"LLM 응답 캐시 저장 실패: {e}")
+
+
+def evict(max_entries=None):
+    """만료된 항목을 지우고, 항목 수를 max_entries 이하로 유지합니다. (LRU)"""
+    global _evicted
+    max_entries = max_entries if max_entries is not None else settings.LLM_CACHE_MAX_ENTRIES
+
+    deleted, _ = LLMResponseCache.objects.filter(expires_at__lte=timezone.now()).delete()
+    overflow = LLMResponseCache.objects.count() - max_entries
+    if overflow > 0:
+        oldest = LLMResponseCache.objects.order_by('last_used_at').values_list('id', flat=True)[:overflow]
+        more, _ = LLMResponseCache.objects.filter(id__in=list(oldest)).delete()
+        deleted += more
+
+    if deleted:
+        with _stats_lock:
+            _evicted += deleted
+    return deleted
+
+
+def stats():
+    """
+    프로세스가 시작된 이후 호출 위치별 적중/미스와 적중률, 그리고 DB에 저장된 항목 수를 반환합니다.
+    (hit_count 합계는 재시작과 관계없이 누적된 적중 횟수입니다.)
+    """
+    with _stats_lock:
+        sites = {name: dict(values) for name, values in _stats.items()}
+        evicted = _evicted
+
+    hits = sum(site['hits'] for site in sites.values())
+    misses = sum(site['misses'] for site in sites.values())
+    for site in sites.values():
+        total = site['hits'] + site['misses']
+        site['hit_rate'] = round(site['hits'] / total, 4) if total else 0.0
+
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        'evicted': evicted,
+        'entries': LLMResponseCache.objects.count(),
+        'lifetime_hits': LLMResponseCache.objects.aggregate(total=Sum('hit_count'))['total'] or 0,
+        'call_sites': sites,
+    }
@@ -0,0 +1,88 @@
+# books/management/commands/benchmark_ann.py
+
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from books.ann import IVFIndex, _normalize_rows
+
+
+def _synthetic_vectors(n, dim, rng, n_topics=256):
+    """실제 임베딩처럼 주제(클러스터)별로 모여 있는 합성 벡터를 만듭니다."""
+    topics = _normalize_rows(rng.standard_normal((n_topics, dim)).astype(np.float32))
+    assign = rng.integers(0, n_topics, size=n)
+    vectors = np.empty((n, dim), dtype=np.float32)
+    block = 100000
+    for start in range(0, n, block):
+        end = min(start + block, n)
+        noise = rng.standard_normal((end - start, dim)).astype(np.float32) * (0.8 / np.sqrt(dim))
+        vectors[start:end] = topics[assign[start:end]] + noise
+    return _normalize_rows(vectors)
+
+
+def _exact_top_k(vectors, query, k):
+    scores = vectors @ query
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the IVF index against exact search on synthetic vectors (recall@10, p50/p99 latency).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,100000,1000000', help='쉼표로 구분한 벡터 개수 목록')
+        parser.add_argument(
+            '--dim', type=int, default=256,
+            help='벡터 차원 (실제 모델은 1536이지만, 100만 x 1536 float32는 약 6GB이므로 기본값은 256)',
+        )
+        parser.add_argument('--queries', type=int, default=200, help='측정에 사용할 쿼리 수')
+        parser.add_argument('--nprobe', default='1,4,8,16,32', help='쉼표로 구분한 nprobe 목록')
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def _latency(self, fn, queries):
+        timings = []
+        results = []
+        for q in queries:
+            started = time.perf_counter()
+            results.append(fn(q))
+            timings.append((time.perf_counter() - started) * 1000)
+        return results, np.percentile(timings, 50), np.percentile(timings, 99)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        k = options['k']
+        dim = options['dim']
+        nprobes = [int(x) for x in options['nprobe'].split(',')]
+
+        for size in [int(x) for x in options['sizes'].split(',')]:
+            self.stdout.write(self.style.SUCCESS(f'\n--- {size:,}개 x {dim}차원 ---'))
+            vectors = _synthetic_vectors(size, dim, rng)
+            ids = np.arange(size, dtype=np.int64)
+
+            # 쿼리는 데이터셋 벡터에 약간의 노이즈를 더해 만듭니다.
+            picks = rng.choice(size, options['queries'], replace=False)
+            queries = _normalize_rows(vectors[picks] + rng.standard_normal((len(picks), dim)).astype(np.float32) * 0.05)
+
+            started = time.perf_counter()
+            index = IVFIndex.build(vectors, ids, seed=options['seed'])
+            build_seconds = time.perf_counter() - started
+            self.stdout.write(f'build: nlist={index.nlist}, {build_seconds:.1f}초')
+
+            exact, p50, p99 = self._latency(lambda q: _exact_top_k(vectors, q, k), queries)
+            self.stdout.write(f'{"exact":>12} | recall@{k}=1.000 | p50={p50:7.2f}ms | p99={p99:7.2f}ms')
+
+            for nprobe in nprobes:
+                if nprobe > index.nlist:
+                    continue
+                approx, p50, p99 = self._latency(
+                    lambda q: [book_id for book_id, _ in index.search(q, k=k, nprobe=nprobe)], queries
+                )
+                recall = np.mean([
+                    len(set(a) & set(e.tolist())) / k for a, e in zip(approx, exact)
+                ])
+                self.stdout.write(
+                    f'{f"nprobe={nprobe}":>12} | recall@{k}={recall:.3f} | p50={p50:7.2f}ms | p99={p99:7.2f}ms'
+                )
+            del vectors, index
@@ -0,0 +1,57 @@
+# books/management/commands/build_ann_index.py
+
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from books.ann import IVFIndex
+from books.models import Book
+from books.utils import decode_embedding
+
+
+class Command(BaseCommand):
+    help = 'Builds the IVF approximate nearest-neighbour index from Book embeddings and saves it to ANN_INDEX_DIR.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nlist', type=int, default=None, help='리스트(클러스터) 수 (기본: sqrt(도서 수))')
+        parser.add_argument('--iterations', type=int, default=10, help='k-means 반복 횟수')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('--- ANN(IVF) 인덱스 생성 시작 ---'))
+        started = time.perf_counter()
+
+        rows = (
+            Book.objects.filter(embedding_vector__isnull=False)
+            .order_by('id')
+            .values_list('id', 'embedding_vector', 'embedding_dtype')
+        )
+        ids = []
+        vectors = []
+        for book_id, blob, dtype in rows.iterator(chunk_size=2000):
+            if blob:
+                ids.append(book_id)
+                vectors.append(decode_embedding(blob, dtype))
+
+        if not vectors:
+            self.stdout.write(self.style.ERROR('❌ 임베딩이 저장된 책이 없습니다. generate_embeddings를 먼저 실행하세요.'))
+            return
+
+        matrix = np.vstack(vectors).astype(np.float32, copy=False)
+        self.stdout.write(f'총 {len(ids)}권, {matrix.shape[1]}차원 벡터를 읽었습니다.')
+
+        index = IVFIndex.build(
+            matrix, ids,
+            nlist=options['nlist'],
+            n_iter=options['iterations'],
+            seed=options['seed'],
+        )
+        index.save(settings.ANN_INDEX_DIR)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ nlist={index.nlist}, nprobe(기본)={settings.ANN_NPROBE} 인덱스 저장 완료: '
+            f'{settings.ANN_INDEX_DIR} ({elapsed:.1f}초)'
+        ))
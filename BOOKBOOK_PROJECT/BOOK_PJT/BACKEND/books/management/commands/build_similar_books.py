@@ -0,0 +1,44 @@
+# books/management/commands/build_similar_books.py
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from books.models import Book, SimilarBook
+from books.similarity import rebuild_similar_books, refresh_similar_books
+
+
+class Command(BaseCommand):
+    help = 'Precomputes the top-N similar books of every book into the SimilarBook table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-n', type=int, default=settings.SIMILAR_BOOKS_TOP_N, help='도서별로 저장할 유사 도서 수')
+        parser.add_argument('--block-size', type=int, default=settings.SIMILAR_BOOKS_BLOCK_SIZE, help='한 번에 계산할 도서 수')
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='유사 도서 목록이 아직 없는 도서(새 임베딩)와 그 영향을 받는 도서만 다시 계산합니다.',
+        )
+        parser.add_argument('--book-ids', default='', help='쉼표로 구분한 도서 ID. 이 도서들에 영향을 받는 목록만 다시 계산합니다.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        top_n = options['top_n']
+        block_size = options['block_size']
+
+        if options['book_ids'] or options['incremental']:
+            book_ids = [int(x) for x in options['book_ids'].split(',') if x.strip()]
+            if options['incremental']:
+                book_ids += list(
+                    Book.objects.filter(embedding_vector__isnull=False)
+                    .exclude(id__in=SimilarBook.objects.values('source_id'))
+                    .values_list('id', flat=True)
+                )
+            self.stdout.write(self.style.SUCCESS(f'--- 유사 도서 목록 부분 갱신 시작 (변경 도서 {len(book_ids)}권) ---'))
+            written = refresh_similar_books(book_ids, top_n=top_n, block_size=block_size)
+        else:
+            self.stdout.write(self.style.SUCCESS('--- 유사 도서 목록 전체 계산 시작 ---'))
+            written = rebuild_similar_books(top_n=top_n, block_size=block_size)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'✅ {written}권의 유사 도서 목록(top {top_n}) 저장 완료 ({elapsed:.1f}초)'))
@@ -0,0 +1,35 @@
+# books/management/commands/cleanup_tts_cache.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from books import tts_cache
+
+
+class Command(BaseCommand):
+    help = (
+        'Trims the on-disk TTS audio cache to TTS_CACHE_MAX_BYTES by evicting the least recently used files, '
+        'and removes temporary files left behind by interrupted writes. Safe to run while the server is up.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-mb', type=float, default=None,
+                            help='이번 정리에 쓸 크기 상한(MB). 기본은 settings.TTS_CACHE_MAX_BYTES')
+        parser.add_argument('--older-than-days', type=float, default=None,
+                            help='이 기간(일)보다 오래 재생되지 않은 파일도 삭제합니다.')
+        parser.add_argument('--clear', action='store_true', help='캐시를 모두 비웁니다.')
+
+    def handle(self, *args, **options):
+        max_bytes = None
+        if options['clear']:
+            max_bytes = 0
+        elif options['max_mb'] is not None:
+            max_bytes = int(options['max_mb'] * 1024 * 1024)
+        older_than = options['older_than_days'] * 24 * 60 * 60 if options['older_than_days'] is not None else None
+
+        self.stdout.write(self.style.SUCCESS(f'--- TTS 캐시 정리: {settings.TTS_CACHE_DIR} ---'))
+        removed, freed, kept, total = tts_cache.prune(max_bytes=max_bytes, older_than=older_than)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {removed}개 파일 삭제 ({freed / 1024 / 1024:.1f}MB), '
+            f'남은 파일 {kept}개 ({total / 1024 / 1024:.1f}MB)'
+        ))
@@ -0,0 +1,81 @@
+# books/management/commands/evaluate_quantized_index.py
+
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from books.models import Book
+from books.quantization import Int8Index
+from books.utils import decode_embedding
+
+
+def _top_k(scores, k):
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class Command(BaseCommand):
+    help = 'Builds the int8 quantized index from Book embeddings and reports memory per vector and recall loss versus exact cosine search.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200, help='평가에 사용할 도서(쿼리) 수')
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--rerank-factor', type=int, default=settings.QUANTIZED_RERANK_FACTOR)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        k = options['k']
+        factor = options['rerank_factor']
+
+        rows = (
+            Book.objects.filter(embedding_vector__isnull=False)
+            .order_by('id')
+            .values_list('embedding_vector', 'embedding_dtype')
+        )
+        vectors = [decode_embedding(blob, dtype) for blob, dtype in rows.iterator(chunk_size=2000) if blob]
+        if len(vectors) <= k:
+            self.stdout.write(self.style.ERROR('❌ 평가할 임베딩이 부족합니다. generate_embeddings를 먼저 실행하세요.'))
+            return
+
+        matrix = np.vstack(vectors).astype(np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        n, dim = matrix.shape
+
+        started = time.perf_counter()
+        index = Int8Index.build(matrix)
+        build_seconds = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(f'--- int8 압축 인덱스 ({n}권, {dim}차원, {build_seconds:.2f}초) ---'))
+        self.stdout.write(f'float64 리스트(기존 np.array): {dim * 8:>6} 바이트/권')
+        self.stdout.write(f'float32 행렬              : {dim * 4:>6} 바이트/권 (전체 {matrix.nbytes / 1024 ** 2:.1f}MB)')
+        self.stdout.write(
+            f'int8 + 스케일             : {index.bytes_per_vector:>6} 바이트/권 (전체 {index.nbytes / 1024 ** 2:.1f}MB, '
+            f'float32 대비 {index.nbytes / matrix.nbytes * 100:.0f}%)'
+        )
+
+        rng = np.random.default_rng(options['seed'])
+        query_rows = rng.choice(n, min(options['queries'], n), replace=False)
+
+        recall_first_pass = []
+        recall_reranked = []
+        for row in query_rows:
+            query = matrix[row]
+            exact_scores = matrix @ query
+            exact_scores[row] = -np.inf
+            exact = set(_top_k(exact_scores, k).tolist())
+
+            approx_scores = index.scores(query)
+            approx_scores[row] = -np.inf
+            recall_first_pass.append(len(exact & set(_top_k(approx_scores, k).tolist())) / k)
+
+            # 근사 상위 k x factor 후보를 원본 벡터로 재채점
+            shortlist = _top_k(approx_scores, min(k * factor, n - 1))
+            reranked = shortlist[np.argsort(-exact_scores[shortlist])][:k]
+            recall_reranked.append(len(exact & set(reranked.tolist())) / k)
+
+        first = np.mean(recall_first_pass)
+        final = np.mean(recall_reranked)
+        self.stdout.write(f'recall@{k} (int8 1차 검색만)         : {first:.4f} (손실 {1 - first:.4f})')
+        self.stdout.write(f'recall@{k} (int8 + 상위 {k * factor}개 재채점): {final:.4f} (손실 {1 - final:.4f})')
@@ -0,0 +1,80 @@
+# books/management/commands/fake_gms.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from books.fake_gms import ROUTES, FakeGMS, FakeGMSConfig, Latency
+
+
+def _parse_route_options(values, convert, label):
+    """['chat=0.1', ...] 형태의 옵션을 {경로: 값}으로 바꿉니다. 'all=...'은 모든 경로에 적용합니다."""
+    result = {}
+    for value in values or []:
+        route, sep, spec = value.partition('=')
+        if not sep or (route not in ROUTES and route != 'all'):
+            raise CommandError(f"{label} 형식은 경로=값 입니다. (경로: {', '.join(ROUTES)}, all) - {value}")
+        try:
+            converted = convert(spec)
+        except ValueError as e:
+            raise CommandError(str(e))
+        for name in (ROUTES if route == 'all' else (route,)):
+            result[name] = converted
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs a local stand-in for the GMS chat, embeddings, audio/speech and transcription routes. '
+        'Point the backend at it with GMS_API_BASE=http://<host>:<port>/gmsapi/ (any GMS_KEY works).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=9100)
+        parser.add_argument(
+            '--latency', action='append', metavar='경로=분포',
+            help="경로별 첫 바이트까지 지연 시간 분포. 예: chat=lognormal:0.8:0.4, tts=uniform:0.2:0.6, all=fixed:0 (여러 번 지정 가능)",
+        )
+        parser.add_argument(
+            '--error-rate', action='append', metavar='경로=비율',
+            help='경로별 오류 응답 비율(0~1). 예: tts=0.05, all=0.01',
+        )
+        parser.add_argument('--error-statuses', default='500,503,429', help='오류 주입 시 고를 상태 코드 목록')
+        parser.add_argument('--seed', type=int, default=None, help='지연 시간/오류 주입 난수 seed (응답 내용은 항상 요청으로 정해짐)')
+        parser.add_argument('--token-interval', type=float, default=0.02, help='채팅 응답 토큰 사이 간격(초)')
+        parser.add_argument('--tts-bytes-per-char', type=int, default=400, help='TTS 글자당 가짜 mp3 바이트 수')
+        parser.add_argument('--tts-chunk-interval', type=float, default=0.01, help='TTS mp3 조각(4KB) 사이 간격(초)')
+
+    def handle(self, *args, **options):
+        try:
+            import uvicorn
+        except ImportError:
+            raise CommandError('uvicorn이 필요합니다. (pip install -r requirements.txt)')
+
+        try:
+            error_statuses = [int(value) for value in options['error_statuses'].split(',') if value.strip()]
+        except ValueError:
+            raise CommandError(f"--error-statuses 형식이 잘못되었습니다: {options['error_statuses']}")
+
+        def rate(value):
+            value = float(value)
+            if not 0 <= value <= 1:
+                raise ValueError(f"오류 비율은 0~1 사이여야 합니다: {value}")
+            return value
+
+        config = FakeGMSConfig(
+            latency=_parse_route_options(options['latency'], Latency, '--latency'),
+            error_rates=_parse_route_options(options['error_rate'], rate, '--error-rate'),
+            error_statuses=error_statuses,
+            seed=options['seed'],
+            token_interval=options['token_interval'],
+            tts_bytes_per_char=options['tts_bytes_per_char'],
+            tts_chunk_interval=options['tts_chunk_interval'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(f"--- 가짜 GMS 서버: http://{options['host']}:{options['port']} ---"))
+        for route in ROUTES:
+            self.stdout.write(f"  {route}: 지연 {config.latency[route]}, 오류 비율 {config.error_rates[route]}")
+        self.stdout.write(f"  백엔드 실행 시: GMS_API_BASE=http://{options['host']}:{options['port']}/gmsapi/ GMS_KEY=fake")
+        self.stdout.write(f"  경로별 요청 수: http://{options['host']}:{options['port']}/_fake/stats")
+
+        uvicorn.run(FakeGMS(config), host=options['host'], port=options['port'], log_level='warning')
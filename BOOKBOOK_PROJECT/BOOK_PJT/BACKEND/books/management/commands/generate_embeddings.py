@@ -1,17 +1,87 @@
 from django.core.management.base import BaseCommand
-from books.models import Book
-from books.utils import get_embedding # 우리가 작성한 utils 함수 임포트
+from books.models import Book, SimilarBook
+from books.similarity import refresh_similar_books
+from books.utils import get_embeddings, build_embedding_text, TokenBucket, EMBEDDING_DTYPES # 우리가 작성한 utils 함수 임포트
+from books.vector_index import embedding_index
+from books import embedding_cache
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+import json
 import os
+import time
 
 class Command(BaseCommand):
     # 이 'help' 문자열이 명령어 설명으로 나타납니다.
-    help = 'Generate and save embeddings for all books using OpenAI API.' 
+    help = 'Generate and save embeddings for all books using OpenAI API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dtype',
+            choices=EMBEDDING_DTYPES,
+            default=settings.EMBEDDING_STORAGE_DTYPE,
+            help='임베딩 바이너리 저장 형식 (기본: settings.EMBEDDING_STORAGE_DTYPE)',
+        )
+        parser.add_argument('--batch-size', type=int, default=64, help='API 호출 한 번에 보낼 도서 수')
+        parser.add_argument('--workers', type=int, default=4, help='동시에 실행할 API 호출 수')
+        parser.add_argument('--rate', type=float, default=5.0, help='초당 최대 API 호출 수 (토큰 버킷)')
+        parser.add_argument(
+            '--retries', type=int, default=None,
+            help='배치별 최대 재시도 횟수 (일시적 오류만, 기본: settings.GMS_RETRY_ATTEMPTS)',
+        )
+        parser.add_argument('--all', action='store_true', help='이미 임베딩이 있는 책까지 전부 다시 생성합니다.')
+        parser.add_argument(
+            '--checkpoint',
+            default=str(settings.BASE_DIR / '.embedding_checkpoint.json'),
+            help='진행 상황을 저장할 파일 (중단 후 다시 실행하면 이어서 처리합니다.)',
+        )
+        parser.add_argument('--reset', action='store_true', help='체크포인트를 무시하고 처음부터 시작합니다.')
+
+    # ----------------------- 체크포인트 -----------------------
+    def _load_checkpoint(self, path, mode):
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return 0
+        # 다른 모드(--all 여부)로 저장된 체크포인트는 사용하지 않습니다.
+        if data.get('mode') != mode:
+            return 0
+        return int(data.get('last_id', 0))
+
+    def _save_checkpoint(self, path, mode, last_id):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'mode': mode, 'last_id': last_id, 'updated_at': timezone.now().isoformat()}, f)
+        os.replace(tmp_path, path)
+
+    # ----------------------- API 호출 (워커 스레드) -----------------------
+    def _embed_batch(self, batch_no, books, bucket, retries):
+        # 재시도(지터 백오프)와 서킷 브레이커는 resilience.call에 맡깁니다. (여기서 다시 감싸면 재시도가 곱절로 늘어남)
+        texts = [build_embedding_text(book) for book in books]
+        try:
+            return batch_no, books, get_embeddings(texts, rate_limiter=bucket, retries=retries)
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'❌ 배치 {batch_no} 임베딩 생성 실패: {e}'))
+            return batch_no, books, None
+        finally:
+            connection.close()  # 이 스레드에서 embedding_cache가 연 DB 연결 정리
+
+    def _iter_batches(self, books, batch_size):
+        # 처리 도중 같은 테이블을 업데이트하므로, 대상 id를 먼저 확정한 뒤 배치 단위로 읽습니다.
+        ids = list(books.values_list('id', flat=True))
+        for start in range(0, len(ids), batch_size):
+            yield list(books.filter(id__in=ids[start:start + batch_size]))
 
     def handle(self, *args, **options):
+        dtype = options['dtype']
+        mode = 'all' if options['all'] else 'missing'
+        checkpoint_path = options['checkpoint']
 
         # ⭐️⭐️ 디버깅 코드 수정: 뒷 8자리 출력 ⭐️⭐️
         loaded_key = os.environ.get("GMS_KEY", "GMS_KEY_NOT_SET")
-        
+
         if loaded_key != "GMS_KEY_NOT_SET" and len(loaded_key) > 8:
             display_key = loaded_key[-8:] # 문자열의 마지막 8자리
             self.stdout.write(self.style.WARNING(f"➡️ 현재 Django가 로드한 GMS Key의 뒷 8자리: ...{display_key}"))
@@ -20,38 +90,117 @@ class Command(BaseCommand):
         # ⭐️⭐️ 디버깅 코드 끝 ⭐️⭐️
 
         self.stdout.write(self.style.SUCCESS('--- 임베딩 생성 시작 (OpenAI API 호출) ---'))
-        
-        # 아직 임베딩이 없는 책만 필터링하여 대상
-        books = Book.objects.filter(embedding_vector__isnull=True) 
+
+        # 기본: 아직 임베딩이 없는 책만 대상 / --all: 전체 책 대상
+        books = Book.objects.select_related('category').only(
+            'id', 'title', 'subTitle', 'author', 'publisher', 'description', 'category__name'
+        ).order_by('id')
+        if mode == 'missing':
+            books = books.filter(embedding_vector__isnull=True)
+
+        # 체크포인트 이후부터 이어서 처리
+        last_id = 0 if options['reset'] else self._load_checkpoint(checkpoint_path, mode)
+        if last_id:
+            self.stdout.write(self.style.WARNING(f'➡️ 체크포인트에서 이어서 처리합니다. (ID {last_id} 이후)'))
+            books = books.filter(id__gt=last_id)
+
         total_books_to_process = books.count()
         processed_count = 0
-        
+
         self.stdout.write(f'총 처리할 책 권수: {total_books_to_process}권')
-        
+
         if total_books_to_process == 0:
             self.stdout.write(self.style.SUCCESS('모든 책에 이미 임베딩이 저장되어 있습니다.'))
+            if os.path.exists(checkpoint_path):
+                os.remove(checkpoint_path)
             return
 
-        for book in books:
-            # ⭐️ 임베딩을 생성할 텍스트 조합 ⭐️
-            text_to_embed = (
-                f"제목: {book.title}. "
-                f"부제: {book.subTitle}. "
-                f"저자: {book.author}. "
-                f"출판사: {book.publisher}. "
-                f"카테고리: {book.category.name if book.category else 'N/A'}. "
-                f"내용 요약: {book.description}"
-            )
-            
-            embedding = get_embedding(text_to_embed)
-            
-            if embedding:
-                # DB에 저장
-                book.embedding_vector = embedding
-                book.save()
-                processed_count += 1
-                self.stdout.write(f'✅ {processed_count}/{total_books_to_process} - {book.title[:30]}... 임베딩 저장 완료')
-            else:
-                self.stdout.write(self.style.ERROR(f'❌ {book.title[:30]}... 임베딩 생성 실패 (API 에러 또는 텍스트 없음)'))
-            
-        self.stdout.write(self.style.SUCCESS(f'\n--- 임베딩 생성 완료: 총 {processed_count}권 처리 ---'))
\ No newline at end of file
+        stats_before = embedding_cache.stats()
+        bucket = TokenBucket(rate=options['rate'])
+        max_in_flight = options['workers'] * 2
+        started = time.perf_counter()
+
+        embedded_ids = []
+        failed_count = 0
+        # 배치는 id 순서대로 만들어지지만 완료 순서는 뒤섞일 수 있으므로,
+        # "앞의 배치가 모두 끝난 지점"까지만 체크포인트를 전진시킵니다.
+        batch_last_ids = {}
+        finished = set()
+        next_to_checkpoint = 0
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            pending = set()
+            batches = enumerate(self._iter_batches(books, options['batch_size']))
+            exhausted = False
+
+            while pending or not exhausted:
+                # 동시에 진행 중인 배치 수를 제한하여 메모리 사용량을 일정하게 유지
+                while not exhausted and len(pending) < max_in_flight:
+                    try:
+                        batch_no, batch = next(batches)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    batch_last_ids[batch_no] = batch[-1].id
+                    pending.add(executor.submit(self._embed_batch, batch_no, batch, bucket, options['retries']))
+
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    batch_no, batch, vectors = future.result()
+                    if vectors is not None:
+                        # DB에 저장 (임베딩 컬럼만 한 번에 업데이트)
+                        for book, vector in zip(batch, vectors):
+                            book.set_embedding(vector, dtype=dtype)
+                        Book.objects.bulk_update(batch, ['embedding_vector', 'embedding_dtype'])
+                        processed_count += len(batch)
+                        embedded_ids.extend(book.id for book in batch)
+                        finished.add(batch_no)
+                    else:
+                        # 실패한 배치는 체크포인트가 넘어가지 않도록 완료 처리하지 않습니다.
+                        failed_count += len(batch)
+
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f'✅ {processed_count}/{total_books_to_process} 임베딩 저장 완료 '
+                        f'({processed_count / elapsed:.1f}권/초)'
+                    )
+
+                # 연속으로 끝난 배치까지 체크포인트 저장
+                advanced = False
+                while next_to_checkpoint in finished:
+                    next_to_checkpoint += 1
+                    advanced = True
+                if advanced:
+                    self._save_checkpoint(checkpoint_path, mode, batch_last_ids[next_to_checkpoint - 1])
+
+        # bulk_update는 시그널을 보내지 않으므로 메모리 인덱스를 직접 갱신 표시
+        if embedded_ids:
+            embedding_index.invalidate()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'\n--- 임베딩 생성 완료: 총 {processed_count}권 처리, 실패 {failed_count}권 '
+            f'({elapsed:.1f}초, {processed_count / elapsed if elapsed else 0:.1f}권/초) ---'
+        ))
+
+        # 이번 실행에서 발생한 캐시 적중/미스만 계산
+        stats_after = embedding_cache.stats()
+        hits = stats_after['hits'] - stats_before['hits']
+        misses = stats_after['misses'] - stats_before['misses']
+        self.stdout.write(
+            f"캐시 적중 {hits}건 / 미스(API 요청 대상) {misses}건 "
+            f"(적중률 {hits / (hits + misses) * 100 if hits + misses else 0:.1f}%)"
+        )
+
+        if failed_count:
+            self.stdout.write(self.style.WARNING('⚠️ 실패한 배치가 있어 체크포인트를 유지합니다. 다시 실행하면 실패한 지점부터 이어서 처리합니다.'))
+        elif os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        # 유사 도서 테이블이 이미 만들어져 있다면, 새 임베딩에 영향을 받는 목록만 갱신합니다.
+        if embedded_ids and SimilarBook.objects.exists():
+            refreshed = refresh_similar_books(embedded_ids)
+            self.stdout.write(self.style.SUCCESS(f'✅ 유사 도서 목록 {refreshed}권 부분 갱신 완료'))
@@ -2,7 +2,9 @@
 
 from django.core.management.base import BaseCommand
 from books.models import Book
+from books.prompting import budget_for, clean, compact_table, count_tokens, short_title
 from books.utils import get_llm_recommendation 
+from books.vector_index import embedding_index
 import json
 from django.db.models.functions import Cast
 from django.db.models import CharField
@@ -34,27 +36,42 @@ class Command(BaseCommand):
 
 
         # 2. LLM에게 전달할 프롬프트 구성
-        book_list_str = json.dumps(sampled_books_data, ensure_ascii=False, indent=2)
+        # JSON(indent) 대신 '|' 구분 표로 보내고, 긴 제목은 부제를 떼어 토큰 예산 안에 맞춥니다.
+        book_list_str, listed = compact_table(
+            ('id', '제목', '저자', '카테고리', '평점', '출간일'),
+            (
+                (b['id'], short_title(b['title']), clean(b['author'], 30), b['category__name'] or '',
+                 b['customer_review_rank'], b['pub_date'])
+                for b in sampled_books_data
+            ),
+            budget=budget_for('bestseller'),
+        )
+        if listed < len(sampled_books_data):
+            self.stdout.write(self.style.WARNING(f"➡️ 프롬프트 토큰 예산 때문에 {len(sampled_books_data)}권 중 {listed}권만 전달합니다."))
+            sampled_books_data = sampled_books_data[:listed]
+
         prompt = f"""
         당신은 한국 시장의 판매 트렌드를 잘 아는 도서 전문가입니다.
-        아래는 시스템에 등록된 도서 {len(sampled_books_data)}권의 **무작위 샘플 목록**입니다.
+        아래는 시스템에 등록된 도서 {listed}권의 **무작위 샘플 목록**입니다.
         교보문고, 알라딘, 예스24의 베스트셀러 순위를 반영하여 이 도서 목록에서 베스트 셀러 **정확히 20권**을 뽑아주세요. 
         
         규칙:
         1. 응답은 오직 JSON 객체 형태로만 이루어져야 합니다.
         2. JSON 객체는 'bestsellers'라는 키를 가지는 리스트여야 합니다.
-        3. 각 리스트 요소는 원본 도서 목록에 있는 'id', 'title', 'author'를 포함해야 합니다.
-        4. **반드시 아래 제시된 {len(sampled_books_data)}권의 도서 목록 내에서만 정확히 20권을 선정해야 합니다.**
+        3. 각 리스트 요소는 원본 도서 목록에 있는 'id'만 포함합니다.
+        4. **반드시 아래 제시된 {listed}권의 도서 목록 내에서만 정확히 20권을 선정해야 합니다.**
         
-        샘플링된 도서 목록:
+        샘플링된 도서 목록 (열: id|제목|저자|카테고리|평점|출간일):
         {book_list_str}
         
         응답 예시:
-        {{"bestsellers": [ {{"id": 123, "title": "책제목1", "author": "저자1"}}, ... ]}}
+        {{"bestsellers": [ {{"id": 123}}, ... ]}}
         """
+        self.stdout.write(f"➡️ 프롬프트 토큰 수: {count_tokens(prompt)}")
 
         # 3. LLM API 호출
-        llm_response_json = get_llm_recommendation(prompt)
+        # 명시적으로 다시 선정하는 명령이므로 캐시된 응답을 쓰지 않습니다.
+        llm_response_json = get_llm_recommendation(prompt, call_site='bestseller', use_cache=False)
         
         if not llm_response_json:
             self.stdout.write(self.style.ERROR('❌ LLM 응답 실패. GMS 키나 네트워크 연결을 확인하세요.'))
@@ -90,6 +107,8 @@ class Command(BaseCommand):
             
             # 5. 선정된 20권의 is_bestseller를 True로 설정
             Book.objects.filter(id__in=bestseller_ids[:20]).update(is_bestseller=True)
+            # update()는 시그널을 보내지 않으므로 유사도 검색 필터용 메타데이터를 직접 갱신 표시
+            embedding_index.invalidate_metadata()
             
             self.stdout.write(self.style.SUCCESS(f'✅ LLM으로부터 {len(bestseller_ids)}권을 선정하여 베스트셀러 20권 등록 완료.'))
         
@@ -0,0 +1,216 @@
+# books/management/commands/loadtest.py
+
+import asyncio
+import random
+import time
+import uuid
+
+import httpx
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from books.models import Book
+from books.utils import TokenBucket, get_embeddings
+
+# 엔드포인트별 (메서드, 동기 뷰 경로, 비동기 뷰 경로, 로그인 필요 여부)
+ENDPOINTS = {
+    'recommendation': ('GET', '/api/books/main-recommendations/', '/api/books/async/main-recommendations/', True),
+    'bestsellers': ('GET', '/api/books/bestsellers/', None, False),
+    'tts': ('POST', '/api/books/tts/', '/api/books/async/tts/', False),
+    'stt': ('POST', '/api/books/transcribe/', '/api/books/async/transcribe/', False),
+    'docent': ('POST', '/api/books/{book_id}/docent/', '/api/books/async/{book_id}/docent/', True),
+    'docent_stream': ('POST', '/api/books/{book_id}/docent/?stream=1', None, True),
+    'embeddings': None,  # HTTP 엔드포인트가 아니라 generate_embeddings가 쓰는 get_embeddings()를 직접 호출합니다.
+}
+
+DEFAULT_ENDPOINTS = 'recommendation,bestsellers,tts,stt,docent,embeddings'
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-tests the GMS-backed endpoints of a running server and reports throughput and '
+        'p50/p95/p99 latency per endpoint. Pair with `manage.py fake_gms` to run offline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--endpoints', default=DEFAULT_ENDPOINTS,
+                            help=f"측정할 엔드포인트 (쉼표 구분): {', '.join(ENDPOINTS)}")
+        parser.add_argument('--async-views', action='store_true', help='비동기 버전(/api/books/async/...)이 있으면 그 경로를 측정합니다.')
+        parser.add_argument('--requests', type=int, default=100, help='엔드포인트별 요청 수')
+        parser.add_argument('--concurrency', type=int, default=10, help='동시 요청 수')
+        parser.add_argument('--user', default='', help='로그인이 필요한 엔드포인트에 쓸 사용자 이메일 (DRF 토큰을 만들거나 재사용)')
+        parser.add_argument('--token', default='', help='--user 대신 직접 지정할 DRF 토큰')
+        parser.add_argument('--distinct', type=int, default=0,
+                            help='서로 다른 요청 내용(문장/도서) 수. 0이면 모든 요청이 다름 (캐시 효과 없이 측정)')
+        parser.add_argument('--voice', default='voice1')
+        parser.add_argument('--audio-file', default='', help='STT에 업로드할 오디오 파일 (기본: 64KB 가짜 오디오)')
+        parser.add_argument('--fake-gms-url', default='', help='가짜 GMS 서버 주소를 주면 엔드포인트별 업스트림 호출 수도 보고합니다.')
+        parser.add_argument('--embedding-batch-size', type=int, default=64, help='embeddings: 호출 한 번에 보낼 텍스트 수')
+        parser.add_argument('--timeout', type=float, default=120.0)
+
+    # ----------------------- 요청 만들기 -----------------------
+    def _payload_key(self, i):
+        distinct = self.options['distinct']
+        return i % distinct if distinct else f'{self.run_id}-{i}'
+
+    def _build_request(self, name, i):
+        method, path, async_path, _ = ENDPOINTS[name]
+        if self.options['async_views'] and async_path:
+            path = async_path
+        kwargs = {'headers': dict(self.auth_headers)}
+        voice = self.options['voice']
+
+        if name in ('docent', 'docent_stream'):
+            path = path.format(book_id=self.book_ids[i % len(self.book_ids)])
+            kwargs['json'] = {'voice': voice}
+        elif name == 'tts':
+            kwargs['json'] = {
+                'text': f"부하 테스트 {self._payload_key(i)}번 문장입니다. 이 댓글을 음성으로 들려 드릴게요.",
+                'voice': voice,
+            }
+        elif name == 'stt':
+            kwargs['files'] = {'audio': ('loadtest.webm', self.audio, 'audio/webm')}
+        return method, path, kwargs
+
+    # ----------------------- 측정 -----------------------
+    async def _http_call(self, client, name, i):
+        method, path, kwargs = self._build_request(name, i)
+        started = time.perf_counter()
+        first_byte = None
+        size = 0
+        try:
+            async with client.stream(method, path, **kwargs) as response:
+                async for chunk in response.aiter_bytes():
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - started
+                    size += len(chunk)
+                status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - started
+        return status, elapsed, first_byte if first_byte is not None else elapsed, size
+
+    def _embedding_call(self, i):
+        size = self.options['embedding_batch_size']
+        texts = [f"부하 테스트 {self._payload_key(i)}-{n}: 임베딩을 만들 도서 소개 문장입니다." for n in range(size)]
+        started = time.perf_counter()
+        try:
+            get_embeddings(texts, rate_limiter=self.embedding_bucket)
+            status = 200
+        except Exception as e:
+            status = type(e).__name__
+        finally:
+            connection.close()
+        elapsed = time.perf_counter() - started
+        return status, elapsed, elapsed, 0
+
+    async def _run_endpoint(self, client, name):
+        results = []
+        counter = iter(range(self.options['requests']))
+
+        async def worker():
+            for i in counter:
+                if name == 'embeddings':
+                    results.append(await asyncio.to_thread(self._embedding_call, i))
+                else:
+                    results.append(await self._http_call(client, name, i))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.options['concurrency'])))
+        return results, time.perf_counter() - started
+
+    async def _fake_gms_stats(self, client):
+        if not self.options['fake_gms_url']:
+            return None
+        try:
+            response = await client.get(self.options['fake_gms_url'].rstrip('/') + '/_fake/stats')
+            return response.json()
+        except (httpx.HTTPError, ValueError):
+            return None
+
+    def _report(self, name, results, wall_time, before, after):
+        statuses = {}
+        for status, *_ in results:
+            statuses[status] = statuses.get(status, 0) + 1
+        errors = sum(count for status, count in statuses.items() if not (isinstance(status, int) and status < 400))
+        latencies = np.array([elapsed for _, elapsed, _, _ in results]) * 1000
+        first_bytes = np.array([first for _, _, first, _ in results]) * 1000
+        sizes = [size for *_, size in results]
+
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        f50, f95 = np.percentile(first_bytes, [50, 95])
+        self.stdout.write(
+            f"{name}: {len(results)}건 / {len(results) / wall_time:.1f} req/s / "
+            f"p50 {p50:.1f}ms / p95 {p95:.1f}ms / p99 {p99:.1f}ms / 최대 {latencies.max():.1f}ms "
+            f"(첫 바이트 p50 {f50:.1f}ms / p95 {f95:.1f}ms, 평균 응답 {np.mean(sizes) / 1024:.1f}KB, "
+            f"오류 {errors}건, 상태 {statuses})"
+        )
+        if before is not None and after is not None:
+            upstream = {
+                route: after[route]['requests'] - before[route]['requests']
+                for route in after if after[route]['requests'] != before[route]['requests']
+            }
+            self.stdout.write(f"  └ 업스트림(가짜 GMS) 호출: {upstream or '없음'}")
+
+    async def _run(self, names):
+        limits = httpx.Limits(max_connections=self.options['concurrency'] + 5)
+        timeout = httpx.Timeout(self.options['timeout'])
+        async with httpx.AsyncClient(base_url=self.options['base_url'], limits=limits, timeout=timeout) as client:
+            for name in names:
+                before = await self._fake_gms_stats(client)
+                results, wall_time = await self._run_endpoint(client, name)
+                after = await self._fake_gms_stats(client)
+                self._report(name, results, wall_time, before, after)
+
+    # ----------------------- 준비 -----------------------
+    def _prepare(self, names):
+        options = self.options
+        self.run_id = uuid.uuid4().hex[:8]
+        self.auth_headers = {}
+
+        if any(ENDPOINTS[name] and ENDPOINTS[name][3] for name in names):
+            token = options['token']
+            if not token and options['user']:
+                from rest_framework.authtoken.models import Token
+                user = get_user_model().objects.filter(email=options['user']).first()
+                if user is None:
+                    raise CommandError(f"사용자를 찾을 수 없습니다: {options['user']}")
+                token = Token.objects.get_or_create(user=user)[0].key
+            if not token:
+                raise CommandError('로그인이 필요한 엔드포인트입니다. --user 또는 --token을 지정하세요.')
+            self.auth_headers['Authorization'] = f'Token {token}'
+
+        if {'docent', 'docent_stream'} & set(names):
+            ids = list(Book.objects.values_list('id', flat=True))
+            if not ids:
+                raise CommandError('도슨트를 요청할 도서가 없습니다.')
+            count = options['distinct'] or options['requests']
+            self.book_ids = random.Random(self.run_id).sample(ids, min(count, len(ids)))
+
+        if 'stt' in names:
+            if options['audio_file']:
+                with open(options['audio_file'], 'rb') as f:
+                    self.audio = f.read()
+            else:
+                self.audio = random.Random(0).randbytes(64 * 1024)
+
+        # generate_embeddings와 같은 경로를 재되, 프로세스 공유 빈도 제한(초당 10회)에 막히지 않도록 넉넉하게 잡습니다.
+        self.embedding_bucket = TokenBucket(rate=1000, capacity=1000)
+
+    def handle(self, *args, **options):
+        self.options = options
+        names = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = [name for name in names if name not in ENDPOINTS]
+        if unknown:
+            raise CommandError(f"알 수 없는 엔드포인트: {', '.join(unknown)} (가능: {', '.join(ENDPOINTS)})")
+        self._prepare(names)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"--- 부하 테스트: {options['base_url']} (엔드포인트별 {options['requests']}건, 동시 {options['concurrency']}) ---"
+        ))
+        if 'embeddings' in names:
+            self.stdout.write('  embeddings는 이 프로세스에서 get_embeddings()를 직접 호출합니다. (settings.GMS_API_BASE 사용)')
+        asyncio.run(self._run(names))
@@ -0,0 +1,106 @@
+# books/management/commands/loadtest_async.py
+
+import asyncio
+import time
+
+import httpx
+import numpy as np
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures catalog-endpoint latency against a running server, first alone and then while '
+        'many slow GMS-backed requests are in flight. Run the server with uvicorn to check the async views.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--fast-path', default='/api/books/1/', help='지연 시간을 측정할 가벼운 도서 조회 경로')
+        parser.add_argument('--slow-path', default='/api/books/async/main-recommendations/', help='GMS를 호출하는 느린 경로')
+        parser.add_argument('--slow-method', default='GET', choices=['GET', 'POST'])
+        parser.add_argument('--slow-body', default='{}', help='느린 경로가 POST일 때 보낼 JSON 본문')
+        parser.add_argument('--token', default='', help='느린 경로 호출에 사용할 DRF 토큰 (Authorization: Token ...)')
+        parser.add_argument('--pending', type=int, default=100, help='동시에 걸어 둘 느린 요청 수')
+        parser.add_argument('--requests', type=int, default=200, help='측정할 가벼운 요청 수')
+        parser.add_argument('--concurrency', type=int, default=10, help='가벼운 요청 동시 실행 수')
+
+    async def _measure_fast(self, client, path, total, concurrency):
+        latencies = []
+        errors = 0
+        queue = asyncio.Queue()
+        for _ in range(total):
+            queue.put_nowait(None)
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return np.array(latencies) * 1000, errors
+
+    async def _slow_call(self, client, options, results):
+        headers = {'Authorization': f"Token {options['token']}"} if options['token'] else {}
+        started = time.perf_counter()
+        try:
+            if options['slow_method'] == 'POST':
+                response = await client.post(options['slow_path'], content=options['slow_body'],
+                                             headers={**headers, 'Content-Type': 'application/json'})
+            else:
+                response = await client.get(options['slow_path'], headers=headers)
+            results.append((response.status_code, time.perf_counter() - started))
+        except httpx.HTTPError as e:
+            results.append((type(e).__name__, time.perf_counter() - started))
+
+    def _report(self, label, latencies, errors):
+        if len(latencies) == 0:
+            self.stdout.write(f'{label}: 측정값 없음')
+            return
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        self.stdout.write(
+            f'{label}: p50 {p50:.1f}ms / p95 {p95:.1f}ms / p99 {p99:.1f}ms / 최대 {latencies.max():.1f}ms '
+            f'(요청 {len(latencies)}건, 오류 {errors}건)'
+        )
+
+    async def _run(self, options):
+        limits = httpx.Limits(max_connections=options['pending'] + options['concurrency'] + 10)
+        timeout = httpx.Timeout(120.0)
+        async with httpx.AsyncClient(base_url=options['base_url'], limits=limits, timeout=timeout) as client:
+            # 1. 느린 요청 없이 기준 지연 시간
+            baseline = await self._measure_fast(client, options['fast_path'], options['requests'], options['concurrency'])
+            self._report('기준 (느린 요청 없음)', *baseline)
+
+            # 2. 느린 요청을 동시에 걸어 둔 상태에서 다시 측정
+            slow_results = []
+            slow_tasks = [
+                asyncio.create_task(self._slow_call(client, options, slow_results))
+                for _ in range(options['pending'])
+            ]
+            await asyncio.sleep(0.5)  # 느린 요청이 서버에 도착할 시간을 줍니다.
+            in_flight = sum(not task.done() for task in slow_tasks)
+            loaded = await self._measure_fast(client, options['fast_path'], options['requests'], options['concurrency'])
+            self._report(f'느린 요청 {in_flight}건 대기 중', *loaded)
+
+            await asyncio.gather(*slow_tasks)
+
+        statuses = {}
+        for code, _ in slow_results:
+            statuses[code] = statuses.get(code, 0) + 1
+        slow_latencies = np.array([elapsed for _, elapsed in slow_results]) * 1000
+        self.stdout.write(
+            f'느린 요청 {len(slow_results)}건: 상태 {statuses}, '
+            f'p50 {np.percentile(slow_latencies, 50):.0f}ms / 최대 {slow_latencies.max():.0f}ms'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f"--- 부하 테스트: {options['base_url']} ---"))
+        asyncio.run(self._run(options))
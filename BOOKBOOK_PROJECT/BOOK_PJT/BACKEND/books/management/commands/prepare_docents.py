@@ -0,0 +1,114 @@
+# books/management/commands/prepare_docents.py
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+
+from books import docent
+from books.models import Book
+from books.utils import TokenBucket
+from user.models import VOICE_CHOICES
+
+
+class Command(BaseCommand):
+    help = (
+        'Pre-generates docent scripts and full audio for every voice for bestsellers and the most '
+        'commented/shelved books, so BookDocentView can serve them immediately. Already prepared '
+        'artifacts are skipped, so an interrupted run resumes where it stopped. Use --interval to '
+        'keep running as a scheduled job.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--popular', type=int, default=settings.DOCENT_PREPARE_POPULAR_BOOKS,
+                            help='베스트셀러와 함께 준비할 인기 도서 수 (기본: settings.DOCENT_PREPARE_POPULAR_BOOKS)')
+        parser.add_argument('--books', default='', help='대상 대신 이 도서 ID들만 준비합니다. (쉼표 구분)')
+        parser.add_argument('--voices', default=','.join(voice_id for voice_id, _ in VOICE_CHOICES),
+                            help='준비할 목소리 (쉼표 구분, 기본: 전체 VOICE_CHOICES)')
+        parser.add_argument('--workers', type=int, default=4, help='동시에 준비할 도서 수')
+        parser.add_argument('--llm-rate', type=float, default=1.0, help='초당 최대 스크립트 생성(LLM) 호출 수')
+        parser.add_argument('--tts-rate', type=float, default=2.0, help='초당 최대 음성 생성(TTS) 호출 수')
+        parser.add_argument('--interval', type=float, default=None, metavar='SECONDS',
+                            help='주면 끝난 뒤 이 간격마다 다시 실행합니다. (베스트셀러/인기 도서가 바뀌어도 따라감)')
+
+    def _targets(self, options):
+        """준비할 도서 목록: 베스트셀러 → 댓글/서재 활동이 많은 순"""
+        if options['books']:
+            ids = [int(value) for value in options['books'].split(',') if value.strip()]
+            return list(Book.objects.filter(id__in=ids).order_by('id'))
+
+        books = list(Book.objects.filter(is_bestseller=True).order_by('id'))
+        seen = {book.id for book in books}
+        popular = (
+            Book.objects.exclude(id__in=seen)
+            .annotate(activity=Count('comments', distinct=True) + Count('in_libraries', distinct=True))
+            .filter(activity__gt=0)
+            .order_by('-activity', 'id')[:options['popular']]
+        )
+        return books + list(popular)
+
+    def _prepare(self, book, voices, llm_limiter, tts_limiter):
+        started = time.perf_counter()
+        try:
+            generated, synthesized = docent.prepare(book, voices, llm_limiter, tts_limiter)
+            return book, generated, synthesized, None, time.perf_counter() - started
+        except Exception as e:
+            return book, False, 0, e, time.perf_counter() - started
+        finally:
+            connection.close()  # 워커 스레드에서 연 DB 연결 정리
+
+    def _run_once(self, options, voices):
+        books = self._targets(options)
+        self.stdout.write(self.style.SUCCESS(
+            f'--- 도슨트 사전 생성: {len(books)}권 × 목소리 {len(voices)}개 ({", ".join(voices)}) ---'
+        ))
+        llm_limiter = TokenBucket(rate=options['llm_rate'])
+        tts_limiter = TokenBucket(rate=options['tts_rate'])
+        scripts = audios = failed = 0
+        started = time.perf_counter()
+
+        executor = ThreadPoolExecutor(max_workers=options['workers'])
+        try:
+            futures = [executor.submit(self._prepare, book, voices, llm_limiter, tts_limiter) for book in books]
+            for future in as_completed(futures):
+                book, generated, synthesized, error, elapsed = future.result()
+                if error is not None:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f'❌ [{book.id}] {book.title}: {error}'))
+                    continue
+                scripts += generated
+                audios += synthesized
+                if generated or synthesized:
+                    self.stdout.write(
+                        f'✅ [{book.id}] {book.title}: 스크립트 {"생성" if generated else "재사용"}, '
+                        f'음성 {synthesized}개 생성 ({elapsed:.1f}초)'
+                    )
+        finally:
+            # Ctrl+C로 중단하면 시작하지 않은 도서는 버립니다. (다시 실행하면 이어서 처리)
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'--- 완료: 스크립트 {scripts}개, 음성 {audios}개 새로 생성, 실패 {failed}권 '
+            f'({time.perf_counter() - started:.1f}초) ---'
+        ))
+        if failed:
+            self.stdout.write(self.style.WARNING('⚠️ 실패한 도서는 다시 실행하면 남은 것부터 이어서 준비합니다.'))
+
+    def handle(self, *args, **options):
+        voices = []
+        for voice_id in options['voices'].split(','):
+            voice_id = voice_id.strip()
+            if voice_id:
+                voices.append(docent.VOICE_MAP.get(voice_id, voice_id))
+
+        try:
+            while True:
+                self._run_once(options, voices)
+                if options['interval'] is None:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('⚠️ 중단되었습니다. 다시 실행하면 남은 것부터 이어서 준비합니다.'))
@@ -0,0 +1,64 @@
+# books/management/commands/process_recommendation_jobs.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from books import recommendation_queue
+
+# 끝난 작업 정리 간격(초)
+PRUNE_INTERVAL = 10 * 60
+
+
+class Command(BaseCommand):
+    help = (
+        'Worker that precomputes main-page recommendations from the RecommendationJob queue. '
+        'Runs until interrupted unless --once is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='대기 중인 작업을 모두 처리하고 종료합니다.')
+        parser.add_argument(
+            '--enqueue-active', type=int, default=None, metavar='DAYS',
+            help='시작 전에 최근 DAYS일 안에 활동한 사용자 중 추천이 없거나 오래된 사용자의 작업을 추가합니다.',
+        )
+        parser.add_argument('--poll-interval', type=float, default=5.0, help='대기열이 비었을 때 다시 확인하는 간격(초)')
+
+    def handle(self, *args, **options):
+        if options['enqueue_active'] is not None:
+            added = recommendation_queue.enqueue_active_users(options['enqueue_active'])
+            self.stdout.write(self.style.SUCCESS(f'➡️ 최근 {options["enqueue_active"]}일 활동 사용자 작업 {added}건 추가'))
+
+        self.stdout.write(self.style.SUCCESS('--- 메인 화면 추천 사전 계산 워커 시작 ---'))
+        done = failed = 0
+        next_prune = 0.0
+        try:
+            while True:
+                if time.monotonic() >= next_prune:
+                    pruned = recommendation_queue.prune_finished_jobs()
+                    if pruned:
+                        self.stdout.write(f'🧹 보관 기간이 지난 완료/실패 작업 {pruned}건을 삭제했습니다.')
+                    next_prune = time.monotonic() + PRUNE_INTERVAL
+
+                recovered = recommendation_queue.recover_stale_jobs()
+                if recovered:
+                    self.stdout.write(self.style.WARNING(f'⚠️ 오래 실행 중이던 작업 {recovered}건을 다시 대기열에 넣었습니다.'))
+
+                job = recommendation_queue.claim_next()
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                started = time.perf_counter()
+                if recommendation_queue.process(job):
+                    done += 1
+                    self.stdout.write(f'✅ 사용자 {job.user_id} 추천 저장 ({job.reason}, {time.perf_counter() - started:.1f}초)')
+                else:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f'❌ 사용자 {job.user_id} 추천 실패 ({job.attempts}회): {job.last_error}'))
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'--- 워커 종료: 성공 {done}건, 실패 {failed}건 ---'))
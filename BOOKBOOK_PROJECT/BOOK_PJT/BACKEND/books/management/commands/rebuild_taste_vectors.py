@@ -0,0 +1,24 @@
+# books/management/commands/rebuild_taste_vectors.py
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from books.taste import rebuild_taste_vector
+
+
+class Command(BaseCommand):
+    help = 'Recomputes every user taste vector from their Library and Comments (e.g. after regenerating embeddings).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-ids', default='', help='쉼표로 구분한 사용자 id (생략하면 전체)')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('id')
+        if options['user_ids']:
+            users = users.filter(id__in=[int(user_id) for user_id in options['user_ids'].split(',') if user_id])
+
+        count = 0
+        for user in users.iterator(chunk_size=500):
+            rebuild_taste_vector(user)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'✅ 사용자 {count}명의 취향 벡터를 다시 계산했습니다.'))
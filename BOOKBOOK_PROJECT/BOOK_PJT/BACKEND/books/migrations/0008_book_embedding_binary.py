@@ -0,0 +1,78 @@
+# Generated by Django 5.2.4 on 2026-01-05 10:12
+
+import json
+
+import numpy as np
+from django.db import migrations, models
+
+
+def json_to_binary(apps, schema_editor):
+    """기존 JSON 임베딩을 float32 바이트로 변환합니다."""
+    Book = apps.get_model('books', 'Book')
+    books = Book.objects.filter(embedding_vector__isnull=False).only('id', 'embedding_vector')
+    batch = []
+    for book in books.iterator(chunk_size=500):
+        vector = book.embedding_vector
+        if isinstance(vector, str):
+            vector = json.loads(vector)
+        if not vector:
+            continue
+        book.embedding_blob = np.asarray(vector, dtype=np.float32).tobytes()
+        book.embedding_dtype = 'float32'
+        batch.append(book)
+        if len(batch) >= 500:
+            Book.objects.bulk_update(batch, ['embedding_blob', 'embedding_dtype'])
+            batch = []
+    if batch:
+        Book.objects.bulk_update(batch, ['embedding_blob', 'embedding_dtype'])
+
+
+def binary_to_json(apps, schema_editor):
+    """되돌릴 때 바이트 임베딩을 다시 JSON 리스트로 변환합니다."""
+    Book = apps.get_model('books', 'Book')
+    books = Book.objects.filter(embedding_blob__isnull=False).only('id', 'embedding_blob', 'embedding_dtype')
+    batch = []
+    for book in books.iterator(chunk_size=500):
+        vector = np.frombuffer(bytes(book.embedding_blob), dtype=book.embedding_dtype)
+        book.embedding_vector = vector.astype(np.float64).tolist()
+        batch.append(book)
+        if len(batch) >= 500:
+            Book.objects.bulk_update(batch, ['embedding_vector'])
+            batch = []
+    if batch:
+        Book.objects.bulk_update(batch, ['embedding_vector'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0007_library'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='embedding_blob',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='embedding_dtype',
+            field=models.CharField(choices=[('float32', 'float32 (기본, 6KB/권)'), ('float16', 'float16 (절반 크기, 3KB/권)')], default='float32', help_text='embedding_vector 바이트의 저장 형식', max_length=10),
+        ),
+        migrations.RunPython(json_to_binary, binary_to_json),
+        migrations.RemoveField(
+            model_name='book',
+            name='embedding_vector',
+        ),
+        migrations.RenameField(
+            model_name='book',
+            old_name='embedding_blob',
+            new_name='embedding_vector',
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='embedding_vector',
+            field=models.BinaryField(blank=True, help_text='OpenAI text-embedding-3-small 모델의 벡터 (1536차원) 저장 공간', null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0013_recommendation_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocentScript',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField()),
+                ('prompt_version', models.PositiveSmallIntegerField()),
+                ('description_hash', models.CharField(max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='docent_script', to='books.book')),
+            ],
+        ),
+    ]
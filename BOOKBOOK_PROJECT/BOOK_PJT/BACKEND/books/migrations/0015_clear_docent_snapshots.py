@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:40
+
+from django.db import migrations
+
+
+def clear_docent_snapshots(apps, schema_editor):
+    """도슨트 스크립트는 DocentScript에만 저장하므로, SingleFlight 행에 남은 스크립트 사본을 비웁니다."""
+    SingleFlight = apps.get_model('books', 'SingleFlight')
+    SingleFlight.objects.filter(key__startswith='docent:').update(result=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0014_docentscript'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_docent_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:50
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def drop_duplicate_pending_jobs(apps, schema_editor):
+    """사용자당 대기 작업 하나만 남깁니다. (가장 오래된 작업을 남기고 나머지는 삭제)"""
+    RecommendationJob = apps.get_model('books', 'RecommendationJob')
+    seen = set()
+    duplicates = []
+    pending = RecommendationJob.objects.filter(status='pending').order_by('created_at', 'id')
+    for job_id, user_id in pending.values_list('id', 'user_id'):
+        if user_id in seen:
+            duplicates.append(job_id)
+        seen.add(user_id)
+    RecommendationJob.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0015_clear_docent_snapshots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='recommendationjob',
+            name='books_recom_status_326271_idx',
+        ),
+        migrations.AddField(
+            model_name='recommendationjob',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='recommendationjob',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='books_recom_status_450469_idx'),
+        ),
+        migrations.RunPython(drop_duplicate_pending_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='recommendationjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('user',), name='unique_pending_recommendation_job'),
+        ),
+    ]
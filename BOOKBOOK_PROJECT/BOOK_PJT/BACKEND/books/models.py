@@ -1,9 +1,19 @@
 from django.db import models
 from django.contrib.postgres.fields import ArrayField
 from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.utils import timezone
+
+from .utils import decode_embedding, encode_embedding
 
 User = get_user_model()
 
+# 임베딩 바이너리 저장 형식
+EMBEDDING_DTYPE_CHOICES = [
+    ('float32', 'float32 (기본, 6KB/권)'),
+    ('float16', 'float16 (절반 크기, 3KB/권)'),
+]
+
 class Category(models.Model):
     """도서 카테고리"""
     name = models.CharField(max_length=50, unique=True)
@@ -42,12 +52,18 @@ class Book(models.Model):
     # 평점
     customer_review_rank = models.FloatField(default=0)
 
-    # 임베딩 벡터를 저장할 필드 추가
-    embedding_vector = models.JSONField(
+    # 임베딩 벡터를 저장할 필드 (JSON 텍스트 대신 float32/float16 바이트로 저장)
+    embedding_vector = models.BinaryField(
         null=True, 
         blank=True, 
         help_text="OpenAI text-embedding-3-small 모델의 벡터 (1536차원) 저장 공간"
     )
+    embedding_dtype = models.CharField(
+        max_length=10,
+        choices=EMBEDDING_DTYPE_CHOICES,
+        default='float32',
+        help_text="embedding_vector 바이트의 저장 형식"
+    )
     
     class Meta:
         ordering = ['-pub_date']
@@ -55,6 +71,18 @@ class Book(models.Model):
     def __str__(self):
         return self.title
 
+    def get_embedding_array(self):
+        """저장된 임베딩을 복사 없이 NumPy 배열(읽기 전용)로 반환합니다. 없으면 None."""
+        if not self.embedding_vector:
+            return None
+        return decode_embedding(self.embedding_vector, self.embedding_dtype)
+
+    def set_embedding(self, vector, dtype=None):
+        """임베딩 벡터를 바이트로 변환해 필드에 담습니다. (저장은 호출하는 쪽에서 수행)"""
+        dtype = dtype or settings.EMBEDDING_STORAGE_DTYPE
+        self.embedding_vector = encode_embedding(vector, dtype)
+        self.embedding_dtype = dtype
+
 class Comment(models.Model):
     """도서에 대한 사용자 댓글/토크톡 모델"""
     # 어떤 책에 달린 댓글인지
@@ -104,4 +132,143 @@ class Library(models.Model):
         ordering = ['-created_at']
 
     def __str__(self):
-        return f"{self.user.username}의 서재 - {self.book.title}"
\ No newline at end of file
+        return f"{self.user.username}의 서재 - {self.book.title}"
+
+class SimilarBook(models.Model):
+    """임베딩 유사도로 미리 계산해 둔 도서별 유사 도서 목록 (build_similar_books 명령으로 생성)"""
+    source = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name='similar_books'
+    )
+    target = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    rank = models.PositiveSmallIntegerField()   # 1부터 시작하는 유사도 순위
+    score = models.FloatField()                 # 코사인 유사도
+
+    class Meta:
+        # (source, rank) 인덱스 하나로 추천 목록을 순서대로 조회합니다.
+        unique_together = ('source', 'rank')
+        ordering = ['source', 'rank']
+
+    def __str__(self):
+        return f"{self.source_id} → {self.target_id} ({self.rank}위)"
+
+
+class EmbeddingCache(models.Model):
+    """
+    임베딩 API 결과 캐시. (EMBEDDING_MODEL + 입력 텍스트)의 해시를 키로 사용하므로
+    같은 텍스트는 카탈로그를 다시 불러와도 API를 호출하지 않습니다.
+    """
+    key = models.CharField(max_length=64, unique=True)  # sha256 hex
+    model = models.CharField(max_length=100)
+    vector = models.BinaryField()                        # float32 바이트
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)  # LRU 삭제 기준
+
+    def __str__(self):
+        return f"{self.model}:{self.key[:12]}"
+
+
+class LLMResponseCache(models.Model):
+    """
+    LLM(Chat) 응답 캐시. (모델 + 시스템 메시지 + 프롬프트 + 응답 형식)의 해시를 키로 사용합니다.
+    호출 위치(call_site)마다 만료 시간(TTL)이 다르며, 최대 크기를 넘으면 오래 안 쓴 항목부터 삭제합니다.
+    """
+    key = models.CharField(max_length=64, unique=True)  # sha256 hex
+    model = models.CharField(max_length=100)
+    call_site = models.CharField(max_length=50, db_index=True)
+    response = models.TextField()
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)  # None = 만료 없음
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)   # LRU 삭제 기준
+
+    def __str__(self):
+        return f"{self.call_site}:{self.key[:12]}"
+
+
+class SingleFlight(models.Model):
+    """
+    여러 프로세스가 같은 비싼 계산(LLM 호출 등)을 동시에 하지 않도록 하는 잠금 + 마지막 결과 저장소.
+    (books/singleflight.py 에서 사용)
+    """
+    key = models.CharField(max_length=100, unique=True)
+    owner = models.CharField(max_length=64, blank=True)                # 계산 중인 프로세스/스레드 식별자
+    locked_until = models.DateTimeField(null=True, blank=True)         # None = 계산 중 아님, 지나면 잠금 만료
+    result = models.TextField(null=True, blank=True)                   # 마지막 계산 결과 (JSON)
+    updated_at = models.DateTimeField(null=True, blank=True)           # 결과가 저장된 시각
+
+    def __str__(self):
+        return f"{self.key} ({'계산 중' if self.locked_until else '대기'})"
+
+
+class PrecomputedRecommendation(models.Model):
+    """
+    메인 화면 추천 2권을 미리 계산해 둔 결과 (process_recommendation_jobs 명령 또는 실시간 생성 시 저장)
+    items: [{"book_id": ID, "reason": "추천사"}, ...] - 도서 정보는 응답할 때 DB에서 다시 읽습니다.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='precomputed_recommendation')
+    items = models.JSONField(default=list)
+    computed_at = models.DateTimeField()   # 결과가 계산된 시각 (신선도 판단 기준)
+
+    def __str__(self):
+        return f"{self.user_id}의 추천 ({self.computed_at:%Y-%m-%d %H:%M})"
+
+
+class RecommendationJob(models.Model):
+    """메인 화면 추천을 다시 계산할 사용자 작업 큐 (books/recommendation_queue.py)"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, '대기'),
+        (STATUS_RUNNING, '실행 중'),
+        (STATUS_DONE, '완료'),
+        (STATUS_FAILED, '실패'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendation_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    reason = models.CharField(max_length=30)            # 작업이 생긴 이유 ('profile', 'comment', 'active' 등)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # 이 시각부터 꺼낼 수 있습니다. (실패한 작업은 백오프만큼 뒤로 미룸)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # 시도할 때가 된 대기 작업을 순서대로 꺼냅니다.
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+        ordering = ['created_at']
+        constraints = [
+            # 사용자당 대기 중인 작업은 하나뿐입니다. (동시에 enqueue해도 중복되지 않음)
+            models.UniqueConstraint(
+                fields=['user'], condition=models.Q(status='pending'), name='unique_pending_recommendation_job',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} ({self.status}, {self.reason})"
+
+
+class DocentScript(models.Model):
+    """
+    도서별 도슨트 스크립트 (books/docent.py). 목소리와 관계없이 한 번 만든 스크립트로 음성을 합성하며,
+    도서 정보(description_hash)나 프롬프트 버전(prompt_version)이 바뀌었을 때만 LLM으로 다시 만듭니다.
+    스크립트의 유일한 저장소이며, 도서의 제목/저자/소개가 바뀌면 signals.py에서 삭제합니다.
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, related_name='docent_script')
+    text = models.TextField()
+    prompt_version = models.PositiveSmallIntegerField()
+    description_hash = models.CharField(max_length=64)   # sha256 hex (제목/저자/도서 소개)
+    updated_at = models.DateTimeField(auto_now=True)     # 스크립트를 마지막으로 만든 시각
+
+    def __str__(self):
+        return f"{self.book_id}의 도슨트 스크립트 (v{self.prompt_version})"
@@ -0,0 +1,137 @@
+# books/prompting.py
+"""
+LLM 프롬프트 크기 관리 도구입니다.
+
+- count_tokens(): 토큰 수를 로컬에서 셉니다. tiktoken이 설치되어 있으면 정확히, 없으면 보수적으로 추정합니다.
+- compact_table(): 후보 도서를 "id|제목|저자" 형태의 표로 만들어 JSON(indent)보다 훨씬 적은 토큰으로 전달합니다.
+- truncate_to_tokens(): 긴 필드(도서 소개 등)를 토큰 예산에 맞게 자릅니다.
+- record_usage()/stats(): 호출 위치별 프롬프트/응답 토큰 사용량 (MetricsView에서 노출)
+"""
+
+import re
+import threading
+
+from django.conf import settings
+
+try:
+    import tiktoken
+except ImportError:  # 선택 의존성: 없으면 추정치를 사용합니다.
+    tiktoken = None
+
+# gpt-4o / gpt-4o-mini 계열의 토크나이저
+TOKENIZER_ENCODING = 'o200k_base'
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {}  # {call_site: {'calls': n, 'prompt_tokens': n, 'completion_tokens': n}}
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _get_encoding():
+    global _encoding
+    if tiktoken is None:
+        return None
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+    return _encoding
+
+
+def count_tokens(text):
+    """
+    text의 토큰 수를 반환합니다.
+    tiktoken이 없으면 ASCII 4글자당 1토큰, 그 외(한글 등) 글자당 1토큰으로 넉넉하게 추정합니다.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def clean(value, max_chars=None):
+    """표 칸에 넣을 수 있도록 줄바꿈/구분자를 없애고, max_chars를 넘으면 잘라 '…'를 붙입니다."""
+    text = _WHITESPACE.sub(' ', str(value if value is not None else '')).replace('|', '/').strip()
+    if max_chars and len(text) > max_chars:
+        text = text[:max_chars - 1].rstrip() + '…'
+    return text
+
+
+def short_title(title, max_chars=None):
+    """'제목 - 부제' 형태의 도서 제목에서 부제를 떼고 max_chars(기본 LLM_PROMPT_TITLE_MAX_CHARS)로 자릅니다."""
+    max_chars = max_chars or settings.LLM_PROMPT_TITLE_MAX_CHARS
+    return clean((title or '').split(' - ', 1)[0], max_chars)
+
+
+def truncate_to_tokens(text, budget):
+    """text가 budget 토큰을 넘으면 앞부분만 남기고 '…'를 붙입니다."""
+    text = clean(text)
+    if count_tokens(text) <= budget:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text)[:budget]).rstrip() + '…'
+    # 추정치 모드: 비율로 자른 뒤 예산 안에 들어올 때까지 조금씩 줄입니다.
+    cut = int(len(text) * budget / count_tokens(text))
+    while cut > 0 and count_tokens(text[:cut]) > budget:
+        cut = int(cut * 0.9)
+    return text[:cut].rstrip() + '…'
+
+
+def compact_table(columns, rows, budget=None):
+    """
+    rows(튜플 목록)를 '|'로 구분한 표 문자열로 만듭니다. 첫 줄은 열 이름입니다.
+    budget(토큰)을 주면 예산을 넘기 전까지의 행만 넣습니다.
+    (표 문자열, 포함된 행 수)를 반환합니다.
+    """
+    lines = ['|'.join(columns)]
+    used = count_tokens(lines[0])
+    for row in rows:
+        line = '|'.join(clean(value) for value in row)
+        cost = count_tokens(line) + 1  # 줄바꿈
+        if budget is not None and used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    return '\n'.join(lines), len(lines) - 1
+
+
+def budget_for(call_site):
+    """호출 위치별 프롬프트 가변 부분(후보 표, 도서 소개 등)의 토큰 예산"""
+    budgets = settings.LLM_PROMPT_TOKEN_BUDGET
+    return budgets.get(call_site, budgets.get('default'))
+
+
+def record_usage(call_site, prompt_tokens, completion_tokens):
+    """LLM 호출 한 번의 토큰 사용량을 호출 위치별로 누적합니다."""
+    with _stats_lock:
+        site = _stats.setdefault(call_site, {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0})
+        site['calls'] += 1
+        site['prompt_tokens'] += prompt_tokens or 0
+        site['completion_tokens'] += completion_tokens or 0
+
+
+def record_response_usage(call_site, response, prompt_text=''):
+    """OpenAI 응답의 usage를 기록합니다. usage가 없으면 프롬프트 토큰을 로컬에서 센 값으로 대신합니다."""
+    usage = getattr(response, 'usage', None)
+    if usage is not None:
+        record_usage(call_site, usage.prompt_tokens, usage.completion_tokens)
+    else:
+        record_usage(call_site, count_tokens(prompt_text), 0)
+
+
+def stats():
+    """프로세스가 시작된 이후 호출 위치별 LLM 호출 수, 프롬프트/응답 토큰 합계와 호출당 평균"""
+    with _stats_lock:
+        sites = {name: dict(values) for name, values in _stats.items()}
+    for site in sites.values():
+        calls = site['calls']
+        site['avg_prompt_tokens'] = round(site['prompt_tokens'] / calls, 1) if calls else 0.0
+        site['avg_completion_tokens'] = round(site['completion_tokens'] / calls, 1) if calls else 0.0
+    return {'tokenizer': 'tiktoken' if tiktoken is not None else 'estimate', 'call_sites': sites}
@@ -0,0 +1,58 @@
+# books/quantization.py
+
+import numpy as np
+
+
+class Int8Index:
+    """
+    정규화된 임베딩을 벡터별 스케일을 가진 int8로 압축해 보관하는 인덱스입니다.
+
+    - 메모리: 차원당 1바이트 + 스케일 4바이트 (float32 대비 약 1/4, 기존 float64 리스트 대비 약 1/8)
+    - 1차 검색은 압축된 코드로 근사 점수를 계산하고, 상위 후보(shortlist)만 원본 정밀도 벡터로 다시 채점합니다.
+    """
+
+    def __init__(self, codes, scales):
+        self.codes = codes    # (N, D) int8
+        self.scales = scales  # (N,) float32, 원래 값 ≈ codes * scale
+
+    @classmethod
+    def quantize(cls, matrix):
+        """정규화된 float32 행렬을 (codes, scales)로 압축합니다."""
+        max_abs = np.abs(matrix).max(axis=1)
+        scales = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+        codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales
+
+    @classmethod
+    def build(cls, matrix):
+        codes, scales = cls.quantize(matrix)
+        return cls(codes, scales)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def bytes_per_vector(self):
+        return self.codes.shape[1] * self.codes.itemsize + self.scales.itemsize
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scales.nbytes
+
+    def scores(self, query, block_size=16384):
+        """
+        정규화된 쿼리와의 근사 코사인 유사도를 반환합니다.
+        query가 (Q, D) 행렬이면 (Q, N) 점수 행렬을 반환합니다.
+        블록 단위로 float32로 풀어 계산하므로 추가 메모리는 block_size x D 만큼만 사용합니다.
+        """
+        queries = np.atleast_2d(query)
+        scores = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), block_size):
+            block = self.codes[start:start + block_size].astype(np.float32)
+            scores[:, start:start + block_size] = (queries @ block.T) * self.scales[start:start + block_size]
+        return scores if np.ndim(query) == 2 else scores[0]
+
+    def dequantize(self, rows=None):
+        codes = self.codes if rows is None else self.codes[rows]
+        scales = self.scales if rows is None else self.scales[rows]
+        return codes.astype(np.float32) * scales[:, None]
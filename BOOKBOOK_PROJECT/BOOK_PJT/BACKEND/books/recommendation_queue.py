@@ -0,0 +1,205 @@
+# books/recommendation_queue.py
+"""
+메인 화면 추천 2권을 미리 계산해 두는 DB 작업 큐입니다.
+
+- enqueue(): 프로필(선호 장르/좋아하는 책)이나 댓글이 바뀌면 사용자 작업을 추가합니다.
+- process_recommendation_jobs 명령(워커)이 작업을 꺼내 LLM으로 추천을 만들고 PrecomputedRecommendation에 저장합니다.
+- RecommendationView는 저장된 결과를 바로 반환하고, 없을 때만 실시간으로 생성합니다.
+- 끝난 작업은 워커가 보관 기간(RECOMMENDATION_JOB_RETENTION)이 지나면 지웁니다. (prune_finished_jobs)
+
+SQLite에서도 동작하도록 SELECT ... FOR UPDATE SKIP LOCKED 대신 조건부 UPDATE로 작업을 가져갑니다.
+사용자당 대기 작업은 하나뿐이며(부분 유니크 제약), 실패한 작업은 next_attempt_at을 백오프만큼 미뤄 다른 작업 뒤로 보냅니다.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Book, PrecomputedRecommendation, RecommendationJob
+from .serializers import BookListSerializer
+from .utils import get_llm_recommendation
+
+
+def enqueue(user_id, reason):
+    """
+    사용자의 추천 재계산 작업을 추가하고 반환합니다. 이미 대기 중인 작업이 있으면 새로 만들지 않고 None.
+    (동시에 호출되어도 유니크 제약 때문에 대기 작업은 하나만 생깁니다.)
+    """
+    job, created = RecommendationJob.objects.get_or_create(
+        user_id=user_id, status=RecommendationJob.STATUS_PENDING, defaults={'reason': reason}
+    )
+    return job if created else None
+
+
+def invalidate(user_id, reason):
+    """
+    프로필이 바뀌어 저장된 추천을 더 이상 쓸 수 없을 때 삭제하고 재계산 작업을 추가합니다.
+    """
+    PrecomputedRecommendation.objects.filter(user_id=user_id).delete()
+    return enqueue(user_id, reason)
+
+
+def save_result(user, data):
+    """
+    RecommendationView.build_llm_result 형식의 추천 목록([{"book": {...}, "reason": ...}])을 저장합니다.
+    """
+    items = [{"book_id": item['book']['id'], "reason": item['reason']} for item in data]
+    PrecomputedRecommendation.objects.update_or_create(
+        user=user, defaults={'items': items, 'computed_at': timezone.now()}
+    )
+
+
+def get_precomputed(user):
+    """
+    저장된 추천을 응답 형식으로 반환합니다. 없거나 추천한 책이 삭제되었으면 None.
+    settings.PRECOMPUTED_RECOMMENDATION_MAX_AGE보다 오래된 결과는 그대로 반환하되 재계산 작업을 추가합니다.
+    """
+    stored = PrecomputedRecommendation.objects.filter(user=user).first()
+    if stored is None or not stored.items:
+        return None
+
+    books_map = Book.objects.select_related('category').in_bulk([item['book_id'] for item in stored.items])
+    if len(books_map) < len(stored.items):
+        return None
+
+    if timezone.now() - stored.computed_at > timedelta(seconds=settings.PRECOMPUTED_RECOMMENDATION_MAX_AGE):
+        enqueue(user.id, 'expired')
+
+    return [
+        {"book": BookListSerializer(books_map[item['book_id']]).data, "reason": item['reason']}
+        for item in stored.items
+    ]
+
+
+def _requeue(job, error='', delay=0):
+    """
+    작업을 delay초 뒤에 다시 꺼낼 수 있도록 대기 상태로 돌립니다. 돌려놓았으면 True.
+    같은 사용자의 대기 작업이 이미 있으면 그 작업이 다시 계산하므로 이 작업은 실패로 끝냅니다.
+    """
+    job.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+    try:
+        with transaction.atomic():
+            _finish(job, RecommendationJob.STATUS_PENDING, error)
+        return True
+    except IntegrityError:
+        _finish(job, RecommendationJob.STATUS_FAILED, error or '같은 사용자의 대기 작업으로 대체됨')
+        return False
+
+
+def recover_stale_jobs():
+    """워커가 죽어 오래 '실행 중'으로 남은 작업을 다시 대기 상태로 돌리고, 돌려놓은 수를 반환합니다."""
+    cutoff = timezone.now() - timedelta(seconds=settings.RECOMMENDATION_JOB_TIMEOUT)
+    stale = RecommendationJob.objects.filter(status=RecommendationJob.STATUS_RUNNING, started_at__lt=cutoff)
+    return sum(1 for job in stale if _requeue(job, job.last_error))
+
+
+def prune_finished_jobs():
+    """
+    보관 기간이 지난 완료/실패 작업을 삭제하고 삭제한 수를 반환합니다.
+    (작업은 프로필/댓글이 바뀔 때마다 쌓이므로 지우지 않으면 테이블이 계속 커집니다.)
+    """
+    now = timezone.now()
+    deleted, _ = RecommendationJob.objects.filter(
+        Q(status=RecommendationJob.STATUS_DONE,
+          finished_at__lt=now - timedelta(seconds=settings.RECOMMENDATION_JOB_RETENTION))
+        | Q(status=RecommendationJob.STATUS_FAILED,
+            finished_at__lt=now - timedelta(seconds=settings.RECOMMENDATION_FAILED_JOB_RETENTION))
+    ).delete()
+    return deleted
+
+
+def claim_next():
+    """
+    시도할 때가 된(next_attempt_at이 지난) 대기 작업 중 가장 먼저인 것을 '실행 중'으로 바꾸고 반환합니다. 없으면 None.
+    여러 워커가 동시에 실행되어도 같은 작업을 두 번 가져가지 않습니다.
+    """
+    while True:
+        job_id = (
+            RecommendationJob.objects.filter(
+                status=RecommendationJob.STATUS_PENDING, next_attempt_at__lte=timezone.now()
+            )
+            .order_by('next_attempt_at', 'created_at')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        claimed = RecommendationJob.objects.filter(id=job_id, status=RecommendationJob.STATUS_PENDING).update(
+            status=RecommendationJob.STATUS_RUNNING, started_at=timezone.now()
+        )
+        if claimed:
+            return RecommendationJob.objects.select_related('user').get(id=job_id)
+
+
+def _finish(job, status, error=''):
+    job.status = status
+    job.last_error = error
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'last_error', 'finished_at', 'attempts', 'next_attempt_at'])
+
+
+def process(job):
+    """
+    작업 하나를 실행합니다. 성공하면 True.
+    실패하면 RECOMMENDATION_JOB_MAX_ATTEMPTS번까지 다시 대기열에 넣되,
+    RECOMMENDATION_JOB_RETRY_BACKOFF초(실패할 때마다 두 배) 뒤에 꺼내지도록 미룹니다.
+    """
+    from .views import RecommendationView  # views가 이 모듈을 import하므로 순환 참조를 피합니다.
+
+    user = job.user
+    job.attempts += 1
+
+    # 작업이 생긴 뒤에 (실시간 생성 등으로) 이미 새 결과가 저장되었다면 건너뜁니다.
+    if PrecomputedRecommendation.objects.filter(user=user, computed_at__gte=job.created_at).exists():
+        _finish(job, RecommendationJob.STATUS_DONE)
+        return True
+
+    try:
+        prompt = RecommendationView.build_prompt(user)
+        llm_response_json = get_llm_recommendation(prompt, call_site='recommendation')
+        data, status_code = RecommendationView.build_llm_result(llm_response_json)
+        if status_code != 200:
+            raise ValueError(data.get('detail', 'LLM 추천 생성 실패'))
+        with transaction.atomic():
+            save_result(user, data)
+            _finish(job, RecommendationJob.STATUS_DONE)
+        return True
+
+    except Exception as e:
+        print(f"추천 작업 실패 (사용자 {user.id}, {job.attempts}회): {e}")
+        if job.attempts < settings.RECOMMENDATION_JOB_MAX_ATTEMPTS:
+            _requeue(job, str(e), delay=settings.RECOMMENDATION_JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1))
+        else:
+            _finish(job, RecommendationJob.STATUS_FAILED, str(e))
+        return False
+
+
+def enqueue_active_users(days):
+    """
+    최근 days일 안에 로그인했거나 댓글을 쓴 사용자 중, 저장된 추천이 없거나 오래된 사용자의 작업을 추가합니다.
+    추가한 작업 수를 반환합니다.
+    """
+    now = timezone.now()
+    since = now - timedelta(days=days)
+    fresh_after = now - timedelta(seconds=settings.PRECOMPUTED_RECOMMENDATION_MAX_AGE)
+    user_ids = (
+        get_user_model().objects
+        .filter(Q(last_login__gte=since) | Q(comment__created_at__gte=since))
+        .exclude(precomputed_recommendation__computed_at__gte=fresh_after)
+        .values_list('id', flat=True)
+        .distinct()
+    )
+    return sum(1 for user_id in user_ids if enqueue(user_id, 'active'))
+
+
+def stats():
+    """상태별 작업 수와 저장된 추천 수"""
+    counts = dict(RecommendationJob.objects.order_by().values_list('status').annotate(n=Count('id')))
+    return {
+        'jobs': {status: counts.get(status, 0) for status, _ in RecommendationJob.STATUS_CHOICES},
+        'precomputed': PrecomputedRecommendation.objects.count(),
+    }
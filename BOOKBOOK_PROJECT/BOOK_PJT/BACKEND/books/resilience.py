@@ -0,0 +1,289 @@
+# books/resilience.py
+"""
+GMS(채팅, 임베딩, TTS, STT) 호출을 장애로부터 보호합니다.
+
+- 서킷 브레이커: 의존성별로 연속 실패가 CIRCUIT_BREAKER_FAILURE_THRESHOLD번 쌓이면 열림(open) 상태가 되어,
+  CIRCUIT_BREAKER_RECOVERY_TIMEOUT초 동안은 호출하지 않고 바로 실패합니다. 그 뒤 한 번 시험 호출(half-open)해서
+  성공하면 다시 닫힙니다. GMS 장애 중에도 요청이 타임아웃까지 쌓이지 않고 즉시 대체 응답으로 넘어갑니다.
+- 데드라인: 재시도를 포함한 한 번의 호출 전체에 GMS_DEADLINES초의 상한을 둡니다.
+- 재시도: 타임아웃/연결 오류/429/5xx 같은 일시적 오류만 지터를 준 지수 백오프로 다시 시도합니다.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+import openai
+from django.conf import settings
+
+
+class GMSUnavailable(Exception):
+    """GMS 호출을 할 수 없거나 데드라인 안에 끝나지 않았습니다. (대체 응답으로 넘어가야 함)"""
+
+
+class CircuitOpenError(GMSUnavailable):
+    def __init__(self, dependency):
+        super().__init__(f"GMS {dependency} 서킷 브레이커가 열려 있습니다.")
+        self.dependency = dependency
+
+
+class DeadlineExceeded(GMSUnavailable):
+    def __init__(self, dependency):
+        super().__init__(f"GMS {dependency} 호출이 데드라인을 넘었습니다.")
+        self.dependency = dependency
+
+
+class TransientHTTPError(GMSUnavailable):
+    """429/5xx 응답 (다시 시도할 수 있는 오류)"""
+
+    def __init__(self, response):
+        super().__init__(f"GMS 응답 오류: {response.status_code}")
+        self.response = response
+
+
+_TRANSIENT_ERRORS = (
+    httpx.TimeoutException,
+    httpx.TransportError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    TransientHTTPError,
+)
+
+
+def is_transient(error):
+    return isinstance(error, _TRANSIENT_ERRORS)
+
+
+def _unavailable(dependency, error):
+    """재시도를 모두 써버린 일시적 오류를 GMSUnavailable로 바꿉니다. (429/5xx 응답은 그대로)"""
+    if isinstance(error, GMSUnavailable):
+        return error
+    unavailable = GMSUnavailable(f"GMS {dependency} 호출 실패: {error}")
+    unavailable.__cause__ = error
+    return unavailable
+
+
+def raise_for_transient_status(response):
+    """httpx 응답이 429/5xx이면 TransientHTTPError를 올립니다. (그 외 응답은 호출한 쪽에서 처리)"""
+    if response.status_code == 429 or response.status_code >= 500:
+        raise TransientHTTPError(response)
+    return response
+
+
+class CircuitBreaker:
+    """스레드 안전한 서킷 브레이커 (프로세스별 상태)"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold, recovery_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._stats = {'calls': 0, 'failures': 0, 'rejected': 0, 'retries': 0, 'opened': 0}
+
+    def allow(self):
+        """지금 호출해도 되는지 반환합니다. 열림 상태에서 복구 시간이 지났으면 시험 호출 하나만 허용합니다."""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.CLOSED:
+                self._stats['calls'] += 1
+                return True
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                self._stats['calls'] += 1
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._stats['failures'] += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._stats['opened'] += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def record_retry(self):
+        with self._lock:
+            self._stats['retries'] += 1
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def stats(self):
+        state = self.state
+        with self._lock:
+            return {'state': state, 'consecutive_failures': self._failures, **self._stats}
+
+
+_breakers_lock = threading.Lock()
+_breakers = {}
+
+_fallbacks_lock = threading.Lock()
+_fallbacks = {}  # {이름: 대체 응답 횟수}
+
+
+def get_breaker(dependency):
+    """'chat', 'embeddings', 'tts', 'stt' 등 의존성별 서킷 브레이커"""
+    with _breakers_lock:
+        breaker = _breakers.get(dependency)
+        if breaker is None:
+            breaker = _breakers[dependency] = CircuitBreaker(
+                dependency,
+                failure_threshold=settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                recovery_timeout=settings.CIRCUIT_BREAKER_RECOVERY_TIMEOUT,
+            )
+        return breaker
+
+
+def deadline_for(dependency):
+    deadlines = settings.GMS_DEADLINES
+    return deadlines.get(dependency, deadlines.get('default'))
+
+
+def _backoff(attempt):
+    """지터를 준 지수 백오프 (초)"""
+    base = settings.GMS_RETRY_BACKOFF * (2 ** (attempt - 1))
+    return random.uniform(0, base)
+
+
+def _timeout(remaining):
+    return httpx.Timeout(remaining, connect=min(settings.GMS_CONNECT_TIMEOUT, remaining))
+
+
+def call(dependency, fn, deadline=None, retries=None):
+    """
+    fn(timeout)을 dependency의 서킷 브레이커와 데드라인 아래에서 실행하고 결과를 반환합니다.
+    fn은 넘겨받은 timeout(httpx.Timeout)을 GMS 요청에 그대로 써야 합니다.
+    일시적 오류는 retries번까지 다시 시도하며, 호출할 수 없거나 데드라인 안에 성공하지 못하면 GMSUnavailable을 올립니다.
+    (429/5xx 응답으로 실패한 경우에는 마지막 응답을 담은 TransientHTTPError)
+    """
+    breaker = get_breaker(dependency)
+    retries = settings.GMS_RETRY_ATTEMPTS if retries is None else retries
+    expires = time.monotonic() + (deadline or deadline_for(dependency))
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise CircuitOpenError(dependency)
+        remaining = expires - time.monotonic()
+        if remaining <= 0:
+            breaker.record_failure()
+            raise DeadlineExceeded(dependency)
+        try:
+            result = fn(_timeout(remaining))
+        except Exception as e:
+            if not is_transient(e):
+                # GMS가 응답은 했으므로(4xx 등) 장애로 보지 않습니다.
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            attempt += 1
+            backoff = _backoff(attempt)
+            if attempt > retries or time.monotonic() + backoff >= expires:
+                raise _unavailable(dependency, e)
+            breaker.record_retry()
+            time.sleep(backoff)
+            continue
+        breaker.record_success()
+        return result
+
+
+async def acall(dependency, fn, deadline=None, retries=None):
+    """call()의 비동기 버전입니다. fn(timeout)은 코루틴을 반환해야 합니다."""
+    breaker = get_breaker(dependency)
+    retries = settings.GMS_RETRY_ATTEMPTS if retries is None else retries
+    expires = time.monotonic() + (deadline or deadline_for(dependency))
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            raise CircuitOpenError(dependency)
+        remaining = expires - time.monotonic()
+        if remaining <= 0:
+            breaker.record_failure()
+            raise DeadlineExceeded(dependency)
+        try:
+            result = await fn(_timeout(remaining))
+        except Exception as e:
+            if not is_transient(e):
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            attempt += 1
+            backoff = _backoff(attempt)
+            if attempt > retries or time.monotonic() + backoff >= expires:
+                raise _unavailable(dependency, e)
+            breaker.record_retry()
+            await asyncio.sleep(backoff)
+            continue
+        breaker.record_success()
+        return result
+
+
+@contextmanager
+def guard(dependency):
+    """
+    스트리밍 호출처럼 call()로 감쌀 수 없는 경우에 사용합니다. (재시도 없음)
+    with 블록에 들어갈 때 서킷 브레이커를 확인하고, 블록의 성공/실패를 기록합니다.
+    with 블록에는 (timeout)이 전달됩니다.
+    """
+    breaker = get_breaker(dependency)
+    if not breaker.allow():
+        raise CircuitOpenError(dependency)
+    try:
+        yield _timeout(deadline_for(dependency))
+    except (GeneratorExit, asyncio.CancelledError):
+        # 클라이언트가 스트리밍 도중 연결을 끊은 경우 (GMS 장애 아님, 비동기 스트리밍은 태스크 취소로 전달됨)
+        breaker.record_success()
+        raise
+    except Exception as e:
+        if not is_transient(e):
+            breaker.record_success()
+            raise
+        breaker.record_failure()
+        raise _unavailable(dependency, e)
+    breaker.record_success()
+
+
+def record_fallback(name):
+    """GMS 대신 대체 응답을 보낸 횟수를 기록합니다."""
+    with _fallbacks_lock:
+        _fallbacks[name] = _fallbacks.get(name, 0) + 1
+
+
+def stats():
+    """의존성별 서킷 브레이커 상태/호출/실패/거부/재시도 횟수와 대체 응답 횟수"""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    with _fallbacks_lock:
+        fallbacks = dict(_fallbacks)
+    return {
+        'breakers': {name: breaker.stats() for name, breaker in breakers.items()},
+        'fallbacks': fallbacks,
+    }
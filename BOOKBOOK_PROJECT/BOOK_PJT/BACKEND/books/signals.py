@@ -0,0 +1,73 @@
+# books/signals.py
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Book, DocentScript
+from .similarity import refresh_similar_books
+from .vector_index import embedding_index
+
+EMBEDDING_FIELDS = {'embedding_vector', 'embedding_dtype'}
+
+
+@receiver(post_save, sender=Book)
+def refresh_index_on_book_save(sender, instance, update_fields=None, **kwargs):
+    """임베딩이 저장(변경)되면 메모리 인덱스를 다시 로딩하도록 표시합니다."""
+    if update_fields is not None and not EMBEDDING_FIELDS & set(update_fields):
+        # 필터에 쓰는 속성만 바뀌었다면 메타데이터만 다시 읽습니다.
+        if {'category', 'is_bestseller', 'pub_date'} & set(update_fields):
+            embedding_index.invalidate_metadata()
+        return
+    embedding_index.invalidate()
+
+
+@receiver(pre_save, sender=Book)
+def detect_embedding_change(sender, instance, update_fields=None, raw=False, **kwargs):
+    """저장 전 DB 값과 비교해 임베딩이 실제로 바뀌는지 표시해 둡니다. (유사 도서 목록 갱신 여부 판단)"""
+    instance._embedding_changed = False
+    if raw or (update_fields is not None and not EMBEDDING_FIELDS & set(update_fields)):
+        return
+    previous = None
+    if instance.pk is not None:
+        previous = Book.objects.filter(pk=instance.pk).values_list('embedding_vector', 'embedding_dtype').first()
+    if previous is None:
+        instance._embedding_changed = bool(instance.embedding_vector)
+        return
+    vector, dtype = previous
+    instance._embedding_changed = (
+        bytes(vector or b'') != bytes(instance.embedding_vector or b'') or dtype != instance.embedding_dtype
+    )
+
+
+def _refresh_similar_books(book_id):
+    try:
+        refresh_similar_books([book_id])
+    except Exception as e:
+        # 저장은 이미 끝났으므로 실패해도 요청을 실패시키지 않습니다. (build_similar_books 명령으로 다시 맞출 수 있음)
+        print(f"유사 도서 목록 갱신 실패 (book {book_id}): {e}")
+
+
+@receiver(post_save, sender=Book)
+def refresh_similar_books_on_embedding_change(sender, instance, **kwargs):
+    """임베딩이 바뀐 도서와 그 영향을 받는 유사 도서 목록을 커밋 후에 다시 계산합니다."""
+    if not getattr(instance, '_embedding_changed', False):
+        return
+    instance._embedding_changed = False
+    book_id = instance.pk
+    transaction.on_commit(lambda: _refresh_similar_books(book_id))
+
+
+@receiver(post_save, sender=Book)
+def invalidate_docent_script_on_book_save(sender, instance, created=False, update_fields=None, **kwargs):
+    """제목/저자/소개가 바뀌면 예전 내용으로 만든 도슨트 스크립트를 지웁니다. (다음 요청이 새로 만듭니다)"""
+    if created or (update_fields is not None and not {'title', 'author', 'description'} & set(update_fields)):
+        return
+    from .docent import description_hash
+    DocentScript.objects.filter(book_id=instance.pk).exclude(description_hash=description_hash(instance)).delete()
+
+
+@receiver(post_delete, sender=Book)
+def refresh_index_on_book_delete(sender, instance, **kwargs):
+    if instance.embedding_vector:
+        embedding_index.invalidate()
@@ -0,0 +1,102 @@
+# books/similarity.py
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .models import SimilarBook
+from .vector_index import embedding_index
+
+
+def _similar_blocks(source_ids, top_n, block_size):
+    """
+    source_ids를 block_size개씩 나눠 각 도서의 (자기 자신을 제외한) 유사도 상위 top_n을 계산합니다.
+    한 번에 block_size x N 크기의 점수 행렬만 만들기 때문에 전체 N x N 행렬을 메모리에 올리지 않으며,
+    int8 모드에서는 검색과 같이 근사 점수 상위 후보를 원본 정밀도 벡터로 다시 채점합니다. (EmbeddingIndex.search_many)
+    """
+    for start in range(0, len(source_ids), block_size):
+        yield embedding_index.search_many(
+            source_ids[start:start + block_size], k=top_n, block_size=block_size, use_ann=False
+        )
+
+
+def _write_blocks(blocks):
+    """블록 단위로 기존 목록을 지우고 새 목록을 bulk_create 합니다. 저장한 source 수를 반환합니다."""
+    written = 0
+    for results in blocks:
+        objs = [
+            SimilarBook(
+                source_id=source_id,
+                target_id=target_id,
+                rank=rank,
+                score=score,
+            )
+            for source_id, similar in results.items()
+            for rank, (target_id, score) in enumerate(similar, start=1)
+        ]
+        with transaction.atomic():
+            SimilarBook.objects.filter(source_id__in=list(results)).delete()
+            SimilarBook.objects.bulk_create(objs, batch_size=2000)
+        written += len(results)
+    return written
+
+
+def rebuild_similar_books(top_n=None, block_size=None):
+    """임베딩이 있는 모든 도서의 유사 도서 목록을 다시 계산합니다."""
+    top_n = top_n or settings.SIMILAR_BOOKS_TOP_N
+    block_size = block_size or settings.SIMILAR_BOOKS_BLOCK_SIZE
+
+    ids = embedding_index.book_ids()
+    written = _write_blocks(_similar_blocks(ids.tolist(), top_n, block_size))
+
+    # 임베딩이 사라진 도서의 목록은 정리합니다.
+    SimilarBook.objects.filter(source__embedding_vector__isnull=True).delete()
+    return written
+
+
+def refresh_similar_books(book_ids, top_n=None, block_size=None):
+    """
+    임베딩이 새로 생기거나 바뀐 book_ids에 영향을 받는 목록만 다시 계산합니다.
+
+    다시 계산하는 source:
+    1. book_ids 자신
+    2. 기존 목록에 book_ids 중 하나가 들어 있던 도서 (점수가 바뀌었을 수 있음)
+    3. book_ids 중 하나와의 유사도가 기존 목록의 마지막(top_n위) 점수보다 높은 도서
+    """
+    top_n = top_n or settings.SIMILAR_BOOKS_TOP_N
+    block_size = block_size or settings.SIMILAR_BOOKS_BLOCK_SIZE
+    book_ids = [int(book_id) for book_id in book_ids]
+    if not book_ids:
+        return 0
+
+    # 각 도서와 book_ids 중 가장 가까운 도서와의 유사도 (id 배열도 같은 시점의 것을 사용)
+    ids, best = embedding_index.max_scores(book_ids, block_size=block_size)
+    if len(ids) == 0:
+        return 0
+
+    positions = np.searchsorted(ids, book_ids)
+    positions = np.clip(positions, 0, len(ids) - 1)
+    changed_rows = np.unique(positions[ids[positions] == book_ids])
+
+    affected = np.zeros(len(ids), dtype=bool)
+    affected[changed_rows] = True
+
+    previous_sources = SimilarBook.objects.filter(target_id__in=book_ids).values_list('source_id', flat=True)
+    previous_sources = np.fromiter(previous_sources, dtype=np.int64)
+    affected |= np.isin(ids, previous_sources)
+
+    if len(changed_rows):
+        # 각 source의 현재 top_n위 점수 (목록이 top_n보다 짧으면 -inf → 무조건 다시 계산)
+        thresholds = np.full(len(ids), -np.inf, dtype=np.float32)
+        last = SimilarBook.objects.filter(rank=top_n).values_list('source_id', 'score')
+        for source_id, score in last.iterator(chunk_size=5000):
+            pos = int(np.searchsorted(ids, source_id))
+            if pos < len(ids) and ids[pos] == source_id:
+                thresholds[pos] = score
+
+        affected |= best > thresholds
+
+    # 임베딩이 없어진 도서의 목록은 삭제합니다.
+    SimilarBook.objects.filter(source_id__in=book_ids, source__embedding_vector__isnull=True).delete()
+
+    return _write_blocks(_similar_blocks(ids[affected].tolist(), top_n, block_size))
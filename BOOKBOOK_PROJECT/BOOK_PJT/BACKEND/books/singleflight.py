@@ -0,0 +1,234 @@
+# books/singleflight.py
+"""
+같은 키의 비싼 계산(LLM 호출 등)을 여러 요청이 동시에 하지 않도록 합니다. (single-flight)
+
+- 같은 프로세스의 다른 스레드: threading.Event로 먼저 시작한 요청(리더)의 결과를 기다립니다.
+- 다른 프로세스: SingleFlight 행을 잠금으로 사용하고, 잠금이 풀릴 때까지 DB를 폴링합니다.
+- stale=True이고 이전에 계산한 결과가 있으면, 기다리지 않고 그 결과(스냅샷)를 바로 반환합니다.
+  스냅샷이 SINGLE_FLIGHT_MAX_STALENESS보다 오래되었으면 쓰지 않고 새 결과를 기다리거나 직접 계산합니다.
+- store=False이면 SingleFlight 행을 잠금으로만 쓰고 결과를 저장하지 않습니다. (결과를 따로 저장하는 도슨트 스크립트 등)
+  다른 프로세스의 잠금이 풀리면 compute()를 다시 호출하므로, compute는 저장된 결과를 먼저 찾아야 합니다.
+
+기다리다 시간이 초과되거나 DB 잠금을 쓸 수 없으면 직접 계산하므로, 최악의 경우에도 기존 동작과 같습니다.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import SingleFlight
+
+_MISSING = object()
+
+
+class _Call:
+    """프로세스 안에서 진행 중인 계산 하나"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls_lock = threading.Lock()
+_calls = {}  # {key: _Call}
+
+_stats_lock = threading.Lock()
+_stats = {}  # {key 앞부분: {'computed': n, 'waited': n, 'stale': n, 'timeout': n}}
+
+
+def _count(key, name):
+    # 'docent:12' 처럼 대상별로 나뉜 키는 앞부분('docent')으로 묶어 집계합니다.
+    with _stats_lock:
+        site = _stats.setdefault(key.split(':', 1)[0], {'computed': 0, 'waited': 0, 'stale': 0, 'timeout': 0})
+        site[name] += 1
+
+
+def _load(raw, updated_at, max_staleness):
+    """저장된 결과를 읽습니다. 없거나 max_staleness초보다 오래되었으면 _MISSING"""
+    if raw is None:
+        return _MISSING
+    if max_staleness is not None and (
+        updated_at is None or updated_at < timezone.now() - timedelta(seconds=max_staleness)
+    ):
+        return _MISSING
+    return json.loads(raw)
+
+
+def _max_staleness(max_staleness):
+    return max_staleness if max_staleness is not None else settings.SINGLE_FLIGHT_MAX_STALENESS
+
+
+def _snapshot(key, max_staleness=None):
+    """마지막으로 저장된 결과. 없거나 너무 오래되었거나 DB를 읽을 수 없으면 _MISSING"""
+    try:
+        row = SingleFlight.objects.filter(key=key).values_list('result', 'updated_at').first()
+    except DatabaseError:
+        return _MISSING
+    if row is None:
+        return _MISSING
+    return _load(*row, _max_staleness(max_staleness))
+
+
+def _try_lock(key, owner, lock_ttl):
+    """잠금이 비어 있거나 만료되었으면 가져옵니다. 가져오면 True."""
+    now = timezone.now()
+    SingleFlight.objects.get_or_create(key=key)
+    updated = (
+        SingleFlight.objects.filter(key=key)
+        .filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now))
+        .update(owner=owner, locked_until=now + timedelta(seconds=lock_ttl))
+    )
+    return updated == 1
+
+
+def _release(key, owner, result=_MISSING):
+    fields = {'owner': '', 'locked_until': None}
+    if result is not _MISSING and result is not None:
+        fields.update(result=json.dumps(result, ensure_ascii=False), updated_at=timezone.now())
+    try:
+        SingleFlight.objects.filter(key=key, owner=owner).update(**fields)
+    except DatabaseError as e:
+        print(f"single-flight 잠금 해제 실패 ({key}): {e}")
+
+
+def _wait_for_release(key, wait_timeout):
+    """다른 프로세스가 잠금을 풀 때까지 기다렸다가 그때의 행을 반환합니다. 시간이 초과되거나 행이 없으면 None."""
+    deadline = time.monotonic() + wait_timeout
+    while time.monotonic() < deadline:
+        time.sleep(settings.SINGLE_FLIGHT_POLL_INTERVAL)
+        row = SingleFlight.objects.filter(key=key).values('locked_until', 'result', 'updated_at').first()
+        if row is None:
+            return None
+        if row['locked_until'] is None or row['locked_until'] < timezone.now():
+            return row
+    return None
+
+
+def _wait_for_other_process(key, wait_timeout):
+    """
+    다른 프로세스가 잠금을 풀 때까지 기다렸다가 새로 저장된 결과를 반환합니다.
+    시간이 초과되거나 리더가 결과 없이 끝났으면 _MISSING.
+    """
+    started = SingleFlight.objects.filter(key=key).values_list('updated_at', flat=True).first()
+    row = _wait_for_release(key, wait_timeout)
+    if row is None or row['updated_at'] == started:
+        return _MISSING
+    return _load(row['result'], row['updated_at'], settings.SINGLE_FLIGHT_MAX_STALENESS)
+
+
+def _lead(key, compute, stale, wait_timeout, lock_ttl, store, max_staleness):
+    owner = f"{os.getpid()}:{uuid.uuid4().hex[:12]}"
+    try:
+        locked = _try_lock(key, owner, lock_ttl)
+    except DatabaseError as e:
+        print(f"single-flight 잠금 실패 ({key}), 직접 계산합니다: {e}")
+        _count(key, 'computed')
+        return compute()
+
+    if not locked:
+        # 다른 프로세스가 계산 중
+        if not store:
+            # 결과는 compute가 따로 저장하므로, 잠금이 풀리면 compute가 저장된 결과를 읽어 옵니다.
+            try:
+                released = _wait_for_release(key, wait_timeout) is not None
+            except DatabaseError:
+                released = False
+            _count(key, 'waited' if released else 'timeout')
+            return compute()
+        if stale:
+            snapshot = _snapshot(key, max_staleness)
+            if snapshot is not _MISSING:
+                _count(key, 'stale')
+                return snapshot
+        try:
+            result = _wait_for_other_process(key, wait_timeout)
+        except DatabaseError:
+            result = _MISSING
+        if result is not _MISSING:
+            _count(key, 'waited')
+            return result
+        _count(key, 'timeout')
+        _count(key, 'computed')
+        return compute()
+
+    _count(key, 'computed')
+    try:
+        result = compute()
+    except Exception:
+        _release(key, owner)
+        raise
+    _release(key, owner, result if store else _MISSING)
+    return result
+
+
+def run(key, compute, stale=True, wait_timeout=None, lock_ttl=None, store=True, max_staleness=None):
+    """
+    key에 해당하는 계산을 프로세스/스레드를 통틀어 한 번만 실행하고 그 결과를 반환합니다.
+
+    compute: 인자 없는 함수. 반환값은 JSON으로 직렬화할 수 있어야 하며, None은 실패로 보고 저장하지 않습니다.
+    stale: 다른 요청이 계산 중일 때 이전 결과가 있으면 기다리지 않고 이전 결과를 반환할지 여부
+    max_staleness: stale로 반환할 이전 결과의 최대 나이(초). 기본값은 settings.SINGLE_FLIGHT_MAX_STALENESS
+    wait_timeout: 다른 요청의 결과를 기다릴 최대 시간(초). 넘으면 직접 계산합니다.
+    lock_ttl: DB 잠금 유지 시간(초). 계산하던 프로세스가 죽어도 이 시간이 지나면 다른 요청이 가져갑니다.
+    store: False면 결과를 SingleFlight 행에 저장하지 않고 잠금으로만 씁니다. (stale도 쓰지 않음)
+    """
+    stale = stale and store
+    wait_timeout = wait_timeout if wait_timeout is not None else settings.SINGLE_FLIGHT_WAIT_TIMEOUT
+    lock_ttl = lock_ttl if lock_ttl is not None else settings.SINGLE_FLIGHT_LOCK_TTL
+
+    with _calls_lock:
+        call = _calls.get(key)
+        is_leader = call is None
+        if is_leader:
+            call = _calls[key] = _Call()
+
+    if not is_leader:
+        # 같은 프로세스의 다른 스레드가 계산 중
+        if stale:
+            snapshot = _snapshot(key, max_staleness)
+            if snapshot is not _MISSING:
+                _count(key, 'stale')
+                return snapshot
+        if call.event.wait(wait_timeout):
+            _count(key, 'waited')
+            if call.error is not None:
+                raise call.error
+            return call.result
+        _count(key, 'timeout')
+        _count(key, 'computed')
+        return compute()
+
+    try:
+        call.result = _lead(key, compute, stale, wait_timeout, lock_ttl, store, max_staleness)
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            _calls.pop(key, None)
+        call.event.set()
+
+
+def snapshot(key, max_staleness=None):
+    """
+    key로 마지막에 저장된 결과를 반환합니다. 없거나 max_staleness초(기본값 SINGLE_FLIGHT_MAX_STALENESS)보다
+    오래되었으면 None. (계산에 실패했을 때의 대체 응답용)
+    """
+    result = _snapshot(key, max_staleness)
+    return None if result is _MISSING else result
+
+
+def stats():
+    """프로세스가 시작된 이후 키(앞부분)별 직접 계산/대기/이전 결과 반환/대기 시간 초과 횟수"""
+    with _stats_lock:
+        return {key: dict(values) for key, values in _stats.items()}
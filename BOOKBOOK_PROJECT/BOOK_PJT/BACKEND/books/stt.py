@@ -0,0 +1,252 @@
+# books/stt.py
+"""
+음성 댓글(STT) 업로드 처리입니다.
+
+- 업로드: CappedUploadHandler가 업로드를 메모리에 올리지 않고 조각 단위로 임시 파일에 쓰며,
+  STT_UPLOAD_MAX_BYTES를 넘으면 더 받지 않고 413으로 응답합니다. (긴 음성이 워커 메모리를 늘리지 않음)
+- 전처리: ffmpeg가 있으면 모노 / 16kHz / Opus(STT_TRANSCODE_BITRATE)로 다시 인코딩해 Whisper로 보낼 크기를 줄이고,
+  STT_MAX_DURATION_SECONDS보다 긴 음성은 거절합니다. ffmpeg가 없거나 변환에 실패하면 원본을 그대로 보냅니다.
+- 전송: 임시 파일을 열어 그대로 넘기므로, multipart 본문을 파일에서 조각 단위로 읽어 보냅니다.
+- stats(): Whisper로 보낸 음성의 원본/전송 바이트(절약률), 변환/전사 시간 (MetricsView)
+"""
+
+import io
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+
+from .async_clients import async_transcribe
+from .utils import transcribe
+
+# multipart 경계/헤더와 다른 필드에 허용할 여유 (Content-Length로 미리 거절할 때 사용)
+_MULTIPART_OVERHEAD = 64 * 1024
+
+_OUT_TIME = re.compile(r'out_time_us=(\d+)')
+
+_stats_lock = threading.Lock()
+_stats = {
+    'uploads': 0, 'rejected_size': 0, 'rejected_duration': 0, 'transcoded': 0, 'passthrough': 0,
+    'upload_bytes': 0, 'upstream_bytes': 0, 'audio_seconds': 0.0,
+    'transcode_seconds': 0.0, 'transcriptions': 0, 'transcribe_seconds': 0.0, 'max_transcribe_seconds': 0.0,
+}
+_warned_missing_ffmpeg = False
+
+
+class AudioRejected(Exception):
+    """업로드한 음성이 크기/길이 제한을 넘은 경우 (뷰에서 413으로 응답)"""
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+class CappedUploadHandler(TemporaryFileUploadHandler):
+    """
+    업로드 파일을 항상 임시 파일로 받고, 전체 크기가 max_bytes를 넘으면 받기를 멈춥니다.
+    Content-Length가 이미 상한을 넘으면 본문을 파싱하지 않고, 모르는 경우(chunked)에는 받는 도중에 버립니다.
+    거절했는지는 upload_too_large(request)로 확인합니다.
+    """
+
+    def __init__(self, request=None, max_bytes=None):
+        super().__init__(request)
+        self.max_bytes = settings.STT_UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+        self.received = 0
+
+    def _reject(self):
+        self.request.stt_upload_too_large = True
+        _count('rejected_size')
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length and content_length > self.max_bytes + _MULTIPART_OVERHEAD:
+            self._reject()
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_bytes:
+            self._reject()
+            raise SkipFile()  # 임시 파일은 닫히면서 삭제됩니다.
+        return super().receive_data_chunk(raw_data, start)
+
+
+def install_upload_handler(request):
+    """request(Django HttpRequest)의 업로드를 CappedUploadHandler로 받도록 합니다. 본문을 읽기 전에 호출해야 합니다."""
+    request.upload_handlers = [CappedUploadHandler(request)]
+
+
+def upload_too_large(request):
+    return getattr(request, 'stt_upload_too_large', False)
+
+
+class PreparedAudio:
+    """Whisper로 보낼 음성 파일. close()하면 열린 파일과 변환 결과 임시 파일을 정리합니다."""
+
+    def __init__(self, name, file, content_type, size, cleanup_path=None):
+        self.name = name
+        self.file = file
+        self.content_type = content_type
+        self.size = size
+        self._cleanup_path = cleanup_path
+
+    def close(self):
+        self.file.close()
+        if self._cleanup_path:
+            try:
+                os.unlink(self._cleanup_path)
+            except OSError:
+                pass
+
+
+def _ffmpeg():
+    global _warned_missing_ffmpeg
+    path = shutil.which(settings.STT_FFMPEG_BINARY)
+    if path is None and not _warned_missing_ffmpeg:
+        _warned_missing_ffmpeg = True
+        print(f"STT 전처리 건너뜀: ffmpeg({settings.STT_FFMPEG_BINARY})를 찾을 수 없어 원본을 그대로 보내며, 길이 제한도 적용하지 않습니다.")
+    return path
+
+
+def _run_ffmpeg(ffmpeg, args):
+    """ffmpeg를 실행하고 처리한 길이(초)를 반환합니다. (진행 상황 출력의 마지막 out_time, 알 수 없으면 None)"""
+    result = subprocess.run(
+        [ffmpeg, '-hide_banner', '-nostdin', '-nostats', '-loglevel', 'error', '-progress', 'pipe:1', '-y', *args],
+        capture_output=True, text=True, timeout=settings.STT_TRANSCODE_TIMEOUT,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip()[-300:])
+    times = _OUT_TIME.findall(result.stdout)
+    return int(times[-1]) / 1_000_000 if times else None
+
+
+def _probe_duration(ffmpeg, source_path):
+    """디코딩 없이 오디오 패킷만 훑어 길이(초)를 잽니다. (5분 음성도 0.1초 남짓, 브라우저 녹음 webm처럼 길이 정보가 없어도 동작)"""
+    return _run_ffmpeg(ffmpeg, ['-i', source_path, '-map', '0:a:0', '-c', 'copy', '-f', 'null', '-'])
+
+
+def _transcode(ffmpeg, source_path, target_path):
+    """source를 모노/16kHz/Opus(ogg)로 변환하고 변환된 길이(초)를 반환합니다. (길이를 알 수 없으면 None)"""
+    return _run_ffmpeg(ffmpeg, [
+        '-i', source_path,
+        # 길이를 잴 수 없었던 입력도 제한보다 조금 더 길게만 변환합니다.
+        '-t', str(settings.STT_MAX_DURATION_SECONDS + 1),
+        # 음성 인식용이므로 말소리에 맞춘 모드(voip)와 중간 복잡도로 빠르게 인코딩합니다.
+        '-vn', '-ac', '1', '-ar', '16000',
+        '-c:a', 'libopus', '-b:a', settings.STT_TRANSCODE_BITRATE, '-application', 'voip', '-compression_level', '5',
+        '-f', 'ogg', target_path,
+    ])
+
+
+def _original(uploaded):
+    if hasattr(uploaded, 'temporary_file_path'):
+        file = open(uploaded.temporary_file_path(), 'rb')
+    else:  # 직접 만든 요청 등 메모리 업로드 (이미 메모리에 있음)
+        file = io.BytesIO(uploaded.read())
+    _count('passthrough')
+    _count('upload_bytes', uploaded.size)
+    _count('upstream_bytes', uploaded.size)
+    return PreparedAudio(uploaded.name, file, uploaded.content_type, uploaded.size)
+
+
+def _reject_duration():
+    _count('rejected_duration')
+    raise AudioRejected(f"음성은 {settings.STT_MAX_DURATION_SECONDS}초까지 올릴 수 있습니다.")
+
+
+def prepare(uploaded):
+    """
+    업로드한 음성을 Whisper로 보낼 형태로 준비합니다. (ffmpeg 변환은 CPU를 쓰므로 비동기 뷰에서는 스레드에서 호출)
+    STT_MAX_DURATION_SECONDS보다 길면 AudioRejected를 올립니다.
+    """
+    _count('uploads')
+
+    ffmpeg = _ffmpeg() if settings.STT_TRANSCODE else None
+    if ffmpeg is None or not hasattr(uploaded, 'temporary_file_path'):
+        return _original(uploaded)
+
+    source_path = uploaded.temporary_file_path()
+    try:
+        duration = _probe_duration(ffmpeg, source_path)
+    except (OSError, RuntimeError, subprocess.TimeoutExpired):
+        duration = None  # 변환 결과로 다시 확인합니다.
+    if duration is not None and duration > settings.STT_MAX_DURATION_SECONDS:
+        _reject_duration()
+
+    fd, target_path = tempfile.mkstemp(suffix='.ogg')
+    os.close(fd)
+    started = time.perf_counter()
+    try:
+        duration = _transcode(ffmpeg, source_path, target_path)
+    except (OSError, RuntimeError, subprocess.TimeoutExpired) as e:
+        os.unlink(target_path)
+        print(f"STT 전처리 실패, 원본 전송: {str(e)}")
+        return _original(uploaded)
+    _count('transcode_seconds', time.perf_counter() - started)
+    if duration is not None and duration > settings.STT_MAX_DURATION_SECONDS:  # 미리 길이를 잴 수 없었던 입력
+        os.unlink(target_path)
+        _reject_duration()
+
+    size = os.path.getsize(target_path)
+    _count('transcoded')
+    _count('upload_bytes', uploaded.size)
+    _count('upstream_bytes', size)
+    _count('audio_seconds', duration or 0.0)
+    name = f"{os.path.splitext(uploaded.name or 'audio')[0]}.ogg"
+    return PreparedAudio(name, open(target_path, 'rb'), 'audio/ogg', size, cleanup_path=target_path)
+
+
+def _record_transcription(elapsed):
+    with _stats_lock:
+        _stats['transcriptions'] += 1
+        _stats['transcribe_seconds'] += elapsed
+        _stats['max_transcribe_seconds'] = max(_stats['max_transcribe_seconds'], elapsed)
+
+
+def transcribe_upload(uploaded):
+    """업로드한 음성을 전처리한 뒤 Whisper로 텍스트로 변환합니다. (SpeechToTextView)"""
+    audio = prepare(uploaded)
+    try:
+        started = time.perf_counter()
+        text = transcribe(audio.name, audio.file, audio.content_type)
+        _record_transcription(time.perf_counter() - started)
+        return text
+    finally:
+        audio.close()
+
+
+async def atranscribe_upload(uploaded):
+    """transcribe_upload()의 비동기 버전. ffmpeg 변환은 요청마다 별도 스레드에서 실행합니다."""
+    audio = await sync_to_async(prepare, thread_sensitive=False)(uploaded)
+    try:
+        started = time.perf_counter()
+        text = await async_transcribe(audio.name, audio.file, audio.content_type)
+        _record_transcription(time.perf_counter() - started)
+        return text
+    finally:
+        audio.close()
+
+
+def stats():
+    """프로세스가 시작된 이후 업로드/전송 바이트와 절약률, 평균 변환/전사 시간"""
+    with _stats_lock:
+        data = dict(_stats)
+    data['saved_bytes'] = max(data['upload_bytes'] - data['upstream_bytes'], 0)
+    data['saved_ratio'] = round(data['saved_bytes'] / data['upload_bytes'], 4) if data['upload_bytes'] else 0.0
+    converted = data['transcoded']
+    data['avg_transcode_ms'] = round(data['transcode_seconds'] / converted * 1000, 1) if converted else 0.0
+    calls = data['transcriptions']
+    data['avg_transcribe_ms'] = round(data['transcribe_seconds'] / calls * 1000, 1) if calls else 0.0
+    for name in ('audio_seconds', 'transcode_seconds', 'transcribe_seconds', 'max_transcribe_seconds'):
+        data[name] = round(data[name], 3)
+    return data
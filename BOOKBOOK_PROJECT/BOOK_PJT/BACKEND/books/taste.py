@@ -0,0 +1,267 @@
+# books/taste.py
+
+import json
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from .models import Book, Category, Comment, Library
+from .serializers import BookListSerializer
+from .utils import decode_embedding, encode_embedding, get_embedding, get_llm_recommendation
+from .vector_index import embedding_index, fetch_exact_vectors
+
+User = get_user_model()
+
+
+def comment_weight(rating):
+    """댓글 평점(1~5)을 취향 벡터 가중치로 바꿉니다. 평점이 높을수록 취향에 크게 반영됩니다."""
+    return max(0, min(int(rating or 0), 5)) / 5 * settings.TASTE_COMMENT_WEIGHT
+
+
+def _book_vectors(book_ids):
+    """도서들의 정규화된 임베딩을 {book_id: 벡터}로 반환합니다. (메모리 인덱스 우선)"""
+    if settings.EMBEDDING_INDEX_QUANTIZATION == 'int8':
+        # int8 모드에서는 인덱스에 원본 벡터가 없으므로 DB에서 한 번에 읽습니다.
+        return fetch_exact_vectors(book_ids)
+    vectors = {}
+    missing = []
+    for book_id in book_ids:
+        vector = embedding_index.get_vector(book_id)
+        if vector is None:
+            missing.append(book_id)
+        else:
+            vectors[book_id] = vector
+    if missing:
+        vectors.update(fetch_exact_vectors(missing))
+    return vectors
+
+
+def get_taste_vector(user):
+    """저장된 취향 벡터를 정규화해 반환합니다. 아직 반영된 도서가 없으면 None."""
+    if not user.taste_vector or user.taste_weight <= 0:
+        return None
+    vector = decode_embedding(user.taste_vector).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+
+def apply_taste_delta(user, weights):
+    """
+    {book_id: 가중치 변화량}만큼 사용자의 취향 벡터(가중합)를 증분 갱신합니다.
+    전체 서재/댓글을 다시 읽지 않고 바뀐 도서의 임베딩만 더하거나 뺍니다.
+    """
+    weights = {book_id: weight for book_id, weight in weights.items() if weight}
+    if not weights:
+        return
+    vectors = _book_vectors(list(weights))
+    if not vectors:
+        return
+
+    with transaction.atomic():
+        # 동시에 들어온 댓글 요청이 서로의 갱신을 덮어쓰지 않도록 행을 잠급니다.
+        locked = User.objects.select_for_update().only('taste_vector', 'taste_weight').get(pk=user.pk)
+        dim = len(next(iter(vectors.values())))
+        total = np.zeros(dim, dtype=np.float32)
+        if locked.taste_vector:
+            current = decode_embedding(locked.taste_vector)
+            if len(current) == dim:
+                total += current
+        total_weight = locked.taste_weight
+
+        for book_id, vector in vectors.items():
+            total += weights[book_id] * vector
+            total_weight += weights[book_id]
+
+        # 모두 빠졌다면 부동소수점 오차가 남지 않도록 비웁니다.
+        if total_weight <= 1e-6:
+            locked.taste_vector, locked.taste_weight = None, 0
+        else:
+            locked.taste_vector, locked.taste_weight = encode_embedding(total), total_weight
+        locked.save(update_fields=['taste_vector', 'taste_weight'])
+
+    user.taste_vector, user.taste_weight = locked.taste_vector, locked.taste_weight
+
+
+def rebuild_taste_vector(user):
+    """서재와 댓글 전체로 취향 벡터를 처음부터 다시 계산합니다. (임베딩 재생성 후 등)"""
+    weights = {}
+    for book_id in Library.objects.filter(user=user).values_list('book_id', flat=True):
+        weights[book_id] = weights.get(book_id, 0) + settings.TASTE_LIBRARY_WEIGHT
+    for book_id, rating in Comment.objects.filter(user=user).values_list('book_id', 'rating'):
+        weights[book_id] = weights.get(book_id, 0) + comment_weight(rating)
+
+    vectors = _book_vectors(list(weights))
+    total = None
+    total_weight = 0.0
+    for book_id, vector in vectors.items():
+        total = weights[book_id] * vector if total is None else total + weights[book_id] * vector
+        total_weight += weights[book_id]
+
+    if total is None or total_weight <= 0:
+        user.taste_vector, user.taste_weight = None, 0
+    else:
+        user.taste_vector, user.taste_weight = encode_embedding(total), total_weight
+    user.save(update_fields=['taste_vector', 'taste_weight'])
+
+
+def recommend_for_user(user, k=2):
+    """
+    취향 벡터와 전체 도서 임베딩을 비교해 (book_id, score) 상위 k개를 반환합니다.
+    이미 서재에 담긴 책은 제외합니다. 취향 벡터가 없으면 빈 리스트.
+    """
+    taste = get_taste_vector(user)
+    if taste is None:
+        return []
+    read_ids = list(Library.objects.filter(user=user).values_list('book_id', flat=True))
+    return embedding_index.search(taste, k=k, exclude_ids=read_ids)
+
+
+def favorite_book_vector(favorite_book, allow_network=True):
+    """
+    프로필의 '좋아하는 도서'를 (카탈로그 도서 ID 또는 None, 정규화된 벡터)로 바꿉니다.
+    카탈로그에 같은 제목의 책이 있으면 그 책의 임베딩을, 없으면 제목 텍스트의 임베딩을 씁니다.
+    제목 임베딩은 EmbeddingCache를 먼저 찾고, 없을 때만 GMS를 호출해 캐시에 저장하므로 추천마다 다시 호출하지 않습니다.
+    allow_network=False이면 캐시에 없을 때 GMS를 호출하지 않고 (None, None)을 반환합니다. (장애 대체 경로용)
+    """
+    # 공백만 다른 입력이 서로 다른 캐시 키를 만들지 않도록 정리합니다.
+    favorite_book = ' '.join((favorite_book or '').split())
+    if not favorite_book:
+        return None, None
+    book_id = Book.objects.filter(title__iexact=favorite_book).values_list('id', flat=True).first()
+    if book_id is not None:
+        vector = _book_vectors([book_id]).get(book_id)
+        if vector is not None:
+            return book_id, vector
+    embedding = get_embedding(favorite_book, cache_only=not allow_network)
+    if embedding is None:
+        return None, None
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return None, (vector / norm if norm else None)
+
+
+def profile_query_vector(user, allow_network=True):
+    """
+    취향 벡터(서재/댓글)와 좋아하는 도서 벡터를 합친 검색 벡터와, 추천에서 뺄 좋아하는 도서 ID를 반환합니다.
+    둘 다 없으면 (None, None).
+    """
+    favorite_id, favorite = favorite_book_vector(user.favorite_book, allow_network=allow_network)
+    parts = [vector for vector in (get_taste_vector(user), favorite) if vector is not None]
+    if not parts:
+        return None, favorite_id
+    if len({len(vector) for vector in parts}) > 1:
+        return parts[0], favorite_id
+    query = np.sum(parts, axis=0)
+    norm = np.linalg.norm(query)
+    return (query / norm if norm else None), favorite_id
+
+
+def retrieve_candidates(user, k=None, min_in_category=5, allow_network=True):
+    """
+    LLM 프롬프트에 넣을 후보 도서를 임베딩 검색으로 고릅니다. (Book 목록, 유사도 순)
+    선호 카테고리 안에서 먼저 찾고, min_in_category권보다 적으면 전체 도서에서 찾습니다. 서재에 담긴 책과 좋아하는 도서 자체는 제외합니다.
+    검색 기준(취향 벡터/좋아하는 도서)이 없으면 None을 반환합니다.
+    allow_network=False이면 좋아하는 도서 임베딩을 저장된 벡터/캐시에서만 찾습니다.
+    """
+    k = k or settings.RECOMMENDATION_CANDIDATE_COUNT
+    query, favorite_id = profile_query_vector(user, allow_network=allow_network)
+    if query is None:
+        return None
+
+    read_ids = list(Library.objects.filter(user=user).values_list('book_id', flat=True))
+    if favorite_id is not None:
+        read_ids.append(favorite_id)
+    category_id = Category.objects.filter(name=user.selected_category).values_list('id', flat=True).first()
+    results = []
+    if category_id is not None:
+        results = embedding_index.search(
+            query, k=k, exclude_ids=read_ids, mask=embedding_index.filter_mask(category_id=category_id)
+        )
+    if len(results) < min_in_category:
+        results = embedding_index.search(query, k=k, exclude_ids=read_ids)
+
+    book_ids = [book_id for book_id, _ in results]
+    books_map = Book.objects.select_related('category').in_bulk(book_ids)
+    return [books_map[book_id] for book_id in book_ids if book_id in books_map]
+
+
+def closest_read_books(user, book_ids):
+    """
+    추천된 각 도서와 가장 비슷한, 사용자가 읽은 책의 제목을 {book_id: title}로 반환합니다.
+    LLM 없이 "○○를 좋아하셨다면" 형태의 추천 이유를 만들 때 사용합니다.
+    """
+    library = list(Library.objects.filter(user=user).select_related('book'))
+    if not library or not book_ids:
+        return {}
+    read_vectors = _book_vectors([item.book_id for item in library])
+    read_books = [item.book for item in library if item.book_id in read_vectors]
+    if not read_books:
+        return {}
+
+    read_matrix = np.vstack([read_vectors[book.id] for book in read_books])
+    target_vectors = _book_vectors(book_ids)
+    result = {}
+    for book_id, vector in target_vectors.items():
+        result[book_id] = read_books[int(np.argmax(read_matrix @ vector))].title
+    return result
+
+
+def write_reasons_with_llm(user, books):
+    """
+    이미 고른 도서들의 추천 이유만 LLM에게 작성하게 합니다. (선택 기능)
+    {book_id: reason}을 반환하며, 실패하면 빈 dict를 반환해 기본 문구를 쓰도록 합니다.
+    """
+    if not books:
+        return {}
+    books_list_str = "\n".join(f"ID:{book.id}, 제목:{book.title}, 저자:{book.author}" for book in books)
+    prompt = f"""
+        당신은 도서 추천 전문가입니다. 아래 [추천 도서]는 이미 선정된 책입니다. 각 책에 대해 사용자에게 보여줄 추천사를 작성하세요.
+
+        [사용자 프로필]
+        - 성함: {user.name}
+        - 선호 장르: {user.selected_category}
+        - 최근 관심 책: {user.favorite_book or "특정 책 없음"}
+
+        [추천 도서]
+        {books_list_str}
+
+        반드시 JSON 형식으로 응답하세요:
+        {{ "recommendations": [ {{"book_id": ID, "reason": "추천사"}}, ... ] }}
+    """
+    llm_response_json = get_llm_recommendation(prompt, call_site='recommendation_reason')
+    if not llm_response_json:
+        return {}
+    try:
+        recommendations = json.loads(llm_response_json).get('recommendations', [])
+        return {item['book_id']: item['reason'] for item in recommendations if 'book_id' in item and item.get('reason')}
+    except (json.JSONDecodeError, AttributeError, TypeError):
+        return {}
+
+
+def build_fast_recommendations(user, k=2, with_llm_reason=False):
+    """
+    취향 벡터 기반 추천 결과를 [{"book": 직렬화된 도서, "reason": 추천 이유}, ...] 형태로 만듭니다.
+    취향 벡터가 없으면 None을 반환하므로 호출하는 쪽에서 다른 방식으로 대체합니다.
+    """
+    results = recommend_for_user(user, k=k)
+    if not results:
+        return None
+    book_ids = [book_id for book_id, _ in results]
+    books_map = Book.objects.select_related('category').in_bulk(book_ids)
+    books = [books_map[book_id] for book_id in book_ids if book_id in books_map]
+
+    reasons = write_reasons_with_llm(user, books) if with_llm_reason else {}
+    closest = closest_read_books(user, book_ids)
+
+    final_recommendations = []
+    for book in books:
+        reason = reasons.get(book.id)
+        if not reason:
+            if closest.get(book.id):
+                reason = f"'{closest[book.id]}'을(를) 좋아하신 {user.name}님의 취향과 비슷한 책입니다."
+            else:
+                reason = f"{user.name}님의 독서 취향과 비슷한 책입니다."
+        final_recommendations.append({"book": BookListSerializer(book).data, "reason": reason})
+    return final_recommendations
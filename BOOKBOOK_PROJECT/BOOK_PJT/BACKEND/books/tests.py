@@ -1,3 +1,1081 @@
-from django.test import TestCase
+import asyncio
+import datetime
+from datetime import timedelta
+import json
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import numpy as np
+import openai
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import (ann, async_clients, docent, embedding_cache, llm_cache, recommendation_queue, resilience, similarity,
+               singleflight, tts_cache)
+from .models import (Book, DocentScript, LLMResponseCache, PrecomputedRecommendation, RecommendationJob, SimilarBook,
+                     SingleFlight)
+from .quantization import Int8Index
+from .taste import rebuild_taste_vector, retrieve_candidates
+from .utils import DEFAULT_LLM_SYSTEM_MESSAGE, EMBEDDING_MODEL, LLM_MODEL, decode_embedding, get_llm_recommendation
+from .vector_index import EmbeddingIndex
+from .views import RecommendationView
+
+
+class FakeClock:
+    """time.monotonic()/time.sleep() 대신 쓰는 시계. sleep하면 기다리지 않고 시각만 앞으로 갑니다."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _api_error(error_class, status_code):
+    response = httpx.Response(status_code, request=httpx.Request('POST', 'https://gms.test/chat'))
+    return error_class(f'{status_code}', response=response, body=None)
+
+
+class FakeCall:
+    """resilience.call()에 넘길 fn. outcomes를 차례로 반환하거나(예외면) 올리고, 받은 timeout과 걸린 시간을 기록합니다."""
+
+    def __init__(self, *outcomes, clock=None, duration=0.0):
+        self.outcomes = list(outcomes)
+        self.clock = clock
+        self.duration = duration
+        self.timeouts = []
+
+    @property
+    def calls(self):
+        return len(self.timeouts)
+
+    def __call__(self, timeout):
+        self.timeouts.append(timeout.read)
+        if self.clock is not None:
+            self.clock.now += min(self.duration, timeout.read)  # 실제 클라이언트처럼 timeout을 넘기지 않음
+        outcome = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+@override_settings(
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD=5,
+    CIRCUIT_BREAKER_RECOVERY_TIMEOUT=30,
+    GMS_DEADLINES={'default': 20},
+    GMS_RETRY_ATTEMPTS=2,
+    GMS_RETRY_BACKOFF=0.5,
+    GMS_CONNECT_TIMEOUT=5,
+)
+class ResilienceTestCase(SimpleTestCase):
+    """프로세스 전역 서킷 브레이커를 테스트마다 비우고, resilience 모듈의 시계를 FakeClock으로 바꿉니다."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(resilience, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        resilience._breakers.clear()
+        self.addCleanup(resilience._breakers.clear)
+
+    def breaker(self):
+        return resilience.get_breaker('chat')
+
+
+class CircuitBreakerTests(ResilienceTestCase):
+    def test_opens_after_threshold_consecutive_failures(self):
+        breaker = self.breaker()
+        for _ in range(4):
+            breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_success_resets_consecutive_failures(self):
+        breaker = self.breaker()
+        for _ in range(4):
+            breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.CLOSED)
+
+    def test_half_open_allows_one_trial_then_closes_on_success(self):
+        breaker = self.breaker()
+        for _ in range(5):
+            breaker.record_failure()
+        self.clock.now += 29
+        self.assertFalse(breaker.allow())
+
+        self.clock.now += 1
+        self.assertEqual(breaker.state, breaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # 시험 호출은 하나만
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, breaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_trial_reopens_for_another_recovery_timeout(self):
+        breaker = self.breaker()
+        for _ in range(5):
+            breaker.record_failure()
+        self.clock.now += 30
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.OPEN)
+        self.clock.now += 29
+        self.assertFalse(breaker.allow())
+        self.clock.now += 1
+        self.assertTrue(breaker.allow())
+
+
+class CallTests(ResilienceTestCase):
+    def test_client_error_is_not_retried_and_does_not_open_breaker(self):
+        for _ in range(10):
+            fn = FakeCall(_api_error(openai.BadRequestError, 400))
+            with self.assertRaises(openai.BadRequestError):
+                resilience.call('chat', fn)
+            self.assertEqual(fn.calls, 1)
+        self.assertEqual(self.breaker().state, resilience.CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker().stats()['failures'], 0)
+
+    def test_five_transient_failures_open_breaker(self):
+        for _ in range(5):
+            with self.assertRaises(resilience.GMSUnavailable):
+                resilience.call('chat', FakeCall(_api_error(openai.InternalServerError, 500)), retries=0)
+        self.assertEqual(self.breaker().state, resilience.CircuitBreaker.OPEN)
+
+        fn = FakeCall('ok')
+        with self.assertRaises(resilience.CircuitOpenError):
+            resilience.call('chat', fn)
+        self.assertEqual(fn.calls, 0)
+
+        self.clock.now += 30
+        self.assertEqual(resilience.call('chat', fn), 'ok')
+        self.assertEqual(self.breaker().state, resilience.CircuitBreaker.CLOSED)
+
+    def test_transient_errors_are_retried_with_backoff(self):
+        fn = FakeCall(httpx.ConnectTimeout('timeout'), _api_error(openai.RateLimitError, 429), 'ok')
+        with mock.patch.object(resilience.random, 'uniform', side_effect=lambda low, high: high):
+            self.assertEqual(resilience.call('chat', fn), 'ok')
+        self.assertEqual(fn.calls, 3)
+        self.assertEqual(self.clock.sleeps, [0.5, 1.0])
+        self.assertEqual(self.breaker().stats()['retries'], 2)
+
+    def test_retries_exhausted_raise_unavailable_with_cause(self):
+        error = httpx.ConnectError('refused')
+        fn = FakeCall(error)
+        with self.assertRaises(resilience.GMSUnavailable) as ctx:
+            resilience.call('chat', fn)
+        self.assertEqual(fn.calls, 3)  # 첫 시도 + GMS_RETRY_ATTEMPTS(2)
+        self.assertIs(ctx.exception.__cause__, error)
+
+    def test_transient_status_keeps_last_response(self):
+        response = httpx.Response(503, request=httpx.Request('POST', 'https://gms.test/audio/speech'))
+        fn = FakeCall(resilience.TransientHTTPError(response))
+        with self.assertRaises(resilience.TransientHTTPError) as ctx:
+            resilience.call('tts', fn, retries=0)
+        self.assertIs(ctx.exception.response, response)
+
+    def test_deadline_shrinks_timeout_and_stops_retrying(self):
+        # 시도마다 8초 뒤 타임아웃: 남은 시간만큼만 기다리고, 20초 데드라인이 지나면 더 시도하지 않습니다.
+        fn = FakeCall(httpx.ReadTimeout('slow'), clock=self.clock, duration=8)
+        with mock.patch.object(resilience.random, 'uniform', side_effect=lambda low, high: high):
+            with self.assertRaises(resilience.GMSUnavailable):
+                resilience.call('chat', fn, retries=5)
+        self.assertEqual(fn.calls, 3)
+        self.assertEqual(fn.timeouts[0], 20)
+        self.assertAlmostEqual(fn.timeouts[1], 20 - 8 - 0.5)
+        self.assertAlmostEqual(fn.timeouts[2], 20 - 8 - 0.5 - 8 - 1.0)
+        self.assertLessEqual(self.clock.now - 1000.0, 20)
+
+    def test_deadline_exceeded_before_attempt(self):
+        fn = FakeCall('ok')
+        with self.assertRaises(resilience.DeadlineExceeded):
+            resilience.call('chat', fn, deadline=-1)
+        self.assertEqual(fn.calls, 0)
+        self.assertEqual(self.breaker().stats()['consecutive_failures'], 1)
+
+    def test_acall_matches_call(self):
+        async def fail(timeout):
+            raise _api_error(openai.InternalServerError, 500)
+
+        async def client_error(timeout):
+            raise _api_error(openai.NotFoundError, 404)
+
+        async def scenario():
+            with self.assertRaises(openai.NotFoundError):
+                await resilience.acall('chat', client_error)
+            for _ in range(5):
+                with self.assertRaises(resilience.GMSUnavailable):
+                    await resilience.acall('chat', fail, retries=0)
+            with self.assertRaises(resilience.CircuitOpenError):
+                await resilience.acall('chat', fail)
+
+        asyncio.run(scenario())
+
+    def test_transient_classification(self):
+        self.assertTrue(resilience.is_transient(httpx.ReadTimeout('x')))
+        self.assertTrue(resilience.is_transient(httpx.ConnectError('x')))
+        self.assertTrue(resilience.is_transient(_api_error(openai.RateLimitError, 429)))
+        self.assertTrue(resilience.is_transient(_api_error(openai.InternalServerError, 502)))
+        self.assertFalse(resilience.is_transient(_api_error(openai.BadRequestError, 400)))
+        self.assertFalse(resilience.is_transient(_api_error(openai.AuthenticationError, 401)))
+        self.assertFalse(resilience.is_transient(ValueError('bad json')))
+
+
+class GuardTests(ResilienceTestCase):
+    def _stream(self, chunks):
+        with resilience.guard('chat'):
+            yield from chunks
+
+    def test_client_disconnect_counts_as_success(self):
+        breaker = self.breaker()
+        for _ in range(4):
+            breaker.record_failure()
+        stream = self._stream(['a', 'b', 'c'])
+        self.assertEqual(next(stream), 'a')
+        stream.close()  # 클라이언트가 도중에 연결을 끊음 → GeneratorExit
+        self.assertEqual(breaker.stats()['consecutive_failures'], 0)
+        self.assertEqual(breaker.state, breaker.CLOSED)
+
+    def test_transient_error_records_failure_and_raises_unavailable(self):
+        def broken():
+            yield 'a'
+            raise httpx.RemoteProtocolError('peer closed')
+
+        with self.assertRaises(resilience.GMSUnavailable):
+            list(self._stream(broken()))
+        self.assertEqual(self.breaker().stats()['consecutive_failures'], 1)
+
+    def test_rejects_when_open(self):
+        for _ in range(5):
+            self.breaker().record_failure()
+        with self.assertRaises(resilience.CircuitOpenError):
+            list(self._stream(['a']))
+
+
+class LLMUnavailableTests(ResilienceTestCase):
+    def test_docent_callers_can_see_outage(self):
+        # GMS_KEY가 없는 환경에서도 키 확인이 아니라 서킷 브레이커 경로를 타도록 클라이언트를 바꿉니다.
+        client = mock.Mock()
+        patcher = mock.patch('books.utils.get_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for _ in range(5):
+            self.breaker().record_failure()
+        self.assertIsNone(get_llm_recommendation('프롬프트', use_cache=False))
+        with self.assertRaises(resilience.CircuitOpenError):
+            get_llm_recommendation('프롬프트', use_cache=False, raise_unavailable=True)
+        client.chat.completions.create.assert_not_called()
+
+
+def _make_book(number, vector=None, **fields):
+    book = Book(
+        title=f'책 {number}', author='작가', publisher='출판사', isbn=f'{number:013d}',
+        cover='https://example.com/cover.jpg', pub_date=datetime.date(2024, 1, 1), **fields,
+    )
+    if vector is not None:
+        book.set_embedding(vector, dtype='float32')
+    book.save()
+    return book
+
+
+class ANNIndexTestCase(SimpleTestCase):
+    def setUp(self):
+        self.index_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.index_dir, ignore_errors=True)
+        override = override_settings(ANN_INDEX_DIR=self.index_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        # 프로세스 캐시를 비워 테스트끼리 인덱스를 공유하지 않도록 합니다.
+        for name, value in (('_ann_index', None), ('_ann_key', None)):
+            patcher = mock.patch.object(ann, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def build(self, n=40, dim=8, seed=0):
+        rng = np.random.default_rng(seed)
+        return ann.IVFIndex.build(rng.normal(size=(n, dim)), np.arange(1, n + 1), nlist=4)
+
+
+class ANNIndexSwapTests(ANNIndexTestCase):
+    def test_save_switches_pointer_to_complete_version(self):
+        first = self.build(seed=1).save(self.index_dir)
+        self.assertEqual(ann.current_version(self.index_dir), self.index_dir / first)
+        loaded = ann.get_ann_index()
+        self.assertEqual(len(loaded), 40)
+
+        second_index = self.build(n=50, seed=2)
+        second = second_index.save(self.index_dir)
+        self.assertEqual(ann.current_version(self.index_dir), self.index_dir / second)
+        # 교체 뒤에도 이전 버전 디렉터리는 남아 있어, 먼저 CURRENT를 읽은 프로세스가 계속 읽을 수 있습니다.
+        self.assertTrue((self.index_dir / first / 'vectors.npy').exists())
+        self.assertEqual(len(ann.get_ann_index()), 50)
+
+    def test_keeps_only_recent_versions(self):
+        versions = [self.build(seed=i).save(self.index_dir) for i in range(4)]
+        remaining = sorted(p.name for p in self.index_dir.iterdir() if p.is_dir())
+        self.assertEqual(remaining, versions[-2:])
+        self.assertFalse(any(p.name.endswith('.tmp') for p in self.index_dir.iterdir()))
+
+    def test_no_index_returns_none(self):
+        self.assertIsNone(ann.get_ann_index())
+
+    def test_broken_version_falls_back_to_none_until_pointer_changes(self):
+        version = self.build().save(self.index_dir)
+        np.save(self.index_dir / version / 'ids.npy', np.arange(3))  # 다른 빌드의 파일이 섞인 상태
+        with mock.patch.object(ann.IVFIndex, 'load', wraps=ann.IVFIndex.load) as load:
+            self.assertIsNone(ann.get_ann_index())
+            self.assertIsNone(ann.get_ann_index())
+        self.assertEqual(load.call_count, 1)
+
+        self.build().save(self.index_dir)
+        self.assertIsNotNone(ann.get_ann_index())
+
+    def test_missing_version_directory_falls_back_to_none(self):
+        version = self.build().save(self.index_dir)
+        shutil.rmtree(self.index_dir / version)
+        self.assertIsNone(ann.get_ann_index())
+
+
+@override_settings(ANN_ENABLED=True, ANN_MIN_CATALOG_SIZE=1, EMBEDDING_INDEX_QUANTIZATION=None)
+class ANNSearchFallbackTests(ANNIndexTestCase, TestCase):
+    def test_search_uses_exact_scan_when_ann_index_is_unreadable(self):
+        vectors = np.eye(4, dtype=np.float32)
+        books = [_make_book(i, vector) for i, vector in enumerate(vectors, start=1)]
+        version = ann.IVFIndex.build(vectors, [book.pk for book in books], nlist=2).save(self.index_dir)
+        (self.index_dir / version / 'centroids.npy').write_bytes(b'broken')
+
+        results = EmbeddingIndex().search(vectors[2], k=1)
+        self.assertEqual(results[0][0], books[2].pk)
+        self.assertAlmostEqual(results[0][1], 1.0, places=5)
+
+
+class DocentPipelineTests(SimpleTestCase):
+    PIECES = ['안녕하세요, 오늘 소개할 ', '책은 이것입니다. 짧', '아요. 정말이요?\n', '마지막 문장']
+
+    def test_async_pipeline_matches_sync(self):
+        async def pieces():
+            for piece in self.PIECES:
+                yield piece
+
+        async def collect():
+            return [sentence async for sentence in docent.aprefetch(docent.asplit_sentences(pieces(), min_chars=10))]
+
+        expected = list(docent.prefetch(docent.split_sentences(self.PIECES, min_chars=10)))
+        self.assertEqual(asyncio.run(collect()), expected)
+        self.assertEqual(expected, ['안녕하세요, 오늘 소개할 책은 이것입니다.', '짧아요. 정말이요?', '마지막 문장'])
+
+    def test_aprefetch_reraises_producer_error(self):
+        async def broken():
+            yield '첫 문장.'
+            raise resilience.GMSUnavailable('chat')
+
+        async def collect():
+            sentences = docent.aprefetch(broken())
+            first = await anext(sentences)
+            with self.assertRaises(resilience.GMSUnavailable):
+                await anext(sentences)
+            return first
+
+        self.assertEqual(asyncio.run(collect()), '첫 문장.')
+
+
+class DocentViewTests(TestCase):
+    SYNC_URL = '/api/books/{}/docent/'
+    ASYNC_URL = '/api/books/async/{}/docent/'
+
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        override = override_settings(TTS_CACHE_DIR=cache_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.book = _make_book(1)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=_make_user()).key}')
+        patcher = mock.patch.object(docent, 'get_or_create_script', return_value='새 스크립트.')
+        self.get_or_create_script = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, url, stream=False):
+        response = self.client.post(url.format(self.book.pk) + ('?stream=1' if stream else ''), {'voice': 'alloy'})
+        if not response.streaming:
+            return response, response.content
+
+        async def collect():
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        # 비동기 뷰는 디스크 파일도 비동기 이터레이터로 흘려보냅니다.
+        content = asyncio.run(collect()) if response.is_async else b''.join(response.streaming_content)
+        return response, content
+
+    def test_prepared_audio_is_served_on_every_path(self):
+        docent.save_script(self.book, '준비된 스크립트.')
+        tts_cache.put(tts_cache.make_key('준비된 스크립트.', 'alloy'), b'prepared-mp3')
+        for url in (self.SYNC_URL, self.ASYNC_URL):
+            for stream in (False, True):
+                response, content = self.post(url, stream)
+                self.assertEqual((response.status_code, content), (200, b'prepared-mp3'), (url, stream))
+                self.assertEqual(response['X-TTS-Cache'], 'hit')
+        self.get_or_create_script.assert_not_called()
+
+    def test_both_views_create_scripts_through_singleflight_helper(self):
+        tts_cache.put(tts_cache.make_key('새 스크립트.', 'alloy'), b'new-mp3')
+        for url in (self.SYNC_URL, self.ASYNC_URL):
+            response, content = self.post(url)
+            self.assertEqual((response.status_code, content), (200, b'new-mp3'), url)
+        self.assertEqual(self.get_or_create_script.call_count, 2)
+
+    def test_async_fast_recommendations_honour_llm_reason(self):
+        with mock.patch('books.async_views.build_fast_recommendations', return_value=[{'reason': '이유'}]) as fast:
+            response = self.client.get('/api/books/async/main-recommendations/?mode=fast&reason=llm')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(fast.call_args.kwargs['with_llm_reason'])
+
+
+class DocentScriptInvalidationTests(TestCase):
+    def setUp(self):
+        self.book = _make_book(1, description='소개')
+        docent.save_script(self.book, '스크립트.')
+
+    def test_script_is_dropped_when_prompt_fields_change(self):
+        for field, value in (('title', '새 제목'), ('author', '새 작가'), ('description', '새 소개')):
+            docent.save_script(self.book, '스크립트.')
+            setattr(self.book, field, value)
+            self.book.save(update_fields=[field])
+            self.assertIsNone(docent.cached_script(self.book), field)
+            self.assertFalse(DocentScript.objects.filter(book=self.book).exists(), field)
+
+    def test_script_survives_unrelated_saves(self):
+        self.book.is_bestseller = True
+        self.book.save(update_fields=['is_bestseller'])
+        self.book.save()
+        self.assertEqual(docent.cached_script(self.book), '스크립트.')
+
+
+class AsyncClientLifetimeTests(SimpleTestCase):
+    def test_clients_are_closed_when_loop_shuts_down(self):
+        async def use():
+            client = async_clients.get_async_http_client()
+            self.assertIs(async_clients.get_async_http_client(), client)
+            self.assertFalse(client.is_closed)
+            return client
+
+        # WSGI에서 async 뷰를 실행할 때처럼 요청마다 새 루프를 만들고 닫습니다.
+        first, second = asyncio.run(use()), asyncio.run(use())
+        self.assertIsNot(first, second)
+        self.assertTrue(first.is_closed and second.is_closed)
+
+
+@override_settings(ANN_ENABLED=False, SIMILAR_BOOKS_TOP_N=5, SIMILAR_BOOKS_BLOCK_SIZE=7, QUANTIZED_RERANK_FACTOR=4)
+class SimilarBooksTests(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.books = [_make_book(i, rng.normal(size=16)) for i in range(1, 31)]
+
+    def build(self, quantization):
+        index = EmbeddingIndex()
+        with override_settings(EMBEDDING_INDEX_QUANTIZATION=quantization), \
+                mock.patch.object(similarity, 'embedding_index', index):
+            similarity.rebuild_similar_books()
+        return {
+            (row.source_id, row.rank): (row.target_id, row.score)
+            for row in SimilarBook.objects.all()
+        }
+
+    def test_int8_build_reranks_exactly_without_dequantizing_everything(self):
+        expected = self.build(None)
+        self.assertEqual(len(expected), 30 * 5)
+
+        original = Int8Index.dequantize
+
+        def dequantize(quantized, rows=None):
+            self.assertIsNotNone(rows, '전체 행렬을 한 번에 풀면 안 됩니다.')
+            return original(quantized, rows)
+
+        with mock.patch.object(Int8Index, 'dequantize', dequantize):
+            actual = self.build('int8')
+        self.assertEqual(actual.keys(), expected.keys())
+        for key, (target_id, score) in expected.items():
+            self.assertEqual(actual[key][0], target_id)
+            self.assertAlmostEqual(actual[key][1], score, places=5)
+
+    def test_refresh_matches_rebuild_in_int8_mode(self):
+        index = EmbeddingIndex()
+        with override_settings(EMBEDDING_INDEX_QUANTIZATION='int8'), \
+                mock.patch.object(similarity, 'embedding_index', index):
+            similarity.rebuild_similar_books()
+            changed = self.books[3]
+            changed.set_embedding(np.random.default_rng(1).normal(size=16), dtype='float32')
+            changed.save()
+            index.invalidate()
+            similarity.refresh_similar_books([changed.pk])
+            refreshed = set(SimilarBook.objects.values_list('source_id', 'rank', 'target_id'))
+            similarity.rebuild_similar_books()
+            rebuilt = set(SimilarBook.objects.values_list('source_id', 'rank', 'target_id'))
+        self.assertEqual(refreshed, rebuilt)
+
+    @override_settings(EMBEDDING_INDEX_QUANTIZATION=None)
+    def test_saving_changed_embedding_refreshes_lists_after_commit(self):
+        similarity.rebuild_similar_books()
+        changed = self.books[3]
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            changed.title = '제목만 바뀜'
+            changed.save()
+        self.assertEqual(callbacks, [])
+
+        changed.set_embedding(np.random.default_rng(1).normal(size=16), dtype='float32')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            changed.save()
+        self.assertEqual(len(callbacks), 1)
+        refreshed = set(SimilarBook.objects.values_list('source_id', 'rank', 'target_id'))
+        similarity.rebuild_similar_books()
+        self.assertEqual(refreshed, set(SimilarBook.objects.values_list('source_id', 'rank', 'target_id')))
+
+
+@override_settings(EMBEDDING_INDEX_QUANTIZATION=None, ANN_ENABLED=False, SIMILAR_BOOKS_TOP_N=5)
+class BatchRecommendedBooksTests(TestCase):
+    URL = '/api/books/recommendations/batch/'
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.books = [_make_book(i, rng.normal(size=8)) for i in range(1, 6)]
+        self.client = APIClient()
+        self.client.force_authenticate(_make_user())
+
+    def post(self, payload):
+        return self.client.post(self.URL, payload, format='json')
+
+    def test_bool_and_non_positive_ids_are_rejected(self):
+        for book_ids in ([True], [self.books[0].pk, False], [0], [-3], ['1'], [1.0]):
+            response = self.post({'book_ids': book_ids})
+            self.assertEqual(response.status_code, 400, book_ids)
+            self.assertTrue(response.json()['invalid_ids'], book_ids)
+
+    def test_bool_k_is_rejected(self):
+        self.assertEqual(self.post({'book_ids': [self.books[0].pk], 'k': True}).status_code, 400)
+
+    def test_valid_ids_return_neighbours(self):
+        source = self.books[0].pk
+        response = self.post({'book_ids': [source], 'k': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results'][str(source)]), 2)
+
+
+@override_settings(EMBEDDING_INDEX_QUANTIZATION=None, ANN_ENABLED=False)
+class PersonalizedFallbackTests(TestCase):
+    URL = '/api/v1/user/recommendation/personalized/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(_make_user())
+
+    def recommended_ids(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        return [item['book']['id'] for item in response.json()]
+
+    def test_bestsellers_are_ordered_by_rating(self):
+        ranks = {1: 3.0, 2: 9.0, 3: 7.0, 4: 9.0}
+        books = {i: _make_book(i, is_bestseller=True, customer_review_rank=rank) for i, rank in ranks.items()}
+        expected = [books[4].pk, books[2].pk]
+        for _ in range(3):
+            self.assertEqual(self.recommended_ids(), expected)
+
+    def test_selection_goes_through_single_flight(self):
+        books = [_make_book(i, customer_review_rank=i) for i in range(1, 5)]
+        chosen = [books[0].pk, books[1].pk, books[2].pk]
+        with mock.patch('books.views.BestsellerListView.select_bestsellers', return_value=chosen) as select:
+            self.assertEqual(self.recommended_ids(), [books[2].pk, books[1].pk])
+        select.assert_called_once()
+        self.assertEqual(singleflight.snapshot('bestsellers'), chosen)
+
+        # 선정이 실패해도 마지막 스냅샷으로 같은 목록을 돌려줍니다.
+        with mock.patch('books.views.BestsellerListView.select_bestsellers', return_value=None):
+            self.assertEqual(self.recommended_ids(), [books[2].pk, books[1].pk])
+
+
+class EmbeddingIndexSnapshotTests(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.books = [_make_book(i, rng.normal(size=8)) for i in range(1, 6)]
+        self.index = EmbeddingIndex()
+
+    def test_reload_swaps_whole_snapshot(self):
+        old = self.index._ensure_loaded()
+        self.assertFalse(old.ids.flags.writeable or old.matrix.flags.writeable)
+
+        _make_book(6, np.ones(8))
+        self.index.invalidate()
+        new = self.index._ensure_loaded()
+        # 먼저 잡아 둔 스냅샷은 그대로라, 조회 중이던 스레드는 행렬과 id의 길이가 어긋나지 않습니다.
+        self.assertEqual((len(old.ids), old.matrix.shape[0]), (5, 5))
+        self.assertEqual((len(new.ids), new.matrix.shape[0]), (6, 6))
+        self.assertEqual(len(new.bestseller), 6)
+
+    def test_metadata_reload_keeps_vectors(self):
+        before = self.index._ensure_loaded()
+        Book.objects.filter(pk=self.books[0].pk).update(is_bestseller=True)
+        self.index.invalidate_metadata()
+        after = self.index._ensure_loaded()
+        self.assertIsNot(after, before)
+        self.assertIs(after.matrix, before.matrix)
+        self.assertEqual(int(self.index.filter_mask(is_bestseller=True).sum()), 1)
+        self.assertFalse(before.bestseller.any())
+
+
+class LLMCacheTests(TestCase):
+    def test_set_and_get(self):
+        llm_cache.set('key', '{"a": 1}', 'gpt', call_site='default')
+        self.assertEqual(llm_cache.get('key', 'default'), '{"a": 1}')
+
+    def test_write_failure_does_not_raise(self):
+        # 캐시 저장 실패(SQLite 잠금 등)가 이미 받은 LLM 응답을 오류로 바꾸면 안 됩니다.
+        with mock.patch.object(LLMResponseCache.objects, 'update_or_create',
+                               side_effect=OperationalError('database is locked')):
+            llm_cache.set('key', '{"a": 1}', 'gpt', call_site='default')
+        self.assertIsNone(llm_cache.get('key', 'default'))
+
+    def test_read_failure_is_a_miss(self):
+        with mock.patch.object(LLMResponseCache.objects, 'filter', side_effect=OperationalError('database is locked')):
+            self.assertIsNone(llm_cache.get('key', 'default'))
+
+    def test_cached_answer_is_served_without_api_key(self):
+        llm_cache.set(llm_cache.make_key(LLM_MODEL, DEFAULT_LLM_SYSTEM_MESSAGE, '프롬프트', 'json_object'),
+                      '{"a": 1}', LLM_MODEL)
+        with mock.patch('books.utils.get_client', return_value=None):
+            self.assertEqual(get_llm_recommendation('프롬프트'), '{"a": 1}')
+
+
+class Counter:
+    """호출 횟수를 세는 compute 함수"""
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.result
+
+
+class SingleFlightMixin:
+    KEY = 'test:1'
+
+    def setUp(self):
+        super().setUp()
+        override = override_settings(
+            SINGLE_FLIGHT_WAIT_TIMEOUT=5, SINGLE_FLIGHT_LOCK_TTL=120, SINGLE_FLIGHT_POLL_INTERVAL=0.2,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.clock = FakeClock()
+        for target, name, value in ((singleflight, 'time', self.clock), (singleflight, '_stats', {})):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def lock_by_other_process(self, seconds=60, result=None):
+        """다른 프로세스가 잠금을 가져간 상태의 행을 만듭니다."""
+        return SingleFlight.objects.create(
+            key=self.KEY, owner='999:other', locked_until=timezone.now() + timedelta(seconds=seconds),
+            result=json.dumps(result) if result is not None else None,
+            updated_at=timezone.now() - timedelta(minutes=5) if result is not None else None,
+        )
+
+    def counts(self):
+        return singleflight.stats().get('test', {})
+
+
+class SingleFlightLockTests(SingleFlightMixin, TestCase):
+    def test_leader_computes_and_stores_result(self):
+        compute = Counter({'books': [1, 2]})
+        self.assertEqual(singleflight.run(self.KEY, compute), {'books': [1, 2]})
+        row = SingleFlight.objects.get(key=self.KEY)
+        self.assertIsNone(row.locked_until)
+        self.assertEqual(row.owner, '')
+        self.assertEqual(json.loads(row.result), {'books': [1, 2]})
+        self.assertEqual(singleflight.snapshot(self.KEY), {'books': [1, 2]})
+
+    def test_expired_lock_of_dead_process_is_taken_over(self):
+        self.lock_by_other_process(seconds=-1)
+        compute = Counter('new')
+        self.assertEqual(singleflight.run(self.KEY, compute, stale=False), 'new')
+        self.assertEqual(compute.calls, 1)
+        self.assertEqual(self.clock.sleeps, [])  # 만료된 잠금은 기다리지 않음
+        row = SingleFlight.objects.get(key=self.KEY)
+        self.assertIsNone(row.locked_until)
+        self.assertEqual(json.loads(row.result), 'new')
+
+    def test_stale_snapshot_is_returned_while_other_process_computes(self):
+        self.lock_by_other_process(result='old')
+        compute = Counter('new')
+        self.assertEqual(singleflight.run(self.KEY, compute), 'old')
+        self.assertEqual(compute.calls, 0)
+        self.assertEqual(self.clock.sleeps, [])
+        self.assertEqual(self.counts()['stale'], 1)
+        # 잠금은 계산 중인 프로세스의 것으로 그대로 남습니다.
+        self.assertEqual(SingleFlight.objects.get(key=self.KEY).owner, '999:other')
+
+    @override_settings(SINGLE_FLIGHT_MAX_STALENESS=60)
+    def test_snapshot_older_than_max_staleness_is_not_served(self):
+        self.lock_by_other_process(result='old')  # 5분 전 결과
+        self.assertIsNone(singleflight.snapshot(self.KEY))
+        self.assertEqual(singleflight.snapshot(self.KEY, max_staleness=10 * 60), 'old')
+
+        compute = Counter('new')
+        self.assertEqual(singleflight.run(self.KEY, compute, wait_timeout=1), 'new')
+        self.assertEqual(compute.calls, 1)
+        self.assertEqual(self.counts(), {'computed': 1, 'waited': 0, 'stale': 0, 'timeout': 1})
+
+    def test_waits_for_other_process_result_without_snapshot(self):
+        self.lock_by_other_process()
+
+        def finish_on_first_poll(seconds):
+            FakeClock.sleep(self.clock, seconds)
+            SingleFlight.objects.filter(key=self.KEY).update(
+                owner='', locked_until=None, result=json.dumps('theirs'), updated_at=timezone.now(),
+            )
+
+        compute = Counter('mine')
+        with mock.patch.object(self.clock, 'sleep', side_effect=finish_on_first_poll):
+            self.assertEqual(singleflight.run(self.KEY, compute), 'theirs')
+        self.assertEqual(compute.calls, 0)
+        self.assertEqual(self.counts()['waited'], 1)
+
+    def test_computes_itself_when_wait_times_out(self):
+        self.lock_by_other_process()
+        compute = Counter('mine')
+        self.assertEqual(singleflight.run(self.KEY, compute, stale=False, wait_timeout=1), 'mine')
+        self.assertEqual(compute.calls, 1)
+        self.assertEqual(len(self.clock.sleeps), 5)  # 0.2초 간격으로 1초 동안 폴링
+        self.assertEqual(self.counts()['timeout'], 1)
+        # 남의 잠금은 건드리지 않습니다.
+        self.assertEqual(SingleFlight.objects.get(key=self.KEY).owner, '999:other')
+
+    def test_none_result_is_not_stored(self):
+        singleflight.run(self.KEY, Counter('old'))
+        singleflight.run(self.KEY, Counter(None))
+        self.assertEqual(singleflight.snapshot(self.KEY), 'old')
+
+    def test_lock_only_mode_does_not_store_result(self):
+        self.assertEqual(singleflight.run(self.KEY, Counter('script'), store=False), 'script')
+        self.assertIsNone(singleflight.snapshot(self.KEY))
+
+    def test_lock_only_waiter_recomputes_after_release(self):
+        # 결과를 따로 저장하는 경우 이전 스냅샷이 있어도 쓰지 않고, 잠금이 풀리면 compute(저장소 조회)를 호출합니다.
+        self.lock_by_other_process(result='old')
+
+        def finish_on_first_poll(seconds):
+            FakeClock.sleep(self.clock, seconds)
+            SingleFlight.objects.filter(key=self.KEY).update(owner='', locked_until=None)
+
+        compute = Counter('saved elsewhere')
+        with mock.patch.object(self.clock, 'sleep', side_effect=finish_on_first_poll):
+            self.assertEqual(singleflight.run(self.KEY, compute, store=False), 'saved elsewhere')
+        self.assertEqual(compute.calls, 1)
+        self.assertEqual(len(self.clock.sleeps), 1)
+        self.assertEqual(self.counts()['waited'], 1)
+
+
+class SingleFlightWaiterTests(SingleFlightMixin, TransactionTestCase):
+    def start_leader(self, compute):
+        """다른 스레드에서 리더로 run()을 실행하고, compute 안에 들어갈 때까지 기다립니다."""
+        entered = threading.Event()
+        self.proceed = threading.Event()
+        outcome = {}
+
+        def leader_compute():
+            entered.set()
+            self.proceed.wait(5)
+            return compute()
+
+        def leader():
+            try:
+                outcome['result'] = singleflight.run(self.KEY, leader_compute)
+            except Exception as e:
+                outcome['error'] = e
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=leader)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.assertTrue(entered.wait(5))
+
+        # 대기하는 쪽이 event.wait()에 들어가는 순간 리더를 진행시킵니다. (타이밍에 기대지 않도록)
+        call = singleflight._calls[self.KEY]
+        original_wait = call.event.wait
+
+        def wait(timeout=None):
+            self.proceed.set()
+            return original_wait(timeout)
+
+        call.event.wait = wait
+        return thread, outcome
+
+    def test_waiter_wakes_up_with_leader_result(self):
+        leader_compute = Counter({'picked': 3})
+        thread, outcome = self.start_leader(leader_compute)
+        waiter_compute = Counter('unused')
+        self.assertEqual(singleflight.run(self.KEY, waiter_compute, stale=False), {'picked': 3})
+        thread.join(5)
+        self.assertEqual(outcome['result'], {'picked': 3})
+        self.assertEqual(leader_compute.calls, 1)
+        self.assertEqual(waiter_compute.calls, 0)
+        self.assertEqual(self.counts(), {'computed': 1, 'waited': 1, 'stale': 0, 'timeout': 0})
+
+    def test_waiter_reraises_leader_error(self):
+        def fail():
+            raise resilience.GMSUnavailable('chat')
+
+        thread, outcome = self.start_leader(fail)
+        with self.assertRaises(resilience.GMSUnavailable):
+            singleflight.run(self.KEY, Counter('unused'), stale=False)
+        thread.join(5)
+        self.assertIsInstance(outcome['error'], resilience.GMSUnavailable)
+        # 실패한 리더도 잠금은 풀고 갑니다.
+        self.assertIsNone(SingleFlight.objects.get(key=self.KEY).locked_until)
+
+
+def _make_user(name='테스터'):
+    return get_user_model().objects.create_user(email=f'{name}@example.com', name=name)
+
+
+@override_settings(RECOMMENDATION_JOB_MAX_ATTEMPTS=3, RECOMMENDATION_JOB_RETRY_BACKOFF=60,
+                   PRECOMPUTED_RECOMMENDATION_MAX_AGE=60 * 60, RECOMMENDATION_JOB_RETENTION=60 * 60,
+                   RECOMMENDATION_FAILED_JOB_RETENTION=24 * 60 * 60, RECOMMENDATION_JOB_TIMEOUT=10 * 60)
+class RecommendationQueueTests(TestCase):
+    def setUp(self):
+        self.user = _make_user()
+        self.books = [_make_book(i) for i in (1, 2)]
+        patcher = mock.patch.object(RecommendationView, 'build_prompt', return_value='프롬프트')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def llm_answer(self):
+        return json.dumps({'recommendations': [
+            {'book_id': book.pk, 'reason': f'이유 {book.pk}'} for book in self.books
+        ]})
+
+    def run_next(self, llm_answer):
+        job = recommendation_queue.claim_next()
+        with mock.patch.object(recommendation_queue, 'get_llm_recommendation', return_value=llm_answer) as llm:
+            ok = recommendation_queue.process(job)
+        job.refresh_from_db()
+        return ok, job, llm
+
+    def test_enqueue_keeps_one_pending_job_per_user(self):
+        self.assertIsNotNone(recommendation_queue.enqueue(self.user.id, 'comment'))
+        self.assertIsNone(recommendation_queue.enqueue(self.user.id, 'comment'))
+        self.assertEqual(RecommendationJob.objects.filter(user=self.user).count(), 1)
+
+    def test_process_saves_result_for_get_precomputed(self):
+        recommendation_queue.enqueue(self.user.id, 'profile')
+        ok, job, _ = self.run_next(self.llm_answer())
+        self.assertTrue(ok)
+        self.assertEqual(job.status, RecommendationJob.STATUS_DONE)
+        self.assertIsNone(recommendation_queue.claim_next())
+
+        result = recommendation_queue.get_precomputed(self.user)
+        self.assertEqual([item['book']['id'] for item in result], [book.pk for book in self.books])
+        self.assertEqual(result[0]['reason'], f'이유 {self.books[0].pk}')
+
+    def test_job_older_than_saved_result_is_skipped(self):
+        recommendation_queue.enqueue(self.user.id, 'comment')
+        RecommendationJob.objects.update(created_at=timezone.now() - timedelta(minutes=1))
+        recommendation_queue.save_result(self.user, [{'book': {'id': self.books[0].pk}, 'reason': '실시간'}])
+        ok, job, llm = self.run_next(self.llm_answer())
+        self.assertTrue(ok)
+        self.assertEqual(job.status, RecommendationJob.STATUS_DONE)
+        llm.assert_not_called()
+
+    def test_enqueue_race_is_stopped_by_unique_pending_constraint(self):
+        # exists() 확인을 통과한 두 요청이 동시에 create()하는 경우를 흉내냅니다.
+        RecommendationJob.objects.create(user=self.user, reason='comment')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            RecommendationJob.objects.create(user=self.user, reason='profile')
+        self.assertIsNone(recommendation_queue.enqueue(self.user.id, 'profile'))
+
+    def test_failed_job_is_retried_with_backoff_up_to_max_attempts(self):
+        recommendation_queue.enqueue(self.user.id, 'comment')
+        for attempt, backoff in ((1, 60), (2, 120)):
+            ok, job, _ = self.run_next(None)
+            self.assertFalse(ok)
+            self.assertEqual((job.status, job.attempts), (RecommendationJob.STATUS_PENDING, attempt))
+            self.assertAlmostEqual((job.next_attempt_at - timezone.now()).total_seconds(), backoff, delta=5)
+            # 백오프가 끝나기 전에는 꺼내지 않습니다.
+            self.assertIsNone(recommendation_queue.claim_next())
+            RecommendationJob.objects.filter(pk=job.pk).update(next_attempt_at=timezone.now())
+        ok, job, _ = self.run_next(None)
+        self.assertEqual((job.status, job.attempts), (RecommendationJob.STATUS_FAILED, 3))
+        self.assertIsNone(recommendation_queue.claim_next())
+        self.assertIsNone(recommendation_queue.get_precomputed(self.user))
+
+    def test_retried_job_goes_behind_newer_jobs(self):
+        recommendation_queue.enqueue(self.user.id, 'comment')
+        self.run_next(None)
+        other = _make_user('다른사람')
+        recommendation_queue.enqueue(other.id, 'comment')
+        # 백오프가 둘 다 끝났다면 먼저 만들어진 작업이 아니라 먼저 시도할 차례인 작업부터 꺼냅니다.
+        now = timezone.now()
+        RecommendationJob.objects.filter(user=self.user).update(next_attempt_at=now - timedelta(seconds=1))
+        RecommendationJob.objects.filter(user=other).update(next_attempt_at=now - timedelta(seconds=30))
+        self.assertEqual(recommendation_queue.claim_next().user_id, other.id)
+        self.assertEqual(recommendation_queue.claim_next().user_id, self.user.id)
+
+    def test_failed_retry_yields_to_existing_pending_job(self):
+        recommendation_queue.enqueue(self.user.id, 'comment')
+        job = recommendation_queue.claim_next()
+        self.assertIsNotNone(recommendation_queue.enqueue(self.user.id, 'profile'))  # 실행 중에 프로필 변경
+        with mock.patch.object(recommendation_queue, 'get_llm_recommendation', return_value=None):
+            self.assertFalse(recommendation_queue.process(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, RecommendationJob.STATUS_FAILED)
+        self.assertEqual(RecommendationJob.objects.filter(user=self.user, status=RecommendationJob.STATUS_PENDING).count(), 1)
+
+    def test_stale_running_job_is_recovered(self):
+        recommendation_queue.enqueue(self.user.id, 'comment')
+        job = recommendation_queue.claim_next()
+        RecommendationJob.objects.filter(pk=job.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(recommendation_queue.recover_stale_jobs(), 1)
+        self.assertEqual(recommendation_queue.claim_next().pk, job.pk)
+
+    def test_get_precomputed_ignores_deleted_books(self):
+        recommendation_queue.save_result(self.user, [{'book': {'id': book.pk}, 'reason': '이유'} for book in self.books])
+        self.books[1].delete()
+        self.assertIsNone(recommendation_queue.get_precomputed(self.user))
+
+    def test_expired_result_is_returned_and_recomputed(self):
+        recommendation_queue.save_result(self.user, [{'book': {'id': book.pk}, 'reason': '이유'} for book in self.books])
+        PrecomputedRecommendation.objects.update(computed_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(len(recommendation_queue.get_precomputed(self.user)), 2)
+        self.assertEqual(RecommendationJob.objects.get(user=self.user).reason, 'expired')
+
+    def test_prune_deletes_only_finished_jobs_past_retention(self):
+        now = timezone.now()
+        other = _make_user('다른사람')
+
+        def job(user, status, finished_hours_ago):
+            finished_at = now - timedelta(hours=finished_hours_ago) if finished_hours_ago is not None else None
+            return RecommendationJob.objects.create(user=user, reason='test', status=status, finished_at=finished_at)
+
+        old_done = job(self.user, RecommendationJob.STATUS_DONE, 2)
+        recent_done = job(self.user, RecommendationJob.STATUS_DONE, 0.5)
+        recent_failed = job(self.user, RecommendationJob.STATUS_FAILED, 2)
+        old_failed = job(other, RecommendationJob.STATUS_FAILED, 48)
+        pending = job(other, RecommendationJob.STATUS_PENDING, None)
+
+        self.assertEqual(recommendation_queue.prune_finished_jobs(), 2)
+        remaining = set(RecommendationJob.objects.values_list('id', flat=True))
+        self.assertEqual(remaining, {recent_done.id, recent_failed.id, pending.id})
+        self.assertNotIn(old_done.id, remaining)
+        self.assertNotIn(old_failed.id, remaining)
+
+
+@override_settings(TASTE_LIBRARY_WEIGHT=1.0, TASTE_COMMENT_WEIGHT=1.0, EMBEDDING_INDEX_QUANTIZATION=None)
+class TasteDeltaTests(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.books = [_make_book(i, rng.normal(size=8)) for i in range(1, 4)]
+        self.user = _make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def comment(self, book, rating):
+        response = self.client.post(f'/api/books/{book.pk}/comments/', {'content': '좋아요', 'rating': rating})
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def update(self, book, comment_id, rating):
+        response = self.client.patch(f'/api/books/{book.pk}/comments/{comment_id}/', {'rating': rating})
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def delete(self, book, comment_id):
+        response = self.client.delete(f'/api/books/{book.pk}/comments/{comment_id}/')
+        self.assertEqual(response.status_code, 204, response.content)
+
+    def incremental_and_rebuilt(self):
+        self.user.refresh_from_db()
+        incremental = (self.user.taste_vector, self.user.taste_weight)
+        rebuild_taste_vector(self.user)
+        self.user.refresh_from_db()
+        return incremental, (self.user.taste_vector, self.user.taste_weight)
+
+    def test_create_update_delete_deltas_match_rebuild(self):
+        a, b, c = self.books
+        first_a = self.comment(a, 5)
+        self.comment(a, 2)              # 같은 책의 두 번째 댓글: 서재 가중치는 더하지 않음
+        on_b = self.comment(b, 3)
+        self.update(b, on_b, 1)
+        self.delete(a, first_a)         # 댓글이 남아 있어 서재에 유지
+        on_c = self.comment(c, 4)
+        self.delete(c, on_c)            # 마지막 댓글이라 서재에서도 빠짐
+
+        (vector, weight), (expected_vector, expected_weight) = self.incremental_and_rebuilt()
+        self.assertIsNotNone(vector)
+        self.assertAlmostEqual(weight, 1 + 2 / 5 + 1 + 1 / 5)  # a: 서재 + 평점 2, b: 서재 + 평점 1
+        self.assertAlmostEqual(weight, expected_weight, places=5)
+        np.testing.assert_allclose(decode_embedding(vector), decode_embedding(expected_vector), atol=1e-5)
+
+    def test_deleting_everything_clears_taste_vector(self):
+        a, b, _ = self.books
+        comments = [(a, self.comment(a, 5)), (b, self.comment(b, 1))]
+        for book, comment_id in comments:
+            self.delete(book, comment_id)
+
+        (vector, weight), rebuilt = self.incremental_and_rebuilt()
+        self.assertEqual((vector, weight), (None, 0))
+        self.assertEqual(rebuilt, (None, 0))
+
+
+@override_settings(EMBEDDING_INDEX_QUANTIZATION=None)
+class FavoriteBookEmbeddingTests(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.books = [_make_book(i, rng.normal(size=8)) for i in range(1, 4)]
+        self.user = _make_user()
+        self.user.favorite_book = '카탈로그에 없는 책'
+        self.user.save(update_fields=['favorite_book'])
+        self.gms = mock.Mock()
+        self.gms.embeddings.create.return_value = mock.Mock(data=[mock.Mock(embedding=[1.0] * 8)])
+        patcher = mock.patch('books.utils.get_client', return_value=self.gms)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fallback_uses_only_cached_embeddings(self):
+        RecommendationView.build_fallback_result(self.user)
+        self.gms.embeddings.create.assert_not_called()
+
+        embedding_cache.set_many([self.user.favorite_book], [np.ones(8)], EMBEDDING_MODEL)
+        candidates = retrieve_candidates(self.user, k=2, allow_network=False)
+        self.assertEqual(len(candidates), 2)
+        self.gms.embeddings.create.assert_not_called()
+
+    def test_prompt_embeds_favorite_book_once(self):
+        RecommendationView.build_prompt(self.user)
+        self.user.favorite_book = '  카탈로그에   없는 책 '
+        RecommendationView.build_prompt(self.user)
+        self.assertEqual(self.gms.embeddings.create.call_count, 1)
+
+    def test_catalog_title_skips_embeddings_api(self):
+        self.user.favorite_book = self.books[0].title.upper()
+        candidates = retrieve_candidates(self.user, k=2)
+        self.assertNotIn(self.books[0], candidates)
+        self.gms.embeddings.create.assert_not_called()
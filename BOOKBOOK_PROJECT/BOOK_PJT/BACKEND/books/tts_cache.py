@@ -0,0 +1,305 @@
+# books/tts_cache.py
+"""
+TTS 음성(mp3) 디스크 캐시입니다.
+
+같은 댓글을 같은 목소리로 다시 듣는 경우가 많으므로, (텍스트, 목소리, 모델, 형식)의 sha256을 파일 이름으로
+settings.TTS_CACHE_DIR 아래에 저장해 두고 GMS를 다시 호출하지 않고 디스크에서 바로 응답합니다.
+
+- 쓰기: 같은 디렉터리의 임시 파일에 쓴 뒤(스트리밍 중이면 받는 대로, tee()) os.replace()로 바꿔치기하므로, 여러 워커가 동시에 같은 파일을
+  쓰거나 읽어도 반쯤 쓰인 파일을 보지 않습니다. (내용이 키로 정해지므로 누가 이겨도 결과는 같음)
+- 크기 제한: 적중할 때마다 파일의 수정 시각을 갱신하고, 전체 크기가 TTS_CACHE_MAX_BYTES를 넘으면
+  가장 오래 안 쓴 파일부터 삭제합니다. (쓰기 TTS_CACHE_PRUNE_INTERVAL번마다, 또는 cleanup_tts_cache 명령)
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+
+from .utils import TTS_FORMAT, TTS_MODEL
+
+CONTENT_TYPES = {'mp3': 'audio/mpeg'}
+
+_TMP_SUFFIX = '.tmp'
+# 비동기 응답에서 캐시 파일을 한 번에 읽는 크기
+_READ_CHUNK_SIZE = 64 * 1024
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'writes': 0, 'written_bytes': 0, 'evicted': 0}
+_writes_since_prune = 0
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def make_key(text, voice, model=TTS_MODEL, fmt=TTS_FORMAT):
+    """(모델, 형식, 목소리, 텍스트)의 sha256"""
+    return hashlib.sha256(f"{model}\n{fmt}\n{voice}\n{text}".encode('utf-8')).hexdigest()
+
+
+def path_for(key, fmt=TTS_FORMAT):
+    # 한 디렉터리에 파일이 너무 많아지지 않도록 키 앞 4글자로 두 단계 나눕니다.
+    return os.path.join(settings.TTS_CACHE_DIR, key[:2], key[2:4], f"{key}.{fmt}")
+
+
+def get(key, fmt=TTS_FORMAT):
+    """캐시된 파일 경로를 반환합니다. 없으면 None. 적중하면 LRU 순서를 위해 수정 시각을 갱신합니다."""
+    path = path_for(key, fmt)
+    try:
+        os.utime(path)
+    except OSError:  # 없음 (또는 방금 삭제됨)
+        _count('misses')
+        return None
+    _count('hits')
+    return path
+
+
+class CacheWriter:
+    """
+    음성 바이트를 같은 디렉터리의 임시 파일에 조금씩 쓰고, commit()할 때 캐시 파일로 바꿔치기합니다. (abort()면 버림)
+    디스크 오류가 나면 로그만 남기고 캐시 저장만 포기합니다. (응답은 그대로 계속)
+    """
+
+    def __init__(self, key, fmt=TTS_FORMAT):
+        self.path = path_for(key, fmt)
+        self.size = 0
+        self._file = None
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd, self._tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=_TMP_SUFFIX)
+            self._file = os.fdopen(fd, 'wb')
+        except OSError as e:
+            print(f"TTS 캐시 저장 실패: {e}")
+
+    def write(self, chunk):
+        if self._file is None:
+            return
+        try:
+            self._file.write(chunk)
+            self.size += len(chunk)
+        except OSError as e:
+            print(f"TTS 캐시 저장 실패: {e}")
+            self.abort()
+
+    def commit(self):
+        """캐시에 올린 파일 경로를 반환합니다. (실패하면 None)"""
+        if self._file is None:
+            return None
+        try:
+            self._file.close()
+            self._file = None
+            os.replace(self._tmp_path, self.path)
+        except OSError as e:
+            print(f"TTS 캐시 저장 실패: {e}")
+            self._file = None
+            self._unlink()
+            return None
+        _count('writes')
+        _count('written_bytes', self.size)
+        _maybe_prune()
+        return self.path
+
+    def abort(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        self._unlink()
+
+    def _unlink(self):
+        try:
+            os.unlink(self._tmp_path)
+        except OSError:
+            pass
+
+
+def put(key, content, fmt=TTS_FORMAT):
+    """음성 바이트를 원자적으로 저장하고 경로를 반환합니다. 디스크 오류는 로그만 남기고 None을 반환합니다."""
+    writer = CacheWriter(key, fmt)
+    writer.write(content)
+    return writer.commit()
+
+
+def tee(key, chunks, fmt=TTS_FORMAT):
+    """
+    chunks(음성 바이트 조각)를 그대로 내보내면서 캐시 파일에도 씁니다.
+    끝까지 받았을 때만 캐시에 올리고, 업스트림 오류나 클라이언트 연결 끊김으로 중단되면 임시 파일을 지웁니다.
+    """
+    writer = CacheWriter(key, fmt)
+    try:
+        for chunk in chunks:
+            writer.write(chunk)
+            yield chunk
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+    writer.commit()
+
+
+async def atee(key, chunks, fmt=TTS_FORMAT):
+    """tee()의 비동기 버전. 임시 파일 생성과 캐시 반영(크기 정리 포함)은 스레드에서 실행합니다."""
+    writer = await sync_to_async(CacheWriter)(key, fmt)
+    try:
+        async for chunk in chunks:
+            writer.write(chunk)  # 몇 KB씩 페이지 캐시에 쓰는 작업이라 이벤트 루프를 거의 막지 않습니다.
+            yield chunk
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        aclose = getattr(chunks, 'aclose', None)
+        if aclose is not None:
+            await aclose()
+    await sync_to_async(writer.commit)()
+
+
+def _maybe_prune():
+    global _writes_since_prune
+    with _stats_lock:
+        _writes_since_prune += 1
+        if _writes_since_prune < settings.TTS_CACHE_PRUNE_INTERVAL:
+            return
+        _writes_since_prune = 0
+    prune()
+
+
+def _scan():
+    """(경로, 크기, 수정 시각) 목록. 임시 파일은 따로 반환합니다."""
+    files, temporaries = [], []
+    for root, _, names in os.walk(settings.TTS_CACHE_DIR):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            (temporaries if name.endswith(_TMP_SUFFIX) else files).append((path, stat.st_size, stat.st_mtime))
+    return files, temporaries
+
+
+def prune(max_bytes=None, older_than=None, stale_tmp_after=3600):
+    """
+    전체 크기가 max_bytes(기본 TTS_CACHE_MAX_BYTES) 이하가 될 때까지 오래 안 쓴 파일부터 삭제합니다.
+    older_than(초)를 주면 그보다 오래 안 쓴 파일도 삭제하며, 쓰다가 죽은 프로세스가 남긴 임시 파일도 정리합니다.
+    (삭제한 파일 수, 삭제한 바이트, 남은 파일 수, 남은 바이트)를 반환합니다.
+    """
+    max_bytes = settings.TTS_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    now = time.time()
+    files, temporaries = _scan()
+
+    removed, freed = 0, 0
+    for path, size, mtime in temporaries:
+        if now - mtime > stale_tmp_after:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    files.sort(key=lambda item: item[2])  # 오래 안 쓴 순서
+    total = sum(size for _, size, _ in files)
+    kept = []
+    for path, size, mtime in files:
+        expired = older_than is not None and now - mtime > older_than
+        if expired or total > max_bytes:
+            try:
+                os.unlink(path)
+            except OSError:
+                kept.append((path, size, mtime))
+                continue
+            removed += 1
+            freed += size
+            total -= size
+        else:
+            kept.append((path, size, mtime))
+
+    _count('evicted', removed)
+    return removed, freed, len(kept), total
+
+
+def _open_cached(key, fmt=TTS_FORMAT):
+    """캐시된 파일을 열어 (파일, 크기)를 반환합니다. 없거나 확인한 뒤 다른 워커가 삭제했으면 None."""
+    path = get(key, fmt)
+    if path is None:
+        return None
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return None
+    return f, os.fstat(f.fileno()).st_size
+
+
+def cached_response(key, fmt=TTS_FORMAT):
+    """캐시된 파일을 디스크에서 그대로 보내는 응답. 없으면 None. (내용이 키로 정해지므로 ETag로 키를 사용)"""
+    opened = _open_cached(key, fmt)
+    if opened is None:
+        return None
+    resp = FileResponse(opened[0], content_type=CONTENT_TYPES.get(fmt, 'application/octet-stream'))
+    set_headers(resp, key, 'hit')
+    return resp
+
+
+async def _aread_chunks(f, chunk_size=_READ_CHUNK_SIZE):
+    """파일을 chunk_size씩 스레드에서 읽어 내보냅니다. (이벤트 루프를 디스크 읽기로 막지 않음)"""
+    read = sync_to_async(f.read, thread_sensitive=False)
+    try:
+        while True:
+            chunk = await read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        f.close()
+
+
+async def acached_response(key, fmt=TTS_FORMAT):
+    """
+    cached_response()의 비동기 버전. 파일 전체를 메모리에 올리지 않고 조금씩 읽어 흘려보냅니다.
+    (ASGI에서 FileResponse 같은 동기 이터레이터는 끝까지 모은 뒤 전송되므로 비동기 이터레이터를 넘깁니다.)
+    """
+    opened = await sync_to_async(_open_cached)(key, fmt)
+    if opened is None:
+        return None
+    f, size = opened
+    resp = StreamingHttpResponse(_aread_chunks(f), content_type=CONTENT_TYPES.get(fmt, 'application/octet-stream'))
+    resp['Content-Length'] = str(size)
+    set_headers(resp, key, 'hit')
+    return resp
+
+
+def cached_bytes(key, fmt=TTS_FORMAT):
+    """캐시된 음성 바이트. 없으면 None. (문장 단위처럼 작은 음성용)"""
+    path = get(key, fmt)
+    if path is None:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def set_headers(resp, key, cache_status):
+    """캐시 응답/스트리밍 응답 공통 헤더 (내용이 키로 정해지므로 ETag로 키를 사용)"""
+    resp['ETag'] = f'"{key}"'
+    resp['Cache-Control'] = f"private, max-age={settings.TTS_CACHE_CLIENT_MAX_AGE}"
+    resp['X-TTS-Cache'] = cache_status
+
+
+def stats():
+    """프로세스가 시작된 이후의 캐시 적중/미스/저장/삭제 횟수와 적중률"""
+    with _stats_lock:
+        data = dict(_stats)
+    total = data['hits'] + data['misses']
+    data['hit_rate'] = round(data['hits'] / total, 4) if total else 0.0
+    return data
@@ -1,18 +1,28 @@
 from django.urls import path
-from .views import (BookListView, BookDetailView, RecommendedBooksView, 
+from .views import (BookListView, BookDetailView, RecommendedBooksView, BatchRecommendedBooksView,
                     BestsellerListView, RecommendationView, CommentCreateView,
                     CommentUpdateDestroyView, TextToSpeechView, SpeechToTextView
-                    ,BookDocentView)
+                    ,BookDocentView, MetricsView)
+from .async_views import (async_main_recommendations, async_text_to_speech_view,
+                          async_speech_to_text_view, async_book_docent_view)
 
 urlpatterns = [
     path('books/', BookListView.as_view(), name='book-list'),
     path('books/<int:pk>/', BookDetailView.as_view(), name='book-detail'),
     path('books/<int:book_pk>/comments/', CommentCreateView.as_view(), name='book-comment-create'),
     path('books/recommendations/<int:pk>/', RecommendedBooksView.as_view(), name='book-recommendations'), 
+    path('books/recommendations/batch/', BatchRecommendedBooksView.as_view(), name='book-recommendations-batch'),
     path('books/<int:book_pk>/comments/<int:pk>/', CommentUpdateDestroyView.as_view(), name='book-comment-update-destroy'),
     path('books/bestsellers/', BestsellerListView.as_view(), name='book-bestsellers'),
     path('books/main-recommendations/', RecommendationView.as_view(), name='main-recommendation'),
     path('books/tts/', TextToSpeechView.as_view(), name='text-to-speech'),
     path('books/transcribe/', SpeechToTextView.as_view(), name='speech-to-text'),
     path('books/<int:pk>/docent/', BookDocentView.as_view(), name='book-docent'),
+    path('books/metrics/', MetricsView.as_view(), name='book-metrics'),
+
+    # GMS를 호출하는 엔드포인트의 비동기 버전 (ASGI로 실행할 때 사용: uvicorn bookbook_backend.asgi:application)
+    path('books/async/main-recommendations/', async_main_recommendations, name='async-main-recommendation'),
+    path('books/async/tts/', async_text_to_speech_view, name='async-text-to-speech'),
+    path('books/async/transcribe/', async_speech_to_text_view, name='async-speech-to-text'),
+    path('books/async/<int:pk>/docent/', async_book_docent_view, name='async-book-docent'),
 ]
\ No newline at end of file
@@ -2,52 +2,109 @@
 # books/utils.py
 
 import os
+import threading
 import time
-from openai import OpenAI
 import numpy as np
 
+from . import prompting, resilience
+from .http import get_http_client, get_openai_client
+
 # ⭐️ GMS KEY를 환경 변수에서 가져옵니다. ⭐️
 # .env 파일에 GMS_KEY="gsk-..." 형태로 저장되어 있어야 합니다.
 GMS_API_KEY = os.environ.get("GMS_KEY")
 
-# ⭐️ GMS 엔드포인트 정의 ⭐️
-GMS_API_BASE = "https://gms.ssafy.io/gmsapi/"
 
-# API 키는 환경 변수 (OPENAI_API_KEY)에서 자동으로 로드됩니다.
-try:
-    client = OpenAI(
-        api_key=GMS_API_KEY,           # GMS Key 사용
-        base_url=GMS_API_BASE + "api.openai.com/v1"       # GMS 엔드포인트 사용
-    ) 
-except Exception as e:
-    print(f"GMS 클라이언트 초기화 실패: API 키 설정 확인 필요. {e}")
-    client = None
+def get_client():
+    """
+    공유 연결 풀(books/http.py)을 쓰는 OpenAI 클라이언트를 반환합니다.
+    GMS 키가 설정되지 않았으면 None을 반환합니다.
+    """
+    if not GMS_API_KEY:
+        return None
+    return get_openai_client()
 
 # 사용할 임베딩 모델 정의
 EMBEDDING_MODEL = "text-embedding-3-small"
 
-def get_embedding(text):
+
+class TokenBucket:
+    """
+    스레드 안전한 토큰 버킷 호출 빈도 제한기입니다.
+    초당 rate개의 토큰이 채워지고, 최대 capacity개까지 몰아서(burst) 호출할 수 있습니다.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """토큰을 얻을 때까지 대기합니다."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# 임베딩 API 호출 빈도 제한 (프로세스 전체 공유, 기존의 고정 0.1초 대기를 대체)
+embedding_rate_limiter = TokenBucket(rate=10, capacity=10)
+
+
+def build_embedding_text(book):
+    """
+    임베딩을 생성할 도서 텍스트를 조합합니다.
+    """
+    return (
+        f"제목: {book.title}. "
+        f"부제: {book.subTitle}. "
+        f"저자: {book.author}. "
+        f"출판사: {book.publisher}. "
+        f"카테고리: {book.category.name if book.category else 'N/A'}. "
+        f"내용 요약: {book.description}"
+    )
+
+def get_embedding(text, cache_only=False):
     """
     주어진 텍스트에 대해 OpenAI 임베딩 벡터를 생성합니다.
+    cache_only=True이면 EmbeddingCache만 조회하고, 없으면 API를 호출하지 않고 None을 반환합니다.
     """
-    global client
-    if not client:
-        return None
-        
     if not text:
         return None
-    
+
+    # 같은 텍스트로 만든 임베딩이 캐시에 있으면 API를 호출하지 않습니다.
+    from . import embedding_cache
+    cached = embedding_cache.get_many([text], EMBEDDING_MODEL)
+    if text in cached:
+        return cached[text].tolist()
+    if cache_only:
+        return None
+
+    client = get_client()
+    if not client:
+        return None
+
     try:
-        # API 호출 전 호출 빈도 제한을 피하기 위해 잠시 대기
-        time.sleep(0.1) 
+        # 호출 빈도 제한 (토큰이 남아 있으면 대기 없이 바로 호출)
+        embedding_rate_limiter.acquire()
         
-        # OpenAI API 호출
-        response = client.embeddings.create(
+        # OpenAI API 호출 (서킷 브레이커/데드라인/재시도 적용)
+        response = resilience.call('embeddings', lambda timeout: client.embeddings.create(
             input=text.replace("\n", " "),
-            model=EMBEDDING_MODEL
-        )
+            model=EMBEDDING_MODEL,
+            timeout=timeout
+        ))
+        embedding = response.data[0].embedding
+        embedding_cache.set_many([text], [embedding], EMBEDDING_MODEL)
         # 벡터 (리스트 형태) 반환
-        return response.data[0].embedding
+        return embedding
     
     except Exception as e:
         print(f"Error generating embedding for text: {text[:50]}... Error: {e}")
@@ -56,15 +113,68 @@ def get_embedding(text):
             print(f"API 응답 오류: {e.response.json()}")
         return None
 
+def get_embeddings(texts, rate_limiter=None, retries=None):
+    """
+    여러 텍스트의 임베딩을 한 번의 API 호출로 생성합니다.
+    캐시에 있는 텍스트는 제외하고 나머지만 호출하며, 모두 캐시에 있으면 API를 호출하지 않습니다.
+    입력 순서대로 벡터 리스트를 반환하며, 일시적 오류는 resilience.call이 retries번까지(기본: GMS_RETRY_ATTEMPTS)
+    다시 시도하고 그래도 실패하면 예외를 올립니다.
+    rate_limiter(TokenBucket)를 주면 실제 API를 호출할 때만 토큰을 소비합니다.
+    """
+    if not texts:
+        return []
+
+    from . import embedding_cache
+    cached = embedding_cache.get_many(texts, EMBEDDING_MODEL)
+    missing = list(dict.fromkeys(text for text in texts if text not in cached))
+
+    if missing:
+        client = get_client()
+        if not client:
+            raise RuntimeError("GMS 클라이언트가 초기화되지 않았습니다.")
+        (rate_limiter or embedding_rate_limiter).acquire()
+        response = resilience.call('embeddings', lambda timeout: client.embeddings.create(
+            input=[text.replace("\n", " ") for text in missing],
+            model=EMBEDDING_MODEL,
+            timeout=timeout
+        ), retries=retries)
+        # 응답 순서가 보장되지 않을 수 있으므로 index 기준으로 정렬
+        vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        embedding_cache.set_many(missing, vectors, EMBEDDING_MODEL)
+        cached.update(zip(missing, vectors))
+
+    return [cached[text] for text in texts]
+
+# 임베딩 바이너리 저장 형식 (Book.embedding_dtype 값과 동일)
+EMBEDDING_DTYPES = ('float32', 'float16')
+
+def encode_embedding(vector, dtype='float32'):
+    """
+    임베딩 벡터(리스트 또는 ndarray)를 DB에 저장할 바이트로 변환합니다.
+    """
+    if dtype not in EMBEDDING_DTYPES:
+        raise ValueError(f"지원하지 않는 임베딩 저장 형식입니다: {dtype}")
+    return np.asarray(vector, dtype=dtype).tobytes()
+
+def decode_embedding(blob, dtype='float32'):
+    """
+    DB에 저장된 바이트를 복사 없이 NumPy 배열(읽기 전용 뷰)로 변환합니다.
+    """
+    if blob is None:
+        return None
+    if dtype not in EMBEDDING_DTYPES:
+        raise ValueError(f"지원하지 않는 임베딩 저장 형식입니다: {dtype}")
+    return np.frombuffer(blob, dtype=dtype)
+
 def calculate_cosine_similarity(vector_a, vector_b):
     """
     두 벡터 간의 코사인 유사도를 계산합니다. (NumPy 필요)
     """
-    if not vector_a or not vector_b:
+    if vector_a is None or vector_b is None or len(vector_a) == 0 or len(vector_b) == 0:
         return -1
     
-    a = np.array(vector_a)
-    b = np.array(vector_b)
+    a = np.asarray(vector_a, dtype=np.float32)
+    b = np.asarray(vector_b, dtype=np.float32)
     
     # 코사인 유사도 공식: (A · B) / (||A|| * ||B||)
     dot_product = np.dot(a, b)
@@ -83,29 +193,131 @@ def calculate_cosine_similarity(vector_a, vector_b):
 # ⭐️ LLM 모델 정의 (Chat 모델 사용) ⭐️
 LLM_MODEL = "gpt-4o-mini" # GMS에서 사용 가능한 LLM 모델
 
-def get_llm_recommendation(prompt_message):
+# 기존 호출부에서 사용하던 기본 시스템 메시지
+DEFAULT_LLM_SYSTEM_MESSAGE = "당신은 한국 시장의 판매 트렌드를 잘 아는 전문 도서 추천가입니다. 사용자에게 제공된 데이터를 기반으로 가장 판매량이 높을 것으로 예상되는 책의 제목과 저자를 20권 이상 겹치지 않도록 응답하세요. 응답은 오직 JSON 리스트 형태로만 이루어져야 합니다."
+
+def get_llm_recommendation(prompt_message, call_site='default', system_message=None,
+                           response_format='json_object', use_cache=True, raise_unavailable=False):
     """
-    주어진 프롬프트를 LLM에 전달하고 응답을 받습니다.
+    주어진 프롬프트를 LLM에 전달하고 응답을 받습니다. (실패하거나 GMS 장애 중이면 None)
+    같은 (모델, 시스템 메시지, 프롬프트, 응답 형식)의 응답은 LLMResponseCache에 저장해 두고 재사용합니다.
+    call_site: 호출 위치 이름 ('docent', 'bestseller' 등). settings.LLM_CACHE_TTL에서 캐시 유지 시간을 정합니다.
+    raise_unavailable: True면 GMS 장애(서킷 열림/데드라인 초과/재시도 소진)를 None 대신 GMSUnavailable로 올립니다.
+        (대체 응답이 없어 503으로 알려야 하는 호출부용. 추천/베스트셀러처럼 대체 응답이 있는 곳은 None을 받습니다.)
     """
-    global client
+    system_message = system_message or DEFAULT_LLM_SYSTEM_MESSAGE
+
+    # 캐시된 응답은 API 키가 없어도 그대로 돌려줍니다.
+    from . import llm_cache
+    cache_key = llm_cache.make_key(LLM_MODEL, system_message, prompt_message, response_format)
+    if use_cache:
+        cached = llm_cache.get(cache_key, call_site)
+        if cached is not None:
+            return cached
+
+    client = get_client()
     if not client:
         return None
-    
+
     try:
-        # LLM 호출
-        response = client.chat.completions.create(
+        options = {}
+        if response_format:
+            # ⭐️ 응답을 JSON 형식으로 강제합니다. ⭐️
+            options['response_format'] = {"type": response_format}
+
+        # LLM 호출 (서킷 브레이커가 열려 있으면 기다리지 않고 바로 실패합니다)
+        response = resilience.call('chat', lambda timeout: client.chat.completions.create(
             model=LLM_MODEL,
             messages=[
-                {"role": "system", "content": "당신은 한국 시장의 판매 트렌드를 잘 아는 전문 도서 추천가입니다. 사용자에게 제공된 데이터를 기반으로 가장 판매량이 높을 것으로 예상되는 책의 제목과 저자를 20권 이상 겹치지 않도록 응답하세요. 응답은 오직 JSON 리스트 형태로만 이루어져야 합니다."},
+                {"role": "system", "content": system_message},
                 {"role": "user", "content": prompt_message}
             ],
-            # ⭐️ 응답을 JSON 형식으로 강제합니다. ⭐️
-            response_format={"type": "json_object"} 
-        )
+            timeout=timeout,
+            **options
+        ))
         
+        prompting.record_response_usage(call_site, response, prompt_message)
         # 응답 텍스트를 JSON으로 파싱하여 반환
-        return response.choices[0].message.content
+        content = response.choices[0].message.content
+        if use_cache and content:
+            llm_cache.set(cache_key, content, LLM_MODEL, call_site)
+        return content
     
+    except resilience.GMSUnavailable as e:
+        if raise_unavailable:
+            raise
+        print(f"Error calling LLM API: {e}")
+        return None
     except Exception as e:
         print(f"Error calling LLM API: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+# TTS 모델과 음성 형식 (tts_cache의 캐시 키에도 포함됩니다)
+TTS_MODEL = "gpt-4o-mini-tts"
+TTS_FORMAT = "mp3"
+
+
+def tts_payload(text, voice):
+    """GMS TTS(gpt-4o-mini-tts) 요청 본문"""
+    return {
+        "model": TTS_MODEL,
+        "input": text,
+        "voice": voice,
+        "response_format": TTS_FORMAT
+    }
+
+
+def open_text_to_speech(text, voice):
+    """
+    GMS TTS(gpt-4o-mini-tts)를 공유 연결 풀에 스트리밍 모드로 요청하고, 응답 헤더까지만 받은 httpx.Response를 반환합니다.
+    본문은 iter_audio()로 받는 대로 읽습니다. (mp3 전체를 메모리에 올리지 않음)
+    본문을 받기 전까지는 429/5xx를 데드라인 안에서 다시 시도하며, 그래도 실패하면 본문까지 읽은 마지막 응답을 반환합니다.
+    GMS 장애로 서킷 브레이커가 열려 있으면 resilience.GMSUnavailable을 올립니다.
+    """
+    client = get_http_client()
+
+    def send(timeout):
+        request = client.build_request("POST", "/audio/speech", json=tts_payload(text, voice), timeout=timeout)
+        response = client.send(request, stream=True)
+        if response.status_code != 200:
+            response.read()
+            response.close()
+        return resilience.raise_for_transient_status(response)
+
+    try:
+        return resilience.call('tts', send)
+    except resilience.TransientHTTPError as e:
+        return e.response
+
+
+def iter_audio(response):
+    """open_text_to_speech()의 응답 본문을 받는 대로 내보내고, 끝나거나 중단되면 연결을 풀에 돌려놓습니다."""
+    try:
+        yield from response.iter_bytes()
+    finally:
+        response.close()
+
+
+def stream_text_to_speech(text, voice):
+    """
+    GMS TTS 음성을 받는 대로 내보냅니다. GMS가 오류를 반환하면 RuntimeError를 올립니다.
+    """
+    response = open_text_to_speech(text, voice)
+    if response.status_code != 200:
+        raise RuntimeError(f"GMS TTS 오류: {response.status_code} - {response.text[:200]}")
+    yield from iter_audio(response)
+
+
+def transcribe(name, audio, content_type):
+    """
+    Whisper-1로 음성을 텍스트로 변환합니다. (서킷 브레이커/데드라인/재시도 적용)
+    audio: 바이트 또는 열린 파일. 파일이면 전체를 메모리에 올리지 않고 조각 단위로 읽어 보냅니다. (재시도 시 처음부터)
+    """
+    transcription = resilience.call('stt', lambda timeout: get_openai_client().audio.transcriptions.create(
+        model="whisper-1",
+        file=(name, audio, content_type),
+        response_format="json",
+        timeout=timeout
+    ))
+    return transcription.text
@@ -0,0 +1,486 @@
+# books/vector_index.py
+
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .ann import get_ann_index
+from .quantization import Int8Index
+from .utils import decode_embedding
+
+# 다른 워커 프로세스에게 인덱스가 낡았음을 알리기 위한 캐시 키
+# (LocMemCache는 프로세스 단위이므로, Redis/Memcached 등 공유 캐시를 쓸 때 프로세스 간에 전파됩니다.)
+INDEX_VERSION_CACHE_KEY = 'books:embedding_index_version'
+# 카테고리/베스트셀러/출간일만 바뀌었을 때 쓰는 키 (벡터는 다시 읽지 않고 필터용 메타데이터만 다시 읽음)
+METADATA_VERSION_CACHE_KEY = 'books:embedding_index_metadata_version'
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def fetch_exact_vectors(book_ids):
+    """DB에서 원본 정밀도 임베딩을 읽어 {book_id: 정규화된 float32 벡터}로 반환합니다."""
+    from .models import Book  # 앱 로딩 순서 문제를 피하기 위해 지연 import
+
+    rows = (
+        Book.objects.filter(id__in=list(book_ids), embedding_vector__isnull=False)
+        .values_list('id', 'embedding_vector', 'embedding_dtype')
+    )
+    vectors = {}
+    for book_id, blob, dtype in rows:
+        vector = decode_embedding(blob, dtype).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        vectors[book_id] = vector / norm if norm else vector
+    return vectors
+
+
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+
+class _Snapshot:
+    """
+    한 번 로딩한 인덱스 상태(벡터 + 필터용 메타데이터)입니다. 만든 뒤에는 바꾸지 않습니다.
+    다시 로딩할 때는 새 스냅샷을 만들어 EmbeddingIndex._snapshot 참조 하나만 바꿔치기하므로,
+    조회하는 스레드는 호출마다 스냅샷을 한 번 잡아 두면 로딩 중에도 같은 시점의 행렬/id/비트맵을 봅니다.
+    """
+
+    def __init__(self, ids, matrix, quantized, category_ids, bestseller, pub_dates, category_masks,
+                 version, metadata_version):
+        self.ids = _read_only(ids)                      # (N,) int64, 오름차순 정렬된 Book id
+        self.matrix = matrix                            # (N, D) float32, 각 행은 L2 정규화됨 (float 모드)
+        self.quantized = quantized                      # Int8Index (int8 모드)
+        # 필터용 메타데이터 (행 순서는 ids와 동일)
+        self.category_ids = _read_only(category_ids)    # (N,) int64, 카테고리 없음 = -1
+        self.bestseller = _read_only(bestseller)        # (N,) bool
+        self.pub_dates = _read_only(pub_dates)          # (N,) int32, date.toordinal()
+        self.category_masks = category_masks            # {category_id: (N,) bool} 미리 계산한 카테고리별 비트맵
+        self.version = version
+        self.metadata_version = metadata_version
+
+    @property
+    def dim(self):
+        if self.quantized is not None:
+            return self.quantized.codes.shape[1]
+        return self.matrix.shape[1]
+
+    def row_of(self, book_id):
+        ids = self.ids
+        pos = int(np.searchsorted(ids, book_id))
+        if pos < len(ids) and ids[pos] == book_id:
+            return pos
+        return None
+
+    def rows_of(self, book_ids):
+        """여러 book_id의 행 번호 배열을 반환합니다. (인덱스에 없는 id는 제외)"""
+        ids = self.ids
+        book_ids = np.fromiter(book_ids, dtype=np.int64)
+        if len(ids) == 0 or len(book_ids) == 0:
+            return np.empty(0, dtype=np.int64)
+        rows = np.clip(np.searchsorted(ids, book_ids), 0, len(ids) - 1)
+        return rows[ids[rows] == book_ids]
+
+
+class EmbeddingIndex:
+    """
+    전체 도서 임베딩을 정규화된 float32 행렬 하나로 메모리에 올려두는 프로세스 단위 인덱스입니다.
+    요청마다 모든 Book 행을 읽는 대신, 행렬-벡터 곱 한 번과 argpartition으로 top-k를 구합니다.
+
+    settings.EMBEDDING_INDEX_QUANTIZATION = 'int8' 이면 float32 행렬 대신 int8 코드만 메모리에 두고,
+    1차 근사 검색 후 상위 후보만 DB의 원본 벡터로 다시 채점합니다.
+
+    로딩한 상태는 _Snapshot 하나에 담아 한 번에 교체하며, 조회 메서드는 _ensure_loaded()가 돌려준 스냅샷만 사용합니다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._dirty = True
+
+    # ----------------------- 로딩 / 무효화 -----------------------
+    def invalidate(self):
+        """임베딩이 바뀌었을 때 호출합니다. 다음 조회 시 다시 로딩됩니다."""
+        self._dirty = True
+        try:
+            cache.incr(INDEX_VERSION_CACHE_KEY)
+        except ValueError:
+            cache.set(INDEX_VERSION_CACHE_KEY, 1, timeout=None)
+
+    def invalidate_metadata(self):
+        """
+        카테고리/베스트셀러/출간일이 바뀌었을 때 호출합니다. (QuerySet.update()는 시그널을 보내지 않으므로 직접 호출)
+        벡터는 그대로 두고 필터용 메타데이터만 다시 읽습니다.
+        """
+        try:
+            cache.incr(METADATA_VERSION_CACHE_KEY)
+        except ValueError:
+            cache.set(METADATA_VERSION_CACHE_KEY, 1, timeout=None)
+
+    def _current_version(self):
+        return cache.get(INDEX_VERSION_CACHE_KEY, 0)
+
+    def _current_metadata_version(self):
+        return cache.get(METADATA_VERSION_CACHE_KEY, 0)
+
+    def _is_fresh(self, snapshot, version, metadata_version):
+        return (
+            not self._dirty and snapshot is not None
+            and version == snapshot.version and metadata_version == snapshot.metadata_version
+        )
+
+    def _ensure_loaded(self):
+        """최신 스냅샷을 반환합니다. 낡았으면 다시 로딩한 뒤 참조를 한 번에 바꿉니다."""
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot, self._current_version(), self._current_metadata_version()):
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            version = self._current_version()
+            metadata_version = self._current_metadata_version()
+            if self._is_fresh(snapshot, version, metadata_version):
+                return snapshot
+            reload_vectors = self._dirty or snapshot is None or version != snapshot.version
+            # 로딩 중에 들어온 invalidate()가 지워지지 않도록 읽기 전에 내려 둡니다.
+            self._dirty = False
+            if reload_vectors:
+                ids, matrix, quantized = self._load()
+            else:
+                ids, matrix, quantized = snapshot.ids, snapshot.matrix, snapshot.quantized
+            snapshot = _Snapshot(ids, matrix, quantized, *self._load_metadata(ids),
+                                 version=version, metadata_version=metadata_version)
+            self._snapshot = snapshot
+            return snapshot
+
+    def _load(self, chunk_size=2000):
+        """임베딩을 읽어 (ids, float 행렬 또는 None, Int8Index 또는 None)을 반환합니다."""
+        from .models import Book  # 앱 로딩 순서 문제를 피하기 위해 지연 import
+
+        quantize = settings.EMBEDDING_INDEX_QUANTIZATION == 'int8'
+
+        # 텍스트 컬럼은 읽지 않고 id와 벡터만 가져옵니다.
+        rows = (
+            Book.objects.filter(embedding_vector__isnull=False)
+            .order_by('id')
+            .values_list('id', 'embedding_vector', 'embedding_dtype')
+        )
+
+        ids = []
+        blocks = []
+        chunk = []
+
+        def flush():
+            # float16으로 저장된 벡터도 float32로 통일하고, 청크 단위로 정규화(및 압축)하여
+            # 전체 float 행렬을 한 번에 만들지 않도록 합니다.
+            block = _normalize_rows(np.vstack(chunk).astype(np.float32, copy=False))
+            blocks.append(Int8Index.quantize(block) if quantize else block)
+            chunk.clear()
+
+        for book_id, blob, dtype in rows.iterator(chunk_size=chunk_size):
+            if blob:
+                ids.append(book_id)
+                chunk.append(decode_embedding(blob, dtype))
+                if len(chunk) >= chunk_size:
+                    flush()
+        if chunk:
+            flush()
+
+        matrix = None
+        quantized = None
+        if not blocks:
+            matrix = np.empty((0, 0), dtype=np.float32)
+        elif quantize:
+            quantized = Int8Index(
+                np.vstack([codes for codes, _ in blocks]),
+                np.concatenate([scales for _, scales in blocks]),
+            )
+        else:
+            matrix = _read_only(np.vstack(blocks))
+
+        return np.asarray(ids, dtype=np.int64), matrix, quantized
+
+    def _load_metadata(self, ids):
+        """
+        필터에 쓰는 도서 속성을 ids와 같은 행 순서의 배열로 읽고, 카테고리별 비트맵을 미리 만듭니다.
+        (category_ids, bestseller, pub_dates, category_masks)를 반환합니다.
+        """
+        from .models import Book  # 앱 로딩 순서 문제를 피하기 위해 지연 import
+
+        category_ids = np.full(len(ids), -1, dtype=np.int64)
+        bestseller = np.zeros(len(ids), dtype=bool)
+        pub_dates = np.zeros(len(ids), dtype=np.int32)
+
+        rows = (
+            Book.objects.filter(embedding_vector__isnull=False)
+            .order_by('id')
+            .values_list('id', 'category_id', 'is_bestseller', 'pub_date')
+        )
+        for book_id, category_id, is_bestseller, pub_date in rows.iterator(chunk_size=5000):
+            pos = int(np.searchsorted(ids, book_id))
+            if pos >= len(ids) or ids[pos] != book_id:
+                continue
+            category_ids[pos] = -1 if category_id is None else category_id
+            bestseller[pos] = is_bestseller
+            pub_dates[pos] = pub_date.toordinal() if pub_date else 0
+
+        category_masks = {
+            int(category_id): _read_only(category_ids == category_id)
+            for category_id in np.unique(category_ids)
+            if category_id >= 0
+        }
+        return category_ids, bestseller, pub_dates, category_masks
+
+    # ----------------------- 조회 -----------------------
+    def __len__(self):
+        return len(self._ensure_loaded().ids)
+
+    @property
+    def dim(self):
+        return self._ensure_loaded().dim
+
+    def book_ids(self):
+        """인덱스에 올라간 Book id 배열 (오름차순, 읽기 전용)"""
+        return self._ensure_loaded().ids
+
+    def max_scores(self, book_ids, block_size=None):
+        """
+        인덱스의 모든 도서 각각에 대해 book_ids 중 가장 가까운 도서와의 유사도를 (id 배열, (N,) float32)로 반환합니다.
+        블록 단위로 계산하며, int8 모드에서는 book_ids 쪽만 원본 정밀도로 읽고 블록마다 압축을 풀어 채점합니다.
+        (전체 행렬을 한 번에 풀지 않으므로 추가 메모리는 block_size x D 정도, 점수는 근사값)
+        """
+        snapshot = self._ensure_loaded()
+        matrix, quantized, ids = snapshot.matrix, snapshot.quantized, snapshot.ids
+        block_size = block_size or settings.SIMILAR_BOOKS_BLOCK_SIZE
+        best = np.full(len(ids), -np.inf, dtype=np.float32)
+        rows = snapshot.rows_of(book_ids)
+        if len(rows) == 0:
+            return ids, best
+
+        if quantized is None:
+            queries = matrix[rows]
+        else:
+            exact = fetch_exact_vectors(ids[rows].tolist())
+            if not exact:
+                return ids, best
+            queries = np.vstack(list(exact.values()))
+
+        for start in range(0, len(ids), block_size):
+            block = slice(start, start + block_size)
+            vectors = matrix[block] if quantized is None else quantized.dequantize(block)
+            best[block] = (vectors @ queries.T).max(axis=1)
+        return ids, best
+
+    def get_vector(self, book_id):
+        """인덱스에 올라간 (정규화된) 벡터를 반환합니다. 없으면 None."""
+        snapshot = self._ensure_loaded()
+        row = snapshot.row_of(book_id)
+        if row is None:
+            return None
+        if snapshot.quantized is not None:
+            # 기준 벡터는 근사값 대신 원본 정밀도로 사용합니다.
+            return fetch_exact_vectors([book_id]).get(book_id)
+        return snapshot.matrix[row]
+
+    @staticmethod
+    def _prepare_query(query_vector, dim):
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0 or query.shape[0] != dim:
+            return None
+        return query / norm
+
+    def filter_mask(self, category_id=None, is_bestseller=None, pub_date_from=None, pub_date_to=None):
+        """
+        조건을 만족하는 행이 True인 (N,) bool 배열을 반환합니다. 조건이 하나도 없으면 None.
+        카테고리는 로딩 시 미리 만든 비트맵을 쓰므로, 요청마다 DB를 조회하지 않고 O(N) 비트 연산만 합니다.
+        """
+        snapshot = self._ensure_loaded()
+        mask = None
+
+        def combine(current, condition):
+            return condition.copy() if current is None else current & condition
+
+        if category_id is not None:
+            category_mask = snapshot.category_masks.get(int(category_id))
+            if category_mask is None:
+                return np.zeros(len(snapshot.ids), dtype=bool)
+            mask = combine(mask, category_mask)
+        if is_bestseller is not None:
+            mask = combine(mask, snapshot.bestseller if is_bestseller else ~snapshot.bestseller)
+        if pub_date_from is not None:
+            mask = combine(mask, snapshot.pub_dates >= pub_date_from.toordinal())
+        if pub_date_to is not None:
+            mask = combine(mask, snapshot.pub_dates <= pub_date_to.toordinal())
+        return mask
+
+    @staticmethod
+    def _top_k(scores, k):
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def search(self, query_vector, k=10, exclude_ids=(), mask=None):
+        """
+        query_vector와 코사인 유사도가 가장 높은 k권의 (book_id, score) 목록을 반환합니다.
+        mask(filter_mask()의 결과)를 주면 True인 도서만 후보가 됩니다.
+        필터는 채점 직후 점수 배열에 바로 적용하므로, 필터 유무와 관계없이 계산량이 같습니다.
+        """
+        # 로딩 도중 다른 스레드가 스냅샷을 바꿔도 일관된 값을 쓰도록 한 번만 잡아둡니다.
+        snapshot = self._ensure_loaded()
+        return self._search(snapshot, query_vector, k, exclude_ids, mask)
+
+    def _search(self, snapshot, query_vector, k, exclude_ids, mask):
+        matrix, quantized, ids = snapshot.matrix, snapshot.quantized, snapshot.ids
+        if len(ids) == 0 or k <= 0:
+            return []
+        if mask is not None and len(mask) != len(ids):
+            # 필터를 만든 뒤 인덱스가 다시 로딩된 경우
+            return []
+
+        query = self._prepare_query(query_vector, snapshot.dim)
+        if query is None:
+            return []
+
+        # 카탈로그가 충분히 크고 ANN 인덱스가 만들어져 있다면 근사 탐색을 사용합니다.
+        if settings.ANN_ENABLED and len(ids) >= settings.ANN_MIN_CATALOG_SIZE:
+            ann = get_ann_index()
+            if ann is not None and ann.vectors.shape[1] == len(query):
+                id_filter = None
+                if mask is not None:
+                    def id_filter(candidate_ids):
+                        rows = np.clip(np.searchsorted(ids, candidate_ids), 0, len(ids) - 1)
+                        return (ids[rows] == candidate_ids) & mask[rows]
+                results = ann.search(query, k=k, exclude_ids=exclude_ids, id_filter=id_filter)
+                # 필터가 까다로워 탐색한 리스트 안에 k개가 없으면 아래의 완전 탐색으로 넘어갑니다.
+                if mask is None or len(results) >= k:
+                    return results
+
+        scores = quantized.scores(query) if quantized is not None else matrix @ query
+
+        if mask is not None:
+            scores[~mask] = -np.inf
+        scores[snapshot.rows_of(exclude_ids)] = -np.inf
+
+        if quantized is None:
+            return [
+                (int(ids[i]), float(scores[i]))
+                for i in self._top_k(scores, k)
+                if np.isfinite(scores[i])
+            ]
+
+        # int8 모드: 근사 점수 상위 후보만 원본 벡터로 다시 채점합니다.
+        shortlist = [
+            int(ids[i]) for i in self._top_k(scores, k * settings.QUANTIZED_RERANK_FACTOR)
+            if np.isfinite(scores[i])
+        ]
+        return rerank_exact(query, shortlist, k)
+
+    def search_many(self, source_ids, k=10, exclude_ids=(), mask=None, block_size=None, use_ann=True):
+        """
+        여러 기준 도서 각각에 대해 유사한 k권을 {source_id: [(book_id, score), ...]}로 반환합니다.
+        기준 도서 벡터를 행렬로 묶어 블록마다 행렬-행렬 곱 한 번으로 채점합니다.
+        (기준 도서 자신은 자동으로 제외되며, 인덱스에 없는 기준 도서는 결과에서 빠집니다.)
+        use_ann=False면 카탈로그가 커도 ANN 인덱스 대신 완전 탐색합니다. (유사 도서 테이블 일괄 계산)
+        """
+        snapshot = self._ensure_loaded()
+        matrix, quantized, ids = snapshot.matrix, snapshot.quantized, snapshot.ids
+        if len(ids) == 0 or k <= 0:
+            return {}
+        if mask is not None and len(mask) != len(ids):
+            return {}
+        block_size = block_size or settings.SIMILAR_BOOKS_BLOCK_SIZE
+
+        source_ids = list(dict.fromkeys(int(book_id) for book_id in source_ids))
+        source_rows = snapshot.rows_of(source_ids)
+        if len(source_rows) == 0:
+            return {}
+
+        # 대형 카탈로그에서는 기준 도서마다 ANN 검색을 사용합니다. (전체 행렬-행렬 곱은 너무 큼)
+        if use_ann and settings.ANN_ENABLED and len(ids) >= settings.ANN_MIN_CATALOG_SIZE and get_ann_index() is not None:
+            results = {}
+            exact_sources = fetch_exact_vectors(ids[source_rows].tolist()) if quantized is not None else None
+            for row in source_rows:
+                source_id = int(ids[row])
+                query = matrix[row] if quantized is None else exact_sources.get(source_id)
+                if query is None:
+                    continue
+                results[source_id] = self._search(snapshot, query, k, [source_id, *exclude_ids], mask)
+            return results
+
+        excluded_rows = snapshot.rows_of(exclude_ids)
+        if quantized is not None:
+            exact_sources = fetch_exact_vectors(ids[source_rows].tolist())
+            source_rows = np.array([row for row in source_rows if int(ids[row]) in exact_sources], dtype=np.int64)
+
+        results = {}
+        for start in range(0, len(source_rows), block_size):
+            rows = source_rows[start:start + block_size]
+            if quantized is None:
+                queries = matrix[rows]
+                scores = queries @ matrix.T
+            else:
+                queries = np.vstack([exact_sources[int(ids[row])] for row in rows])
+                scores = quantized.scores(queries)
+
+            if mask is not None:
+                scores[:, ~mask] = -np.inf
+            scores[:, excluded_rows] = -np.inf
+            scores[np.arange(len(rows)), rows] = -np.inf
+
+            n = min(k if quantized is None else k * settings.QUANTIZED_RERANK_FACTOR, len(ids))
+            top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+            if quantized is None:
+                for row, target_rows, target_scores in zip(rows, top, top_scores):
+                    results[int(ids[row])] = [
+                        (int(ids[target]), float(score))
+                        for target, score in zip(target_rows, target_scores)
+                        if np.isfinite(score)
+                    ]
+                continue
+
+            # int8 모드: 블록 안 모든 후보의 원본 벡터를 한 번에 읽어 다시 채점합니다.
+            shortlists = [
+                [int(ids[target]) for target, score in zip(target_rows, target_scores) if np.isfinite(score)]
+                for target_rows, target_scores in zip(top, top_scores)
+            ]
+            exact = fetch_exact_vectors({book_id for shortlist in shortlists for book_id in shortlist})
+            for row, query, shortlist in zip(rows, queries, shortlists):
+                results[int(ids[row])] = rerank_exact(query, shortlist, k, exact=exact)
+        return results
+
+    def memory_usage(self):
+        """인덱스가 차지하는 벡터 메모리(바이트)를 반환합니다."""
+        snapshot = self._ensure_loaded()
+        if snapshot.quantized is not None:
+            return snapshot.quantized.nbytes
+        return snapshot.matrix.nbytes
+
+
+def rerank_exact(query, shortlist, k, exact=None):
+    """
+    후보 도서들을 DB의 원본 정밀도 벡터로 다시 채점해 상위 k개의 (book_id, score)를 반환합니다.
+    exact({book_id: 벡터})를 주면 DB를 다시 읽지 않습니다.
+    """
+    if exact is None:
+        exact = fetch_exact_vectors(shortlist)
+    reranked = sorted(
+        ((book_id, float(exact[book_id] @ query)) for book_id in shortlist if book_id in exact),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    return reranked[:k]
+
+
+# 프로세스 전체에서 공유하는 인덱스 인스턴스
+embedding_index = EmbeddingIndex()
@@ -1,21 +1,28 @@
+import itertools
 import random
 from rest_framework import generics, status, permissions
 from django.conf import settings
-from .models import Book, Comment, Library
+from .models import Book, Comment, Library, SimilarBook
 from .serializers import BookListSerializer, BookDetailSerializer
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_date
 from .serializers import BookListSerializer, BookDetailSerializer, CommentSerializer
-from .utils import get_embedding, calculate_cosine_similarity, get_llm_recommendation # utils 함수 사용
-import numpy as np
+from .utils import get_llm_recommendation, iter_audio, open_text_to_speech # utils 함수 사용
+from .vector_index import embedding_index
+from .prompting import budget_for, clean, compact_table, short_title
+from .taste import apply_taste_delta, build_fast_recommendations, comment_weight, retrieve_candidates
+from . import (docent, embedding_cache, http, llm_cache, prompting, recommendation_queue, resilience, singleflight,
+               stt, tts_cache)
+from .docent import VOICE_MAP
+from .resilience import GMSUnavailable
 from django.contrib.auth import get_user_model
 from rest_framework.permissions import IsAuthenticated
-from django.http import HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 import json
-from openai import OpenAI
-import requests
 from rest_framework.authentication import TokenAuthentication
 
 
@@ -39,97 +46,250 @@ class RecommendedBooksView(APIView):
     """
     특정 책의 임베딩 벡터를 기반으로 유사한 도서 목록을 반환합니다.
     URL: GET /api/books/recommendations/<int:pk>/
+
+    선택 쿼리 파라미터 (유사도 계산 단계에서 함께 적용됩니다):
+    - category: 카테고리 id, 또는 'same' (기준 도서와 같은 카테고리)
+    - bestseller: true / false
+    - exclude_library: true 이면 로그인한 사용자의 서재에 담긴 책 제외
+    - pub_date_from, pub_date_to: 출간일 범위 (YYYY-MM-DD)
     """
+    TRUE_VALUES = ('true', '1', 'yes')
+    FALSE_VALUES = ('false', '0', 'no')
+
+    def _parse_filters(self, request, pk):
+        """쿼리 파라미터를 검색 필터로 변환합니다. 잘못된 값이면 (None, 에러 Response)를 반환합니다."""
+        params = request.query_params
+        filters = {}
+
+        category = params.get('category')
+        if category == 'same':
+            filters['category_id'] = Book.objects.filter(pk=pk).values_list('category_id', flat=True).first()
+            if filters['category_id'] is None:
+                filters['category_id'] = -1  # 기준 도서에 카테고리가 없으면 결과 없음
+        elif category:
+            if not category.isdigit():
+                return None, Response({"detail": "category는 숫자 id 또는 'same'이어야 합니다."}, status=status.HTTP_400_BAD_REQUEST)
+            filters['category_id'] = int(category)
+
+        bestseller = params.get('bestseller', '').lower()
+        if bestseller in self.TRUE_VALUES:
+            filters['is_bestseller'] = True
+        elif bestseller in self.FALSE_VALUES:
+            filters['is_bestseller'] = False
+        elif bestseller:
+            return None, Response({"detail": "bestseller는 true 또는 false여야 합니다."}, status=status.HTTP_400_BAD_REQUEST)
+
+        for name in ('pub_date_from', 'pub_date_to'):
+            value = params.get(name)
+            if value:
+                try:
+                    parsed = parse_date(value)
+                except ValueError:
+                    parsed = None
+                if parsed is None:
+                    return None, Response({"detail": f"{name}는 YYYY-MM-DD 형식이어야 합니다."}, status=status.HTTP_400_BAD_REQUEST)
+                filters[name] = parsed
+
+        exclude_library = params.get('exclude_library', '').lower() in self.TRUE_VALUES
+        if exclude_library and not request.user.is_authenticated:
+            return None, Response({"detail": "서재 제외 필터는 로그인이 필요합니다."}, status=status.HTTP_401_UNAUTHORIZED)
+
+        return (filters, exclude_library), None
+
     def get(self, request, pk, format=None):
-        try:
-            # 1. 기준이 될 책(Source Book) 찾기
-            source_book = Book.objects.get(pk=pk)
-            
-            # 임베딩 벡터가 없는 경우 에러 처리
-            if not source_book.embedding_vector:
-                return Response(
-                    {"detail": "기준 도서의 임베딩 벡터가 없습니다. 임베딩 생성을 먼저 완료해야 합니다."},
-                    status=status.HTTP_404_NOT_FOUND
-                )
-            
-            source_vector = source_book.embedding_vector
-            
-        except Book.DoesNotExist:
+        parsed, error = self._parse_filters(request, pk)
+        if error is not None:
+            return error
+        filters, exclude_library = parsed
+
+        # 0. 필터가 없고 미리 계산된 유사 도서 목록이 있으면 인덱스 조회 한 번으로 바로 응답
+        if not filters and not exclude_library:
+            precomputed = list(
+                SimilarBook.objects.filter(source_id=pk)
+                .select_related('target__category')
+                .order_by('rank')[:10]
+            )
+            if precomputed:
+                serializer = BookListSerializer([item.target for item in precomputed], many=True)
+                return Response(serializer.data, status=status.HTTP_200_OK)
+
+        # 1. 기준이 될 책(Source Book) 찾기
+        if not Book.objects.filter(pk=pk).exists():
             return Response(
                 {"detail": "기준 도서를 찾을 수 없습니다."},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # 2. 모든 다른 책과 유사도 계산
-        # QuerySet을 리스트로 변환하여 NumPy로 효율적으로 처리할 수 있도록 준비
-        all_books = list(Book.objects.exclude(pk=pk).all()) 
-        
-        similarities = []
-        for target_book in all_books:
-            target_vector = target_book.embedding_vector
-            
-            # 임베딩 벡터가 있는 경우에만 유사도 계산
-            if target_vector:
-                similarity = calculate_cosine_similarity(source_vector, target_vector)
-                
-                similarities.append({
-                    'book': target_book,
-                    'similarity': similarity
-                })
-
-        # 3. 유사도 점수 기준으로 정렬 및 상위 10개 선택
-        # 코사인 유사도 점수가 높은 순서(내림차순)로 정렬
-        similarities.sort(key=lambda x: x['similarity'], reverse=True)
-        recommended_items = similarities[:10]
-        
-        recommended_books = [item['book'] for item in recommended_items]
+        # 메모리 인덱스에서 기준 도서 벡터를 가져옵니다. (DB에서 벡터를 다시 읽지 않음)
+        source_vector = embedding_index.get_vector(pk)
+
+        # 임베딩 벡터가 없는 경우 에러 처리
+        if source_vector is None:
+            return Response(
+                {"detail": "기준 도서의 임베딩 벡터가 없습니다. 임베딩 생성을 먼저 완료해야 합니다."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        # 2. 행렬-벡터 곱 한 번으로 전체 도서와의 유사도 계산 후 (필터를 통과한) 상위 10개 선택
+        exclude_ids = [pk]
+        if exclude_library:
+            exclude_ids.extend(Library.objects.filter(user=request.user).values_list('book_id', flat=True))
+        mask = embedding_index.filter_mask(**filters) if filters else None
+        results = embedding_index.search(source_vector, k=10, exclude_ids=exclude_ids, mask=mask)
+        recommended_ids = [book_id for book_id, _ in results]
+
+        # 3. 선택된 10권만 DB에서 조회하고 유사도 순서를 유지
+        books_map = Book.objects.select_related('category').in_bulk(recommended_ids)
+        recommended_books = [books_map[book_id] for book_id in recommended_ids if book_id in books_map]
  
         serializer = BookListSerializer(recommended_books, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
 
 
+class BatchRecommendedBooksView(APIView):
+    """
+    여러 기준 도서의 유사 도서 목록을 한 번에 반환합니다. (화면의 책마다 따로 호출하지 않도록)
+    URL: POST /api/books/recommendations/batch/
+    요청: {"book_ids": [1, 2, 3], "k": 10}
+    응답: {"results": {"1": [유사 도서 id, ...], ...}, "books": {"<id>": 도서 정보, ...}}
+    - 여러 목록에 겹쳐 나온 도서는 "books"에 한 번만 직렬화됩니다.
+    - 기준 도서가 없거나 임베딩이 없으면 해당 목록은 빈 리스트입니다.
+    """
+    def post(self, request, format=None):
+        book_ids = request.data.get('book_ids')
+        k = request.data.get('k', 10)
+
+        if not isinstance(book_ids, list):
+            return Response({"detail": "book_ids는 정수 id 리스트여야 합니다."}, status=status.HTTP_400_BAD_REQUEST)
+        # bool은 int의 하위 타입이라 isinstance로는 걸러지지 않으므로 타입을 정확히 비교합니다.
+        invalid_ids = [book_id for book_id in book_ids if type(book_id) is not int or book_id < 1]
+        if invalid_ids:
+            return Response(
+                {"detail": "book_ids는 양의 정수 id 리스트여야 합니다.", "invalid_ids": invalid_ids},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(book_ids) > settings.BATCH_RECOMMENDATION_MAX_SOURCES:
+            return Response(
+                {"detail": f"한 번에 최대 {settings.BATCH_RECOMMENDATION_MAX_SOURCES}권까지 요청할 수 있습니다."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if type(k) is not int or not 1 <= k <= settings.SIMILAR_BOOKS_TOP_N:
+            return Response(
+                {"detail": f"k는 1 이상 {settings.SIMILAR_BOOKS_TOP_N} 이하의 정수여야 합니다."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        source_ids = list(dict.fromkeys(book_ids))
+        results = {source_id: [] for source_id in source_ids}
+
+        # 1. 미리 계산된 유사 도서 목록이 있는 기준 도서는 쿼리 한 번으로 가져옵니다.
+        precomputed = (
+            SimilarBook.objects.filter(source_id__in=source_ids, rank__lte=k)
+            .order_by('source_id', 'rank')
+            .values_list('source_id', 'target_id')
+        )
+        for source_id, target_id in precomputed:
+            results[source_id].append(target_id)
+
+        # 2. 나머지는 기준 도서들을 묶어 행렬-행렬 곱으로 한 번에 채점합니다.
+        remaining = [source_id for source_id in source_ids if not results[source_id]]
+        if remaining:
+            for source_id, neighbours in embedding_index.search_many(remaining, k=k).items():
+                results[source_id] = [book_id for book_id, _ in neighbours]
+
+        # 3. 모든 목록에 나온 도서를 중복 없이 한 번만 조회/직렬화합니다.
+        target_ids = list(dict.fromkeys(book_id for targets in results.values() for book_id in targets))
+        books_map = Book.objects.select_related('category').in_bulk(target_ids)
+        books = BookListSerializer([books_map[book_id] for book_id in target_ids if book_id in books_map], many=True).data
+
+        return Response({
+            "results": {
+                str(source_id): [book_id for book_id in targets if book_id in books_map]
+                for source_id, targets in results.items()
+            },
+            "books": {str(book['id']): book for book in books},
+        }, status=status.HTTP_200_OK)
+
+
 class BestsellerListView(APIView):
     """
     LLM이 선정한 베스트셀러 20권 목록을 반환합니다.
     URL: GET /api/books/bestsellers/
     """
-    def get(self, request, format=None):
+    @staticmethod
+    def select_bestsellers():
+        """
+        랜덤 200권 중 LLM이 고른 책에 베스트셀러 표시를 하고 그 ID 목록을 반환합니다. (실패 시 None)
+        """
+        # 랜덤 200권 뽑기
+        # 카탈로그가 바뀌지 않는 한 같은 200권이 뽑히도록 시드를 고정합니다. (같은 프롬프트 → LLM 캐시 적중)
+        all_ids = list(Book.objects.order_by('id').values_list('id', flat=True))
+        rng = random.Random(f"{len(all_ids)}:{all_ids[-1] if all_ids else 0}")
+        sample_ids = rng.sample(all_ids, min(200, len(all_ids)))
+        sample_books = Book.objects.filter(id__in=sample_ids).order_by('id')
+        
+        # GPT에게 보낼 텍스트 생성 ('|' 구분 표, 토큰 예산 안에서)
+        books_data, listed = compact_table(
+            ('id', '제목', '저자'),
+            ((b.id, short_title(b.title), clean(b.author, 30)) for b in sample_books),
+            budget=budget_for('bestseller'),
+        )
+        
+        # 선정 이유는 쓰지 않으므로 ID만 받아 응답 토큰(=응답 시간)을 줄입니다.
+        prompt = f"""
+        당신은 도서 추천 전문가입니다. 아래 {listed}권의 리스트 중 베스트셀러가 될 만한 20권을 선정하세요.
+        반드시 아래 JSON 형식으로 응답하세요.
+        {{ "recommendations": [ {{"book_id": ID값}}, ... ] }}
+        
+        리스트 (열: id|제목|저자):
+        {books_data}
+        """
+        
+        # GMS_KEY를 사용하여 GPT 호출
+        llm_response = get_llm_recommendation(prompt, call_site='bestseller')
+        if not llm_response:
+            return None
+
+        try:
+            res_data = json.loads(llm_response)
+            best_ids = list(set([item['book_id'] for item in res_data.get('recommendations', [])]))
+        except Exception as e:
+            print(f"JSON 파싱 에러: {e}")
+            return None
+
+        # DB에 저장해서 다음부터 GPT 안 써도 되도록
+        Book.objects.filter(id__in=best_ids).update(is_bestseller=True)
+        embedding_index.invalidate_metadata()
+        return best_ids
+
+    @classmethod
+    def current_bestsellers(cls, limit=20):
+        """
+        현재 베스트셀러를 평점 순으로 최대 limit권 반환합니다. (개인화 추천의 대체 목록도 이 함수를 씁니다)
+        """
+        # 평점이 같으면 ID로 정렬해 요청마다 같은 순서가 나오도록 합니다.
+        ordering = ('-customer_review_rank', '-id')
         # is_bestseller 필드가 True인 책만 필터링
         # 1. DB 확인
-        bestsellers = Book.objects.filter(is_bestseller=True)[:20]
+        bestsellers = Book.objects.filter(is_bestseller=True).select_related('category').order_by(*ordering)
+        if bestsellers.exists():
+            return bestsellers[:limit]
 
         # 2. 비어있다면?
-        if not bestsellers.exists():
-            # 랜덤 200권 뽑기
-            sample_books = Book.objects.all().order_by('?')[:200]
-            
-            # GPT에게 보낼 텍스트 생성
-            books_data = "\n".join([f"ID:{b.id}, 제목:{b.title}, 저자:{b.author}" for b in sample_books])
-            
-            prompt = f"""
-            당신은 도서 추천 전문가입니다. 아래 200권의 리스트 중 베스트셀러가 될 만한 20권을 선정하세요.
-            반드시 아래 JSON 형식으로 응답하세요.
-            {{ "recommendations": [ {{"book_id": ID값, "reason": "이유"}}, ... ] }}
-            
-            리스트:
-            {books_data}
-            """
-            
-            # GMS_KEY를 사용하여 GPT 호출
-            llm_response = get_llm_recommendation(prompt)
-            
-            if llm_response:
-                try:
-                    res_data = json.loads(llm_response)
-                    best_ids = list(set([item['book_id'] for item in res_data.get('recommendations', [])]))
-                    
-                    # DB에 저장해서 다음부터 GPT 안 써도 되도록
-                    Book.objects.filter(id__in=best_ids).update(is_bestseller=True)
+        # 동시에 들어온 요청들이 각자 LLM을 호출하지 않도록 한 요청만 선정하고,
+        # 나머지는 그 결과를 기다리거나 이전에 선정된 목록을 받습니다.
+        best_ids = singleflight.run('bestsellers', cls.select_bestsellers)
+        if not best_ids:
+            # LLM 호출이 실패했거나 GMS 장애 중이면 마지막으로 선정된 목록(스냅샷)을 보여줍니다.
+            best_ids = singleflight.snapshot('bestsellers')
+            resilience.record_fallback('bestseller:snapshot' if best_ids else 'bestseller:rating')
+        if best_ids:
+            return Book.objects.filter(id__in=best_ids).select_related('category').order_by(*ordering)[:limit]
+        return Book.objects.select_related('category').order_by(*ordering)[:limit]
 
-                    bestsellers = Book.objects.filter(is_bestseller=True).order_by('-id')[:20]
-                except Exception as e:
-                    print(f"JSON 파싱 에러: {e}")
+    def get(self, request, format=None):
+        bestsellers = self.current_bestsellers()
 
         serializer = BookListSerializer(bestsellers, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -142,109 +302,184 @@ User = get_user_model()
 
 
 class RecommendationView(APIView):
+    """
+    메인 화면 추천 2권을 반환합니다.
+    URL: GET /api/books/main-recommendations/
+    (미리 계산된 추천이 있으면 그대로 반환하고, 없을 때만 LLM으로 생성해 저장합니다.)
+    (비동기 버전: books/async_views.py 의 async_main_recommendations 가 같은 헬퍼를 사용합니다.)
+    """
     authentication_classes = [TokenAuthentication]
     permission_classes = [permissions.AllowAny]
 
-    def get(self, request, format=None):
+    @staticmethod
+    def build_prompt(user):
+        """
+        LLM에 보낼 후보 목록 프롬프트를 만듭니다.
+        후보는 좋아하는 도서와 서재(취향 벡터)를 기준으로 임베딩 검색한 책이며,
+        검색 기준이 없는 신규 사용자만 선호 카테고리에서 무작위로 고릅니다.
+        """
+        candidate_count = settings.RECOMMENDATION_CANDIDATE_COUNT
+        candidate_books = retrieve_candidates(user, k=candidate_count)
+
+        if candidate_books is None:
+            # ORDER BY RANDOM() 전체 정렬 대신 ID만 읽어 표본을 뽑습니다.
+            candidate_ids = list(Book.objects.filter(category__name=user.selected_category).values_list('id', flat=True))
+            if len(candidate_ids) < 5:
+                print(f"DEBUG: {user.selected_category} 카테고리에 책이 부족하여 전체 도서에서 추출합니다.")
+                candidate_ids = list(Book.objects.values_list('id', flat=True))
+            sample_ids = random.sample(candidate_ids, min(candidate_count, len(candidate_ids)))
+            books_map = Book.objects.select_related('category').in_bulk(sample_ids)
+            candidate_books = [books_map[book_id] for book_id in sample_ids if book_id in books_map]
+
+        books_list_str, _ = compact_table(
+            ('id', '제목', '저자', '카테고리'),
+            (
+                (b.id, short_title(b.title), clean(b.author, 30), b.category.name if b.category else '미지정')
+                for b in candidate_books
+            ),
+            budget=budget_for('recommendation'),
+        )
 
-        if request.user.is_authenticated:
-            user = request.user
+        user_info = {
+            "name": user.name,
+            "preferred_category": user.selected_category,
+            "favorite_book": user.favorite_book or "특정 책 없음"
+        }
+
+        return f"""
+            당신은 도서 추천 전문가입니다. 아래 [후보 목록] 중에서 사용자의 취향에 가장 잘 맞는 책 2권을 선정하세요.
+
+            [사용자 프로필]
+            - 성함: {user_info['name']}
+            - 선호 장르: {user_info['preferred_category']}
+            - 최근 관심 책: {user_info['favorite_book']}
+
+            [후보 목록] (열: id|제목|저자|카테고리)
+            {books_list_str}
+
+            [규칙]
+            1. 반드시 위 [후보 목록]에 있는 ID만 사용하세요. 없는 ID를 지어내지 마세요.
+            2. 선호 장르인 '{user_info['preferred_category']}'를 최우선으로 고려하세요.
+            3. 친절하고 개인화된 추천사(reason)를 작성하세요.
+            4. 반드시 JSON 형식으로 응답하세요:
+            {{ "recommendations": [ {{"book_id": ID, "reason": "추천사"}}, ... ] }}
+        """
+
+    @staticmethod
+    def build_llm_result(llm_response_json):
+        """LLM 응답을 (응답 데이터, 상태 코드)로 변환합니다."""
+        if not llm_response_json:
+            return {"detail": "맞춤 추천 생성에 실패했습니다."}, status.HTTP_500_INTERNAL_SERVER_ERROR
+
+        try:
+            response_data = json.loads(llm_response_json)
+            recommendations = response_data.get('recommendations', [])
             
-            candidate_books = Book.objects.filter(category__name=user.selected_category).order_by('?')[:20]
+            book_ids = [item['book_id'] for item in recommendations if 'book_id' in item]
             
-            if not candidate_books.exists() or candidate_books.count() < 5:
-                print(f"DEBUG: {user.selected_category} 카테고리에 책이 부족하여 전체 도서에서 추출합니다.")
-                candidate_books = Book.objects.all().order_by('?')[:20]
-
-            books_list_str = "\n".join([
-                f"ID:{b.id}, 제목:{b.title}, 저자:{b.author}, 카테고리:{b.category.name if b.category else '미지정'}" 
-                for b in candidate_books
-            ])
-
-            user_info = {
-                "name": user.name,
-                "preferred_category": user.selected_category,
-                "favorite_book": user.favorite_book or "특정 책 없음"
-            }
-
-            prompt = f"""
-                당신은 도서 추천 전문가입니다. 아래 [후보 목록] 중에서 사용자의 취향에 가장 잘 맞는 책 2권을 선정하세요.
-
-                [사용자 프로필]
-                - 성함: {user_info['name']}
-                - 선호 장르: {user_info['preferred_category']}
-                - 최근 관심 책: {user_info['favorite_book']}
-
-                [후보 목록]
-                {books_list_str}
-
-                [규칙]
-                1. 반드시 위 [후보 목록]에 있는 ID만 사용하세요. 없는 ID를 지어내지 마세요.
-                2. 선호 장르인 '{user_info['preferred_category']}'를 최우선으로 고려하세요.
-                3. 친절하고 개인화된 추천사(reason)를 작성하세요.
-                4. 반드시 JSON 형식으로 응답하세요:
-                {{ "recommendations": [ {{"book_id": ID, "reason": "추천사"}}, ... ] }}
-            """
-
-            llm_response_json = get_llm_recommendation(prompt)
+            # N+1 문제 방지를 위해 `in_bulk` 사용
+            books_map = Book.objects.in_bulk(book_ids)
             
-            if not llm_response_json:
-                return Response({"detail": "맞춤 추천 생성에 실패했습니다."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-            try:
-                response_data = json.loads(llm_response_json)
-                recommendations = response_data.get('recommendations', [])
-                
-                book_ids = [item['book_id'] for item in recommendations if 'book_id' in item]
+            final_recommendations = []
+            for item in recommendations:
+                book = books_map.get(item.get('book_id'))
+                if book:
+                    book_data = BookListSerializer(book).data
+                    final_recommendations.append({
+                        "book": book_data,
+                        "reason": item.get('reason', "추천 이유가 없습니다.")
+                    })
+
+            while len(final_recommendations) < 2:
+                bestsellers = list(Book.objects.filter(is_bestseller=True))
+                if not bestsellers: break 
                 
-                # N+1 문제 방지를 위해 `in_bulk` 사용
-                books_map = Book.objects.in_bulk(book_ids)
-                
-                final_recommendations = []
-                for item in recommendations:
-                    book = books_map.get(item.get('book_id'))
-                    if book:
-                        book_data = BookListSerializer(book).data
-                        final_recommendations.append({
-                            "book": book_data,
-                            "reason": item.get('reason', "추천 이유가 없습니다.")
-                        })
-
-                while len(final_recommendations) < 2:
-                    bestsellers = list(Book.objects.filter(is_bestseller=True))
-                    if not bestsellers: break 
-                    
-                    random_book = random.choice(bestsellers)
-                    if not any(rec['book']['id'] == random_book.id for rec in final_recommendations):
-                         final_recommendations.append({
-                            "book": BookListSerializer(random_book).data,
-                            "reason": "이런 책은 어떠세요? 지금 많은 사람들이 읽고 있는 베스트셀러입니다."
-                        })
-
-                return Response(final_recommendations[:2], status=status.HTTP_200_OK)
-
-            except (json.JSONDecodeError, ValueError):
-                return Response({"detail": "LLM 응답 처리 중 오류가 발생했습니다."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
+                random_book = random.choice(bestsellers)
+                if not any(rec['book']['id'] == random_book.id for rec in final_recommendations):
+                     final_recommendations.append({
+                        "book": BookListSerializer(random_book).data,
+                        "reason": "이런 책은 어떠세요? 지금 많은 사람들이 읽고 있는 베스트셀러입니다."
+                    })
+
+            return final_recommendations[:2], status.HTTP_200_OK
+
+        except (json.JSONDecodeError, ValueError):
+            return {"detail": "LLM 응답 처리 중 오류가 발생했습니다."}, status.HTTP_500_INTERNAL_SERVER_ERROR
+
+    @staticmethod
+    def build_fallback_result(user):
+        """
+        GMS 장애 등으로 LLM 추천을 만들 수 없을 때의 대체 추천을 (응답 데이터, 상태 코드)로 반환합니다.
+        취향 벡터 → 좋아하는 도서 임베딩 검색 → 베스트셀러 순으로 시도하며, GMS를 기다리지 않습니다.
+        """
+        fast = build_fast_recommendations(user, k=2)
+        if fast:
+            resilience.record_fallback('recommendation:taste')
+            return fast, status.HTTP_200_OK
+
+        # 장애 중이므로 좋아하는 도서 임베딩은 저장된 벡터/캐시에서만 찾습니다.
+        candidates = retrieve_candidates(user, k=2, allow_network=False)
+        if candidates:
+            resilience.record_fallback('recommendation:vector')
+            reason = f"{user.name}님이 좋아하시는 '{user.favorite_book}'와(과) 비슷한 책입니다." if user.favorite_book \
+                else f"{user.name}님의 독서 취향과 비슷한 책입니다."
+            return [{"book": BookListSerializer(book).data, "reason": reason} for book in candidates[:2]], status.HTTP_200_OK
+
+        resilience.record_fallback('recommendation:bestseller')
+        return RecommendationView.build_anonymous_result()
+
+    @staticmethod
+    def build_anonymous_result():
+        """로그아웃 사용자용 베스트셀러 2권을 (응답 데이터, 상태 코드)로 반환합니다."""
+        bestsellers = list(Book.objects.filter(is_bestseller=True))
+        
+        if len(bestsellers) >= 2:
+            random_books = random.sample(bestsellers, 2)
         else:
-            # --- 로그아웃 사용자 로직 ---
-            bestsellers = list(Book.objects.filter(is_bestseller=True))
-            
-            if len(bestsellers) >= 2:
-                random_books = random.sample(bestsellers, 2)
-            else:
-                random_books = bestsellers
+            random_books = bestsellers
 
-            serializer = BookListSerializer(random_books, many=True)
+        serializer = BookListSerializer(random_books, many=True)
 
-            final_data = []
-            for book_data in serializer.data:
-                final_data.append({
-                    "book": book_data,
-                    "reason": "지금 많은 사람들이 읽고 있는 베스트셀러입니다."
-                })
-                
-            return Response(final_data, status=status.HTTP_200_OK)
+        final_data = []
+        for book_data in serializer.data:
+            final_data.append({
+                "book": book_data,
+                "reason": "지금 많은 사람들이 읽고 있는 베스트셀러입니다."
+            })
+        return final_data, status.HTTP_200_OK
+
+    def get(self, request, format=None):
+
+        if request.user.is_authenticated:
+            user = request.user
+
+            # ?mode=fast: LLM 호출 없이 취향 벡터로 바로 추천 (?reason=llm 이면 추천 이유만 LLM이 작성)
+            if request.query_params.get('mode') == 'fast':
+                fast = build_fast_recommendations(
+                    user, k=2, with_llm_reason=request.query_params.get('reason') == 'llm'
+                )
+                if fast:
+                    return Response(fast, status=status.HTTP_200_OK)
+
+            # 워커(process_recommendation_jobs)가 미리 계산해 둔 추천이 있으면 바로 반환합니다.
+            precomputed = recommendation_queue.get_precomputed(user)
+            if precomputed:
+                return Response(precomputed, status=status.HTTP_200_OK)
+
+            prompt = self.build_prompt(user)
+            llm_response_json = get_llm_recommendation(prompt, call_site='recommendation')
+            data, status_code = self.build_llm_result(llm_response_json)
+            if status_code == status.HTTP_200_OK:
+                recommendation_queue.save_result(user, data)
+            else:
+                # 대체 추천은 저장하지 않으므로 GMS가 복구되면 워커/다음 요청이 LLM 추천을 다시 만듭니다.
+                data, status_code = self.build_fallback_result(user)
+            return Response(data, status=status_code)
+
+        else:
+            # --- 로그아웃 사용자 로직 ---
+            data, status_code = self.build_anonymous_result()
+            return Response(data, status=status_code)
 
 class CommentCreateView(generics.CreateAPIView):
     """
@@ -272,6 +507,13 @@ class CommentCreateView(generics.CreateAPIView):
         )
         print(f"등록 결과: {'새로 생성됨' if created else '이미 존재함'}")
 
+        # 4. 취향 벡터에 이 책을 (평점 가중치로) 더합니다.
+        weight = comment_weight(serializer.instance.rating)
+        if created:
+            weight += settings.TASTE_LIBRARY_WEIGHT
+        apply_taste_delta(self.request.user, {book.id: weight})
+        recommendation_queue.enqueue(self.request.user.id, 'comment')
+
 
 class CommentUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     """
@@ -306,14 +548,20 @@ class CommentUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     
     def perform_update(self, serializer):
         # 수정 시에도 작성자가 바뀌지 않도록 보장하며 저장
-        serializer.save(user=self.request.user)
+        old_weight = comment_weight(serializer.instance.rating)
+        comment = serializer.save(user=self.request.user)
         print(f"--- 댓글 수정 완료 (유저: {self.request.user}) ---")
 
+        # 평점이 바뀌었다면 취향 벡터의 가중치만 조정합니다.
+        apply_taste_delta(self.request.user, {comment.book_id: comment_weight(comment.rating) - old_weight})
+        recommendation_queue.enqueue(self.request.user.id, 'comment')
+
     def perform_destroy(self, instance):
         user = self.request.user
         book = instance.book
         
         # 1. 댓글 삭제
+        weight = -comment_weight(instance.rating)
         instance.delete()
         print(f"--- 댓글 삭제 완료 (유저: {user}, 도서: {book.title}) ---")
 
@@ -322,12 +570,45 @@ class CommentUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
 
         # 3. 더 이상 남은 댓글이 없다면 서재에서도 삭제
         if not remaining_comments:
-            Library.objects.filter(user=user, book=book).delete()
+            deleted, _ = Library.objects.filter(user=user, book=book).delete()
+            if deleted:
+                weight -= settings.TASTE_LIBRARY_WEIGHT
             print(f"--- 서재에서도 삭제 완료: {book.title} ---")
         else:
             print(f"--- 아직 다른 댓글이 남아있어 서재에 유지합니다 ---")
+
+        # 4. 취향 벡터에서 이 책의 가중치를 뺍니다.
+        apply_taste_delta(user, {book.id: weight})
+        recommendation_queue.enqueue(user.id, 'comment')
     
 
+def speech_response(text, voice):
+    """
+    text를 voice로 읽은 mp3 응답. 디스크 캐시에 있으면 파일을 그대로 보내고,
+    없으면 GMS TTS를 스트리밍으로 요청해 받는 대로 클라이언트에 흘려보내면서 캐시 파일에도 씁니다.
+    (음성 길이와 관계없이 요청당 메모리는 조각 하나 크기로 일정하고, 첫 바이트가 GMS 응답 완료를 기다리지 않습니다.)
+    """
+    cache_key = tts_cache.make_key(text, voice)
+    cached = tts_cache.cached_response(cache_key)
+    if cached is not None:
+        return cached
+
+    upstream = open_text_to_speech(text, voice)
+    if upstream.status_code != 200:
+        # GMS 서버에서 에러가 온 경우
+        print(f"GMS ERROR: {upstream.status_code} - {upstream.text}")
+        return Response(upstream.json(), status=upstream.status_code)
+
+    chunks = iter_audio(upstream)
+    if settings.TTS_STREAM_WRITE_CACHE:
+        chunks = tts_cache.tee(cache_key, chunks)
+    response = StreamingHttpResponse(chunks, content_type="audio/mpeg")
+    if 'content-length' in upstream.headers:
+        response['Content-Length'] = upstream.headers['content-length']
+    tts_cache.set_headers(response, cache_key, 'miss')
+    return response
+
+
 class TextToSpeechView(APIView):
     """
     텍스트와 선택된 목소리를 받아 OpenAI TTS API로 음성을 생성합니다.
@@ -339,45 +620,21 @@ class TextToSpeechView(APIView):
         voice_id = request.data.get('voice', 'voice1')
         
         # 프론트엔드 voice ID를 OpenAI 실제 목소리 이름으로 매핑
-        voice_map = {
-            'voice1': 'alloy',
-            'voice2': 'echo',
-            'voice3': 'shimmer',
-            'voice4': 'onyx'
-        }
-        selected_voice = voice_map.get(voice_id, 'alloy')
+        selected_voice = VOICE_MAP.get(voice_id, 'alloy')
 
         if not text:
             return Response({"detail": "텍스트가 없습니다."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
             print(f"DEBUG: GMS_KEY is {settings.GMS_KEY[:5]}...")
-            # settings에 정의된 GMS_KEY 사용
-            gms_url = "https://gms.ssafy.io/gmsapi/api.openai.com/v1/audio/speech"
-            
-            headers = {
-                "Authorization": f"Bearer {settings.GMS_KEY}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": "gpt-4o-mini-tts",
-                "input": text,
-                "voice": selected_voice,
-                "response_format": "mp3"
-            }
-
-            # 라이브러리 대신 직접 POST 요청
-            response = requests.post(gms_url, headers=headers, json=payload)
-
-            if response.status_code == 200:
-                # 성공 시 오디오 파일 반환
-                return HttpResponse(response.content, content_type="audio/mpeg")
-            else:
-                # GMS 서버에서 에러가 온 경우
-                print(f"GMS ERROR: {response.status_code} - {response.text}")
-                return Response(response.json(), status=response.status_code)
-            
+            # 같은 문장/목소리로 만든 음성이 디스크 캐시에 있으면 GMS를 호출하지 않고 바로 보내고,
+            # 없으면 공유 연결 풀로 스트리밍 요청해 받는 대로 반환합니다. (settings에 정의된 GMS_KEY 사용)
+            return speech_response(text, selected_voice)
+
+        except GMSUnavailable as e:
+            print(f"GMS UNAVAILABLE: {str(e)}")
+            return Response({"detail": "음성 서비스가 일시적으로 원활하지 않습니다. 잠시 후 다시 시도해 주세요."},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except Exception as e:
             print(f"SERVER ERROR: {str(e)}")
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -390,88 +647,105 @@ class SpeechToTextView(APIView):
     """
     permission_classes = [permissions.AllowAny]
 
+    def initialize_request(self, request, *args, **kwargs):
+        # 업로드를 메모리에 올리지 않고 임시 파일로 받으며, 크기 상한을 넘으면 더 받지 않습니다. (인증보다 먼저 설정)
+        stt.install_upload_handler(request)
+        return super().initialize_request(request, *args, **kwargs)
+
     def post(self, request, *args, **kwargs):
-        if 'audio' not in request.FILES:
+        audio_file = request.FILES.get('audio')  # 여기서 업로드를 받습니다. (크기 상한 확인은 그 다음)
+        if stt.upload_too_large(request):
+            return Response({"error": f"오디오 파일은 {settings.STT_UPLOAD_MAX_BYTES // (1024 * 1024)}MB까지 올릴 수 있습니다."},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if audio_file is None:
             return Response({"error": "오디오 파일이 필요합니다."}, status=status.HTTP_400_BAD_REQUEST)
 
-        audio_file = request.FILES['audio']
-
         try:
-            client = OpenAI(api_key=settings.GMS_KEY, base_url="https://gms.ssafy.io/gmsapi/api.openai.com/v1")
-            
-            transcription = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=(audio_file.name, audio_file.read(), audio_file.content_type),
-                response_format="json"
-            )
-            
-            transcribed_text = transcription.text
+            transcribed_text = stt.transcribe_upload(audio_file)
             
             return Response({"text": transcribed_text}, status=status.HTTP_200_OK)
 
+        except stt.AudioRejected as e:
+            return Response({"error": str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except GMSUnavailable as e:
+            print(f"STT UNAVAILABLE: {str(e)}")
+            return Response({"error": "음성 인식 서비스가 일시적으로 원활하지 않습니다. 잠시 후 다시 시도해 주세요."},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except Exception as e:
             print(f"STT ERROR: {str(e)}")
             return Response({"error": f"음성 변환 중 오류 발생: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
 
 class BookDocentView(APIView):
+    """
+    도서 소개 스크립트를 LLM으로 만들고 TTS 음성(mp3)으로 반환합니다.
+    URL: POST /api/books/<int:pk>/docent/
+    ?stream=1: 스크립트를 문장 단위로 TTS에 보내고 mp3를 받는 대로 스트리밍합니다. (첫 문장부터 재생 가능, WSGI 전용)
+    """
     permission_classes = [IsAuthenticated]
 
+    def stream(self, book, voice):
+        sentences = docent.prefetch(docent.split_sentences(docent.stream_script(book)))
+        # 첫 문장까지는 기다려서, 스크립트 생성이 실패하면 기존과 같은 오류 응답을 보냅니다.
+        first_sentence = next(sentences, None)
+        if not first_sentence:
+            return Response({"error": "요약 생성 실패"}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(
+            docent.speak(itertools.chain([first_sentence], sentences), voice), content_type="audio/mpeg"
+        )
+        response['Cache-Control'] = 'no-cache'
+        return response
+
     def post(self, request, pk):
         try:
             book = get_object_or_404(Book, pk=pk)
             voice_id = request.data.get('voice', 'alloy')
             
-            voice_map = {
-                'voice1': 'alloy',
-                'voice2': 'echo',
-                'voice3': 'shimmer',
-                'voice4': 'onyx'
-            }
-            selected_voice = voice_map.get(voice_id, voice_id)
-
-            prompt = f"""
-            당신은 '북북(BOOKBOOK)' 서비스의 전문 AI 도슨트입니다. 
-            아래 도서 정보를 바탕으로, 마치 갤러리에서 책을 소개하듯 다정하고 몰입감 있는 오디오 스크립트를 작성해 주세요.
-
-            [도서 정보]
-            - 제목: {book.title}
-            - 저자: {book.author}
-            - 내용: {book.description}
-
-            [작성 가이드라인]
-            1. 인사와 도입: "안녕하세요, 오늘 여러분께 소개해 드릴 책은..."으로 시작하여 책의 첫인상을 묘사해 주세요.
-            2. 핵심 요약: 책의 전체 내용을 요약하되, 딱딱한 나열이 아닌 이 책이 던지는 핵심 질문이나 감동 포인트를 중심으로 설명해 주세요. (3~4문장)
-            3. 마무리: "이 책의 마지막 페이지를 덮을 때쯤 여러분은 어떤 생각을 하게 될까요?"와 같이 독자의 호기심을 자극하며 마쳐주세요.
-            4. 어조: 반드시 '해요체'를 사용하여 부드럽고 따뜻하게 작성해 주세요. 전문 용어보다는 쉬운 단어를 사용하세요.
-            5. 주의사항: 오디오로 읽힐 글이므로 문장이 너무 길지 않아야 하며, 한글 위주로 작성해 주세요.
-
-            스크립트만 응답해 주세요.
-            """
-            summary_text = get_llm_recommendation(prompt)
+            selected_voice = VOICE_MAP.get(voice_id, voice_id)
+
+            # prepare_docents 명령으로 미리 만들어 둔 음성이 있으면 LLM/TTS 없이 바로 보냅니다.
+            prepared = docent.prepared_response(book, selected_voice)
+            if prepared is not None:
+                return prepared
+
+            # ASGI에서는 동기 이터레이터가 끝까지 모인 뒤 전송되므로, 스트리밍은 비동기 뷰(/async/<pk>/docent/)가 맡고
+            # 여기서는 문장별 TTS 대신 전체 스크립트를 한 번에 합성하는 일반 경로로 응답합니다.
+            if request.query_params.get('stream') == '1' and not isinstance(request._request, ASGIRequest):
+                return self.stream(book, selected_voice)
+
+            # 저장된 스크립트가 있으면 LLM 없이 음성만 합성하고, 없으면 여러 요청이 동시에 만들지 않도록 합니다.
+            summary_text = docent.get_or_create_script(book)
             
             if not summary_text:
                 return Response({"error": "요약 생성 실패"}, status=status.HTTP_400_BAD_REQUEST)
 
-            gms_url = "https://gms.ssafy.io/gmsapi/api.openai.com/v1/audio/speech"
-            headers = {
-                "Authorization": f"Bearer {settings.GMS_KEY}",
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "model": "gpt-4o-mini-tts",
-                "input": summary_text,
-                "voice": selected_voice,
-                "response_format": "mp3"
-            }
-
-            response = requests.post(gms_url, headers=headers, json=payload)
-            
-            if response.status_code == 200:
-                return HttpResponse(response.content, content_type="audio/mpeg")
-            else:
-                return Response(response.json(), status=response.status_code)
+            return speech_response(summary_text, selected_voice)
 
+        except GMSUnavailable as e:
+            print(f"DOCENT UNAVAILABLE: {str(e)}")
+            return Response({"error": "도슨트 서비스가 일시적으로 원활하지 않습니다. 잠시 후 다시 시도해 주세요."},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except Exception as e:
             print(f"DOCENT ERROR: {str(e)}")
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class MetricsView(APIView):
+    """
+    캐시 적중률, GMS 연결 재사용률, 서킷 브레이커 상태, STT 전송량 등 운영 지표를 반환합니다. (관리자 전용)
+    URL: GET /api/books/metrics/
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, format=None):
+        return Response({
+            "llm_cache": llm_cache.stats(),
+            "embedding_cache": embedding_cache.stats(),
+            "gms_http": http.stats(),
+            "singleflight": singleflight.stats(),
+            "recommendation_queue": recommendation_queue.stats(),
+            "llm_tokens": prompting.stats(),
+            "gms_resilience": resilience.stats(),
+            "tts_cache": tts_cache.stats(),
+            "stt": stt.stats(),
+        }, status=status.HTTP_200_OK)
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 14:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_customuser_bio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='taste_vector',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='taste_weight',
+            field=models.FloatField(default=0, editable=False, verbose_name='취향 벡터 가중치 합'),
+        ),
+    ]
@@ -92,6 +92,10 @@ class CustomUser(AbstractUser):
         verbose_name="선호 카테고리"
     )
 
+    # 취향 벡터: 서재/댓글 도서 임베딩의 (평점) 가중합을 float32 바이트로 저장 (books/taste.py에서 갱신)
+    taste_vector = models.BinaryField(null=True, blank=True, editable=False)
+    taste_weight = models.FloatField(default=0, editable=False, verbose_name="취향 벡터 가중치 합")
+
     # 기본 username 필드를 제거하고 email을 사용자 이름 필드로 지정
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['name', 'selected_voice', 'selected_category']  # superuser 생성 시 필수 필드
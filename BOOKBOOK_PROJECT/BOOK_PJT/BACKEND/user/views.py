@@ -14,8 +14,11 @@ from django.db.models import Avg, Count
 from .serializers import UserSignupSerializer, AuthTokenCustomSerializer, CustomUserSerializer, UserProfileUpdateSerializer
 
 from books.utils import get_llm_recommendation 
+from books.taste import build_fast_recommendations
+from books import recommendation_queue
 from books.models import Book, Library, Comment
 from books.serializers import BookListSerializer
+from books.views import BestsellerListView
 
 from .models import CustomUser
 import json
@@ -148,13 +151,31 @@ def delete_account(request):
 
 class PersonalizedRecommendationView(APIView):
     """
-    로그인한 사용자 정보를 기반으로 LLM에게 2권의 맞춤형 도서를 추천받습니다.
+    로그인한 사용자에게 2권의 맞춤형 도서를 추천합니다.
     URL: GET /api/v1/user/personalized-recommendation/
+
+    - 기본: 서재/댓글로 만든 취향 벡터와 전체 도서 임베딩을 비교해 LLM 호출 없이 바로 추천합니다.
+      (?reason=llm 이면 고른 책의 추천 이유만 LLM이 작성)
+    - ?mode=llm: 기존 방식 (LLM이 프로필만 보고 도서 ID를 추천)
     """
     permission_classes = [IsAuthenticated] 
 
     def get(self, request, format=None):
         user = request.user
+
+        if request.query_params.get('mode') != 'llm':
+            fast = build_fast_recommendations(
+                user, k=2, with_llm_reason=request.query_params.get('reason') == 'llm'
+            )
+            if fast:
+                return Response(fast, status=status.HTTP_200_OK)
+
+            # 아직 독서 기록이 없어 취향 벡터가 없다면 베스트셀러로 대신합니다.
+            bestsellers = BestsellerListView.current_bestsellers(limit=2)
+            return Response([
+                {"book": BookListSerializer(book).data, "reason": "아직 독서 기록이 없어, 지금 많은 사람들이 읽고 있는 베스트셀러를 추천합니다."}
+                for book in bestsellers
+            ], status=status.HTTP_200_OK)
         
         # 1. LLM에 전달할 사용자 데이터와 전체 책 목록 구성
         # A. 사용자 프로필 (CustomUser 모델 필드 활용)
@@ -187,7 +208,7 @@ class PersonalizedRecommendationView(APIView):
         """
         
         # 3. LLM API 호출
-        llm_response_json = get_llm_recommendation(prompt)
+        llm_response_json = get_llm_recommendation(prompt, call_site='personalized')
         
         if not llm_response_json:
             logger.error(f"LLM API 호출 실패: 사용자 ID {user.id}")
@@ -243,6 +264,15 @@ class UserProfileUpdateView(generics.RetrieveUpdateAPIView):
         # partial=True 설정으로 부분 업데이트 허용 (예: name만 보낼 수 있음)
         kwargs['partial'] = True 
         return super().update(request, *args, **kwargs)
+
+    def perform_update(self, serializer):
+        user = serializer.instance
+        before = (user.selected_category, user.favorite_book)
+        serializer.save()
+
+        # 추천에 쓰이는 프로필이 바뀌면 미리 계산된 메인 화면 추천을 지우고 다시 계산하도록 합니다.
+        if (user.selected_category, user.favorite_book) != before:
+            recommendation_queue.invalidate(user.id, 'profile')
     
 
 